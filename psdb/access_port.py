@@ -1,5 +1,6 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
 from .component import Component
+from .mem_cache import MemCache
 
 import struct
 
@@ -17,6 +18,9 @@ class AP:
     def read_idr(self):
         return self.db.read_ap_reg(self.ap_num, 0xFC)
 
+    def inval_cache(self):
+        pass
+
 
 class MemAP(AP):
     FLAG_SIZE_8  = (1<<0)
@@ -50,36 +54,143 @@ class MemAP(AP):
         self.csw            = -1
         self.tar            = self._read_tar()
         self.base_component = None
+        self.cache          = None
 
     def __repr__(self):
         features = [MemAP.FLAGS_TABLE[f]
                     for f in MemAP.FLAGS_TABLE if self.flags & f]
         return '%s AP %u [%s]' % (self.typ, self.ap_num, ' '.join(features))
 
+    def enable_cache(self, regions):
+        '''
+        Enables a MemCache for the list of (base, end) address ranges, which
+        should only include memory that doesn't change while the CPUs are
+        halted.
+        '''
+        self.cache = MemCache(self, regions)
+
+    def disable_cache(self):
+        self.cache = None
+
+    def inval_cache(self):
+        if self.cache:
+            self.cache.invalidate()
+
+    def _cached(self, addr, size):
+        return self.cache is not None and self.cache.covers(addr, size)
+
+    def _read_cached(self, addr, size):
+        '''
+        Returns the contents of the specified range if they can be served
+        from either the probe's immutable-region cache or this AP's memory
+        cache, or None if the range has to be read from the target.
+        '''
+        data = self.db.immutable.read(self.ap_num, addr, size)
+        if data is None and self._cached(addr, size):
+            data = self.cache.read(addr, size)
+        return data
+
+    def _inval_caches(self, addr=None, size=None):
+        self.db.inval_mem_caches()
+        self.db.immutable.invalidate(addr, size)
+
     def read_32(self, addr):
+        data = self._read_cached(addr, 4)
+        if data is not None:
+            return struct.unpack('<I', data)[0]
         return self.db.read_32(addr, self.ap_num)
 
     def read_16(self, addr):
+        data = self._read_cached(addr, 2)
+        if data is not None:
+            return struct.unpack('<H', data)[0]
         return self.db.read_16(addr, self.ap_num)
 
     def read_8(self, addr):
+        data = self._read_cached(addr, 1)
+        if data is not None:
+            return struct.unpack('<B', data)[0]
         return self.db.read_8(addr, self.ap_num)
 
     def read_bulk(self, addr, size):
+        data = self._read_cached(addr, size)
+        if data is not None:
+            return data
         return self.db.read_bulk(addr, size, self.ap_num)
 
+    def read_bulk_into(self, buf, addr):
+        mv   = memoryview(buf).cast('B')
+        data = self._read_cached(addr, len(mv))
+        if data is not None:
+            mv[:] = data
+        else:
+            self.db.read_bulk_into(mv, addr, self.ap_num)
+
+    def read_multi(self, ops):
+        '''
+        Performs a list of (addr, width) reads on this AP in as few probe
+        transactions as possible and returns the list of values read.  Reads
+        that can be served by the caches don't go to the probe at all.
+        '''
+        if self.cache is None and not self.db.immutable.regions:
+            return self.db.read_multi([(self.ap_num, addr, width)
+                                       for addr, width in ops])
+
+        results  = [None]*len(ops)
+        uncached = []
+        for i, (addr, width) in enumerate(ops):
+            data = self._read_cached(addr, width // 8)
+            if data is not None:
+                results[i] = int.from_bytes(data, 'little')
+            else:
+                uncached.append(i)
+        values = self.db.read_multi([(self.ap_num, ops[i][0], ops[i][1])
+                                     for i in uncached])
+        for i, v in zip(uncached, values):
+            results[i] = v
+        return results
+
     def write_32(self, v, addr):
+        self._inval_caches(addr, 4)
         self.db.write_32(v, addr, self.ap_num)
 
     def write_16(self, v, addr):
+        self._inval_caches(addr, 2)
         self.db.write_16(v, addr, self.ap_num)
 
     def write_8(self, v, addr):
+        self._inval_caches(addr, 1)
         self.db.write_8(v, addr, self.ap_num)
 
     def write_bulk(self, data, addr):
+        self._inval_caches(addr, len(data))
         self.db.write_bulk(data, addr, self.ap_num)
 
+    def write_multi(self, ops):
+        '''
+        Performs a list of (addr, width, value) writes on this AP in as few
+        probe transactions as possible.
+        '''
+        self.db.inval_mem_caches()
+        for addr, width, _ in ops:
+            self.db.immutable.invalidate(addr, width // 8)
+        self.db.write_multi([(self.ap_num, addr, width, v)
+                             for addr, width, v in ops])
+
+    def exec_multi(self, ops):
+        '''
+        Performs a list of (addr, width) read and (addr, width, value) write
+        operations on this AP, in order, in as few probe transactions as
+        possible and returns the list of values read.  The caches are bypassed
+        since reads may depend on the preceding writes.
+        '''
+        if any(len(op) == 3 for op in ops):
+            self.db.inval_mem_caches()
+            for op in ops:
+                if len(op) == 3:
+                    self.db.immutable.invalidate(op[0], op[1] // 8)
+        return self.db.exec_multi([(self.ap_num,) + tuple(op) for op in ops])
+
     def probe_components(self, verbose=False, match=True, recurse=True):
         c = Component.probe(self, self._read_base(), match=match)
         if c:
@@ -146,9 +257,11 @@ class MemAP(AP):
         self.tar = val
 
     def _write_drw(self, val):
+        self._inval_caches()
         self.db.write_ap_reg(self.ap_num, 0x0C, val)
 
     def _write_bd(self, val, index):
+        self._inval_caches()
         self.db.write_ap_reg(self.ap_num, 0x10 + 4*index, val)
 
     def _read_generic(self, addr, size):
@@ -373,12 +486,14 @@ class IDRMapper(object):
         self.args     = args
         self.flags    = flags
 
-    def probe(self, idr, db, ap_num):
+    def probe(self, idr, db, ap_num, flags=None):
         if (idr & self.mask) != self.idr:
             return None
 
         ap = self.factory(db, ap_num, idr, *self.args)
-        if self.flags & IDRMapper.PROBE_SIZES:
+        if flags is not None:
+            ap.flags = flags
+        elif self.flags & IDRMapper.PROBE_SIZES:
             ap._probe_sizes()
         return ap
 
@@ -391,6 +506,19 @@ IDR_MAPPERS = [
     ]
 
 
+def make_ap(db, ap_num, idr, flags=None):
+    '''
+    Instantiates the AP class matching an IDR value that has already been
+    read.  If flags is not None, it gives the MemAP.FLAG_SIZE_* flags from a
+    previous probe and the supported transfer sizes aren't probed again.
+    '''
+    for im in IDR_MAPPERS:
+        ap = im.probe(idr, db, ap_num, flags=flags)
+        if ap:
+            return ap
+    return None
+
+
 def probe_ap(db, ap_num, verbose=False):
     try:
         idr = db.read_ap_reg(ap_num, 0xFC)
@@ -399,16 +527,13 @@ def probe_ap(db, ap_num, verbose=False):
     except Exception:
         return None
 
-    for im in IDR_MAPPERS:
-        ap = im.probe(idr, db, ap_num)
-        if not ap:
-            continue
-
+    ap = make_ap(db, ap_num, idr)
+    if not ap:
         if verbose:
-            print('  Found %s with IDR 0x%08X (CSW 0x%08X, BASE 0x%08X)' % (
-                    ap, idr, ap._read_csw(), ap._read_base()))
-        return ap
+            print('  Unhandled IDR 0x%08X' % idr)
+        return None
 
     if verbose:
-        print('  Unhandled IDR 0x%08X' % idr)
-    return None
+        print('  Found %s with IDR 0x%08X (CSW 0x%08X, BASE 0x%08X)' % (
+                ap, idr, ap._read_csw(), ap._read_base()))
+    return ap
@@ -12,17 +12,14 @@ class BlockOutOfRangeException(Exception):
 class Block(object):
     def __init__(self, addr, data):
         self.addr = addr
-        self.data = data[:]
+        self.data = bytearray(data)
 
     def write(self, addr, data):
         assert self.addr <= addr
         assert addr + len(data) <= self.addr + len(self.data)
 
-        addr    -= self.addr
-        new_data = self.data[:addr] + data + self.data[addr + len(data):]
-        assert len(new_data) == len(self.data)
-
-        self.data = new_data
+        addr -= self.addr
+        self.data[addr:addr + len(data)] = data
 
 
 class BlockDevice(object):
@@ -1,34 +1,64 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
 from . import bd
 
+import bisect
+
 
 class RAMBD(bd.BlockDevice):
     '''
     Implements a sparse RAM block device.  Only blocks to which data has been
     written will be populated in the RAMBD.blocks dict which is addressed by
-    block number.
+    block number.  The populated block numbers are also kept in ascending
+    order in RAMBD.block_nums.
+
+    Block data is held in mutable bytearrays which are updated in place and
+    the source data is sliced through a memoryview, so loading an image costs
+    time linear in its size no matter how many small records it consists of.
     '''
     def __init__(self, block_size, first_block=0, nblocks=0x10000000000000000):
         super(RAMBD, self).__init__(block_size, b'\xff')
         self.blocks      = {}
+        self.block_nums  = []
         self.first_block = first_block
         self.end_block   = first_block + nblocks
 
+    def _get_block(self, blocknum):
+        block = self.blocks.get(blocknum)
+        if block is None:
+            if blocknum < self.first_block or blocknum >= self.end_block:
+                raise bd.BlockOutOfRangeException(self, blocknum)
+
+            block = bd.Block(blocknum*len(self.fill), self.fill)
+            self.blocks[blocknum] = block
+            bisect.insort(self.block_nums, blocknum)
+        return block
+
+    def sorted_blocks(self):
+        '''
+        Returns the populated blocks in ascending address order.
+        '''
+        return [self.blocks[n] for n in self.block_nums]
+
+    def blocks_in_range(self, addr, size):
+        '''
+        Returns the populated blocks overlapping the specified address range
+        in ascending address order.
+        '''
+        block_size = len(self.fill)
+        lo = bisect.bisect_left(self.block_nums, addr // block_size)
+        hi = bisect.bisect_left(self.block_nums,
+                                (addr + size + block_size - 1) // block_size)
+        return [self.blocks[n] for n in self.block_nums[lo:hi]]
+
     def write(self, addr, data):
         block_size = len(self.fill)
+        data       = memoryview(data)
 
         while data:
-            avail    = block_size - (addr % block_size)
-            count    = min(len(data), avail)
-            blocknum = addr // block_size
-            if blocknum < self.first_block or blocknum >= self.end_block:
-                raise bd.BlockOutOfRangeException(self, blocknum)
-
-            blockaddr = blocknum*block_size
-            block     = self.blocks.get(blocknum,
-                                        bd.Block(blockaddr, self.fill))
+            avail = block_size - (addr % block_size)
+            count = min(len(data), avail)
+            block = self._get_block(addr // block_size)
             block.write(addr, data[:count])
 
-            self.blocks[blocknum] = block
-            data                  = data[count:]
-            addr                 += count
+            data  = data[count:]
+            addr += count
@@ -1,17 +1,42 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
 from . import matcher
 
+import struct
+
+
+# ROM table entries are read in chunks of this many bytes.
+ROM_CHUNK_SIZE = 64
+
+
+def decode_id_block(mem):
+    '''
+    Assembles a 32-bit ID value from the low bytes of four consecutive 32-bit
+    ID registers.
+    '''
+    return (((ord(mem[12:13]) << 24) & 0xFF000000) |
+            ((ord(mem[ 8: 9]) << 16) & 0x00FF0000) |
+            ((ord(mem[ 4: 5]) <<  8) & 0x0000FF00) |
+            ((ord(mem[ 0: 1]) <<  0) & 0x000000FF))
+
 
 class Component(object):
-    def __init__(self, parent, ap, addr, subtype=''):
+    def __init__(self, parent, ap, addr, subtype='', cidr=None, pidr=None):
+        '''
+        If the CIDR and PIDR values are already known, for instance when a
+        matched subclass is being constructed from a generic Component, they
+        can be passed in to avoid reading them from the target again.
+        '''
         self.parent   = parent
         self.ap       = ap
         self.addr     = addr
         self.subtype  = subtype
-        self.cidr     = self.read_id_block(self.addr + 0xFF0)
-        self.pidr     = ((self.read_id_block(self.addr + 0xFD0) << 32) |
-                         (self.read_id_block(self.addr + 0xFE0) <<  0))
         self.children = []
+        if cidr is None or pidr is None:
+            self.ap.db.immutable.declare(self.ap.ap_num, self.addr + 0xFD0,
+                                         0x30)
+            cidr, pidr = self.read_id_regs()
+        self.cidr     = cidr
+        self.pidr     = pidr
 
     def __repr__(self):
         return "Component '%s':0x%08X:0x%08X:0x%016X %s" % (
@@ -67,12 +92,10 @@ class Component(object):
         if ((self.cidr >> 12) & 0xF) != 1:
             return
 
-        offset = 0
-        while True:
-            entry = self.ap.read_32(self.addr + offset)
-            if entry == 0:
-                break
+        # ROM table contents are fixed, so the entries can be cached.
+        self.ap.db.immutable.declare(self.ap.ap_num, self.addr, 0xF00)
 
+        for entry in self.read_rom_entries():
             c = Component.probe(self.ap, entry, base=self.addr, parent=self,
                                 match=match)
             if c is not None:
@@ -80,18 +103,42 @@ class Component(object):
                     print('  %s%s' % (prefix, c))
                 self.children.append(c)
 
-            offset += 4
-
         prefix += '  '
         for c in self.children:
             c.probe_children(prefix=prefix, verbose=verbose, match=match)
 
+    def read_rom_entries(self):
+        '''
+        Returns the list of ROM table entries preceding the terminating zero
+        entry.  Entries are read ROM_CHUNK_SIZE bytes at a time rather than
+        one at a time; the ROM table occupies the whole 4K block so reading
+        past the end marker is harmless.
+        '''
+        entries = []
+        offset  = 0
+        while offset < 0xF00:
+            size = min(ROM_CHUNK_SIZE, 0xF00 - offset)
+            mem  = self.ap.read_bulk(self.addr + offset, size)
+            for entry in struct.unpack('<%uI' % (size // 4), mem):
+                if entry == 0:
+                    return entries
+                entries.append(entry)
+            offset += size
+        return entries
+
+    def read_id_regs(self):
+        '''
+        Reads the PIDR4-7, PIDR0-3 and CIDR0-3 registers in the 0xFD0-0xFFF
+        window with a single 48-byte read and returns the tuple (cidr, pidr).
+        '''
+        mem  = self.ap.read_bulk(self.addr + 0xFD0, 0x30)
+        pidr = ((decode_id_block(mem[0x00:0x10]) << 32) |
+                (decode_id_block(mem[0x10:0x20]) <<  0))
+        cidr = decode_id_block(mem[0x20:0x30])
+        return cidr, pidr
+
     def read_id_block(self, addr):
-        mem = self.ap.read_bulk(addr, 16)
-        return (((ord(mem[12:13]) << 24) & 0xFF000000) |
-                ((ord(mem[ 8: 9]) << 16) & 0x00FF0000) |
-                ((ord(mem[ 4: 5]) <<  8) & 0x0000FF00) |
-                ((ord(mem[ 0: 1]) <<  0) & 0x000000FF))
+        return decode_id_block(self.ap.read_bulk(addr, 16))
 
     def find_component(self, cidr, pidr):
         if self.cidr == cidr and self.pidr == pidr:
@@ -9,6 +9,19 @@ import struct
 import sys
 
 
+def symbolize(elf, addr):
+    '''
+    Returns a string describing the address, including the symbol containing
+    it if an ELF file was provided.
+    '''
+    s = '0x%08X' % addr
+    if elf is not None:
+        sym = elf.lookup_addr(addr & ~1)
+        if sym is not None:
+            s += ' <%s+0x%X>' % (sym[0].name, sym[1])
+    return s
+
+
 def main(rv):
     # Dump all debuggers if requested.
     if rv.dump_debuggers:
@@ -24,6 +37,7 @@ def main(rv):
     target = probe.probe(verbose=rv.verbose, connect_under_reset=False)
     f      = target.set_max_tck_freq()
     print('Set SWD frequency to %.3f MHz' % (f/1.e6))
+    target.enable_mem_cache()
 
     # Generate the core file.
     c = psdb.elf.Core()
@@ -36,6 +50,7 @@ def main(rv):
         elif rv.peripheral_capture:
             print('Adding "%s"...' % d.name)
             region_data = b''
+            values      = d.read_registers()
             for r in d.regs:
                 # Skip aliased registers.  For instance, GPT16x1 has CCMR1_I
                 # and CCMR1_O both at address 0x18 for use in inspect_tool.
@@ -46,7 +61,7 @@ def main(rv):
                 pad          = r.offset - len(region_data)
                 region_data += b'\xCA'*pad
                 if (r.flags & r.READABLE):
-                    region_data += struct.pack('<L', r.read(d))
+                    region_data += struct.pack('<L', values[r.name])
                 else:
                     region_data += struct.pack('<L', 0xCACACACA)
 
@@ -54,8 +69,11 @@ def main(rv):
                 c.add_mem_map(d.dev_base, region_data)
 
     # Iterate over all CPUs to get CPU registers.
-    for cpu in target.cpus:
+    elf = psdb.elf.ELFBinary.from_path(rv.elf) if rv.elf else None
+    for i, cpu in enumerate(target.cpus):
         r    = cpu.read_core_registers()
+        print('CPU%u: PC %s LR %s' % (i, symbolize(elf, r['pc']),
+                                      symbolize(elf, r['lr'])))
         regs = [r['r0'], r['r1'], r['r2'], r['r3'], r['r4'], r['r5'], r['r6'],
                 r['r7'], r['r8'], r['r9'], r['r10'], r['r11'], r['r12'],
                 r['sp'], r['lr'], r['pc'], r['xpsr']]
@@ -78,6 +96,7 @@ def _main():
     parser.add_argument('--verbose', '-v', action='store_true')
     parser.add_argument('--output-path', '-o', required=True)
     parser.add_argument('--peripheral-capture', '-p', action='store_true')
+    parser.add_argument('--elf')
     rv = parser.parse_args()
 
     try:
@@ -13,7 +13,8 @@ class Cortex(psdb.component.Component):
     '''
     def __init__(self, component, subtype, model):
         super(Cortex, self).__init__(component.parent, component.ap,
-                                     component.addr, subtype)
+                                     component.addr, subtype,
+                                     cidr=component.cidr, pidr=component.pidr)
         self.model     = model
         self._scs      = None
         self._bpu      = None
@@ -48,14 +49,46 @@ class Cortex(psdb.component.Component):
         # Okay, it was running last time we checked.  Check again since it may
         # have halted.
         if self.scs.is_halted():
-            self.flags |= FLAG_HALTED
+            self._set_halted()
             return True
 
         # It hasn't halted, so it's still running.
         return False
 
-    def inval_halted_state(self):
+    def _set_halted(self):
+        '''
+        Records that the CPU has halted.  Memory may have changed while it was
+        running, so any cached memory contents are discarded.
+        '''
+        self.flags |= FLAG_HALTED
+        self.ap.db.inval_mem_caches()
+
+    def _set_running(self):
+        '''
+        Records that the CPU may be running.  Memory caches are discarded and
+        won't be used again until all CPUs are halted.
+        '''
         self.flags &= ~FLAG_HALTED
+        self.ap.db.inval_mem_caches()
+
+    def inval_halted_state(self):
+        self._set_running()
+
+    def dhcsr_read_op(self):
+        '''
+        Returns the Probe.exec_multi() read operation for this CPU's DHCSR
+        register so that several CPUs can be polled in a single batch.
+        '''
+        return (self.ap.ap_num, self.scs._DHCSR.addr, 32)
+
+    def update_halted_state(self, dhcsr):
+        '''
+        Updates the halted state from a DHCSR value that was read by the
+        caller.  Returns True if the CPU is halted, False otherwise.
+        '''
+        if (dhcsr & (1 << 17)) and not (self.flags & FLAG_HALTED):
+            self._set_halted()
+        return bool(self.flags & FLAG_HALTED)
 
     def read_8(self, addr):
         return self.ap.read_8(addr)
@@ -69,6 +102,9 @@ class Cortex(psdb.component.Component):
     def read_bulk(self, addr, size):
         return self.ap.read_bulk(addr, size)
 
+    def read_bulk_into(self, buf, addr):
+        self.ap.read_bulk_into(buf, addr)
+
     def read_core_register(self, name):
         '''Reads a single core register.'''
         assert self.flags & FLAG_HALTED
@@ -103,11 +139,12 @@ class Cortex(psdb.component.Component):
             return
 
         self.scs.halt()
-        self.flags |= FLAG_HALTED
+        self._set_halted()
 
     def single_step(self):
         '''Steps the CPU for a single instruction.'''
         assert self.flags & FLAG_HALTED
+        self.ap.db.inval_mem_caches()
         self.scs.single_step()
 
     def resume(self):
@@ -116,7 +153,7 @@ class Cortex(psdb.component.Component):
             return
 
         self.scs.resume()
-        self.flags &= ~FLAG_HALTED
+        self._set_running()
 
     def enable_reset_vector_catch(self):
         self.scs.enable_reset_vector_catch()
@@ -130,4 +167,4 @@ class Cortex(psdb.component.Component):
 
     def wait_local_reset_complete(self):
         self.scs.wait_aircr_local_reset_complete()
-        self.flags &= ~FLAG_HALTED
+        self._set_running()
@@ -12,4 +12,4 @@ class CortexSubDevice(Device, Component):
         Device.__init__(self, cortex_cpu, component.ap, component.addr, name,
                         regs, path=path)
         Component.__init__(self, component.parent, component.ap, component.addr,
-                           subtype)
+                           subtype, cidr=component.cidr, pidr=component.pidr)
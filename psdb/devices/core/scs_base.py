@@ -1,15 +1,22 @@
 # Copyright (c) 2019-2020 Phase Advanced Sensor Systems, Inc.
 from .cortex_subdevice import CortexSubDevice
+import psdb.util
 
-import time
 import collections
 
 
+# DHCSR.S_REGRDY
+S_REGRDY = (1 << 16)
+
+
 class SCS(CortexSubDevice):
     '''
     Base class for Cortex V6-M (M0+) and V7-M (M4, M7) System Control Space
     devices.
     '''
+    # Core registers that are only accessible when the FPU is enabled.
+    FP_REGISTERS = ()
+
     def __init__(self, component, subtype, dev_regs, core_regs):
         super(SCS, self).__init__('SCS', dev_regs, component, subtype)
         self.core_regs = core_regs
@@ -22,43 +29,97 @@ class SCS(CortexSubDevice):
     def read_cpuid(self):
         return self._CPUID.read()
 
+    def _core_register_ops(self, sel):
+        '''
+        Returns the exec_multi() operations to transfer the register selected
+        by sel into DCRDR and then read back DHCSR and DCRDR.
+        '''
+        return [(self._DCRSR.addr, 32, sel),
+                (self._DHCSR.addr, 32),
+                (self._DCRDR.addr, 32),
+                ]
+
     def read_core_register(self, name):
-        '''Reads one of the core registers.'''
+        '''
+        Reads one of the core registers.  The DCRSR write and the DHCSR and
+        DCRDR reads are issued as a single batch; DCRDR is only valid if
+        DHCSR.S_REGRDY was set when DHCSR was read, otherwise we keep polling
+        until the transfer completes.
+        '''
         assert self.owner.is_halted()
 
-        self._DCRSR = self.core_regs[name]
-        while not self._DHCSR.S_REGRDY:
-            time.sleep(0.001)
-        return self._DCRDR.read()
+        dhcsr, v = self.ap.exec_multi(
+                self._core_register_ops(self.core_regs[name]))
+        if dhcsr & S_REGRDY:
+            return v
+
+        def cond():
+            dhcsr, v = self.ap.read_multi([(self._DHCSR.addr, 32),
+                                           (self._DCRDR.addr, 32)])
+            return (v,) if dhcsr & S_REGRDY else None
+
+        v, = psdb.util.wait(cond, msg='Timed out reading core register %s' %
+                            name)
+        return v
+
+    def fp_enabled(self):
+        '''
+        Returns True if the FPU is present and enabled so that the FP core
+        registers can be accessed.
+        '''
+        return False
 
     def read_core_registers(self):
-        '''Reads all core registers.'''
+        '''
+        Reads all core registers, omitting the FP registers if the FPU isn't
+        enabled.  The transfers for all registers are pipelined into a single
+        exec_multi() batch; any register whose S_REGRDY flag wasn't set in
+        time is then read again individually.
+        '''
+        assert self.owner.is_halted()
+
+        names = [r for r in self.core_regs if r not in self.FP_REGISTERS]
+        if self.FP_REGISTERS and self.fp_enabled():
+            names = list(self.core_regs)
+
+        ops = []
+        for r in names:
+            ops += self._core_register_ops(self.core_regs[r])
+        values = self.ap.exec_multi(ops)
+
         regs = collections.OrderedDict()
-        for r in self.core_regs:
-            regs[r] = self.read_core_register(r)
+        for i, r in enumerate(names):
+            dhcsr, v = values[2*i:2*i + 2]
+            if not (dhcsr & S_REGRDY):
+                v = self.read_core_register(r)
+            regs[r] = v
         return regs
 
     def write_core_register(self, v, name):
         '''Writes a single core register.'''
         assert self.owner.is_halted()
 
-        self._DCRDR = v
-        self._DCRSR = ((1<<16) | self.core_regs[name])
-        while not self._DHCSR.S_REGRDY:
-            time.sleep(0.001)
+        dhcsr, = self.ap.exec_multi([(self._DCRDR.addr, 32, v),
+                                     (self._DCRSR.addr, 32,
+                                      (1<<16) | self.core_regs[name]),
+                                     (self._DHCSR.addr, 32),
+                                     ])
+        if not (dhcsr & S_REGRDY):
+            psdb.util.wait(lambda: self._DHCSR.S_REGRDY,
+                           msg='Timed out writing core register %s' % name)
 
     def is_halted(self):
         return (self._DHCSR.S_HALT != 0)
 
     def halt(self):
         self._DHCSR = (0xA05F0000 | (1 << 1) | (1 << 0))
-        while not self._DHCSR.S_HALT:
-            time.sleep(0.001)
+        psdb.util.wait(lambda: self._DHCSR.S_HALT,
+                       msg='Timed out waiting for CPU to halt')
 
     def single_step(self):
         self._DHCSR = (0xA05F0000 | (1 << 3) | (1 << 2) | (1 << 0))
-        while not self._DHCSR.S_HALT:
-            time.sleep(0.001)
+        psdb.util.wait(lambda: self._DHCSR.S_HALT,
+                       msg='Timed out waiting for CPU to step')
 
     def resume(self):
         self._DHCSR = (0xA05F0000 | (1 << 0))
@@ -81,18 +142,22 @@ class SCS(CortexSubDevice):
         self._AIRCR = ((self._AIRCR.read() & 0x0000FFF8) | 0x05FA0004)
 
     def wait_aircr_local_reset_complete(self):
-        while True:
+        '''
+        Waits for AIRCR.SYSRESETREQ to clear.  The debug connection may drop
+        while the reset is in progress, so access errors are ignored.
+        '''
+        def cond():
             try:
-                if not self._AIRCR.SYSRESETREQ:
-                    break
-                time.sleep(0.001)
+                return not self._AIRCR.SYSRESETREQ
             except Exception:
-                pass
+                return False
+
+        psdb.util.wait(cond, msg='Timed out waiting for local reset')
 
     def clear_reset_state(self):
-        while self._DHCSR.S_RESET_ST:
-            pass
+        psdb.util.wait(lambda: not self._DHCSR.S_RESET_ST,
+                       msg='Timed out waiting for DHCSR.S_RESET_ST to clear')
 
     def wait_reset_state(self):
-        while not self._DHCSR.S_RESET_ST:
-            pass
+        psdb.util.wait(lambda: self._DHCSR.S_RESET_ST,
+                       msg='Timed out waiting for DHCSR.S_RESET_ST')
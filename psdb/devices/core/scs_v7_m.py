@@ -62,6 +62,9 @@ CORE_REGISTERS = collections.OrderedDict([
     ('s31',     95),
 ])
 
+# The core registers that require the FPU to be enabled.
+FP_REGISTERS = frozenset(['fpscr'] + ['s%u' % i for i in range(32)])
+
 
 class SCS(scs_base.SCS):
     '''
@@ -246,8 +249,17 @@ class SCS(scs_base.SCS):
                                      ]),
             ]
 
+    FP_REGISTERS = FP_REGISTERS
+
     def __init__(self, component, subtype):
         super(SCS, self).__init__(component, subtype, SCS.REGS, CORE_REGISTERS)
 
         # Enable DEMCR.TRCENA so we can probe further.
         self._DEMCR.TRCENA = 1
+
+    def fp_enabled(self):
+        '''
+        The FP registers are accessible if CPACR grants access to CP10 and
+        CP11.  On parts without an FPU these fields read as zero.
+        '''
+        return ((self._CPACR.read() >> 20) & 0xF) != 0
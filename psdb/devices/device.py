@@ -1,4 +1,5 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
+import collections
 
 
 def convert_positional_to_adjacency(fields):
@@ -234,12 +235,26 @@ class Device(object):
         curr = self._read_32(offset) >> shift
         return curr & mask
 
+    def read_registers(self, regs=None):
+        '''
+        Snapshots all of the readable registers (or just the specified subset)
+        using a single batched read and returns an OrderedDict mapping register
+        names to values.
+        '''
+        regs   = [r for r in (regs or self.regs) if r.flags & Reg.READABLE]
+        values = self.ap.read_multi([(self.dev_base + r.offset, 8*r.size)
+                                     for r in regs])
+        return collections.OrderedDict((r.name, v)
+                                       for r, v in zip(regs, values))
+
     def dump_registers(self):
-        width = max(len(r.name) for r in self.regs if r.flags & Reg.READABLE)
+        values = self.read_registers()
+        width  = max(len(name) for name in values)
 
         for r in self.regs:
             if r.flags & Reg.READABLE:
-                print('%*s = 0x%0*X' % (width, r.name, 2*r.size, r.read(self)))
+                print('%*s = 0x%0*X' % (width, r.name, 2*r.size,
+                                        values[r.name]))
 
 
 class MemDevice(Device):
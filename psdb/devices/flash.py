@@ -3,10 +3,17 @@ from ..block import RAMBD, BlockOutOfRangeException
 import psdb
 
 import math
+import re
 import time
 from builtins import range
 
 
+# Runs of erased bytes shorter than this inside a block are written anyway
+# rather than splitting the write, since each separate write operation costs
+# more probe round trips than just sending the extra bytes.
+MIN_BLANK_SKIP = 256
+
+
 class FlashException(Exception):
     pass
 
@@ -20,6 +27,11 @@ class FlashWriteException(Exception):
 
 
 class Flash(object):
+    # Minimum write granularity in bytes; flash lines of this size that are
+    # entirely in the erased state don't need to be written.  Drivers should
+    # override this with their controller's programming unit.
+    GRANULE = 64
+
     def __init__(self, mem_base, sector_size, nsectors):
         super(Flash, self).__init__()
         self.mem_base    = mem_base
@@ -122,36 +134,135 @@ class Flash(object):
         '''
         raise NotImplementedError
 
+    def make_loader(self, compress=False):
+        '''
+        Returns a RAM-resident flash loader that can be used in place of
+        write() to program the flash, or None if the flash driver doesn't
+        support one.  If compress is True, the loader transfers the data
+        compressed and expands it on the target.
+        '''
+        return None
+
+    def sector_matches(self, addr, data):
+        '''
+        Returns True if the flash contents starting at addr already match the
+        specified data.  This implementation reads back the flash; subclasses
+        with a cheaper comparison method, such as a hardware CRC unit, should
+        override it.
+        '''
+        return self.read(addr, len(data)) == data
+
+    def verify_blocks(self, blocks, verbose=True):
+        '''
+        Verifies that each of the specified blocks was correctly written to
+        flash, raising a FlashWriteException if one of them doesn't match.
+        This implementation reads back the flash; subclasses with a cheaper
+        comparison method should override it.
+        '''
+        for block in psdb.piter(blocks, verbose=verbose):
+            mem = self.read(block.addr, len(block.data))
+            if mem != block.data:
+                raise FlashWriteException(
+                    'Verify failed in sector at 0x%08X' % block.addr)
+
     def prune_dv(self, dv):
         '''
         Returns a copy of the data vector containing only alps that are
-        entirely contained in the flash.
+        entirely contained in the flash.  Alps that straddle the flash
+        boundaries are trimmed using memoryview slices, so the data itself is
+        never copied.
         '''
         f_base = self.mem_base
         f_end  = self.mem_base + self.flash_size
 
         pdv = []
-        for v in dv:
-            v_base = v[0]
-            v_data = v[1]
-            v_end  = v_base + len(v_data)
+        for v_base, v_data in dv:
+            v_end = v_base + len(v_data)
             if v_base >= f_end or v_end <= f_base:
                 continue
 
-            if v_base < f_base:
-                n       = f_base - v_base
-                v_base += n
-                v_data  = v_data[n:]
-
-            if v_end > f_end:
-                n      = v_end - f_end
-                v_data = v_data[:-n]
+            if v_base < f_base or v_end > f_end:
+                lo     = max(f_base - v_base, 0)
+                hi     = min(f_end, v_end) - v_base
+                v_data = memoryview(v_data)[lo:hi]
+                v_base = max(v_base, f_base)
 
             pdv.append((v_base, v_data))
 
         return pdv
 
-    def burn_dv(self, dv, bank_swap=False, verbose=True, erase=True):
+    def plan_writes(self, addr, data):
+        '''
+        Splits an address-length pair destined for erased flash into the list
+        of (addr, data) pairs that actually need to be written, skipping
+        GRANULE-aligned runs of the erased value.  Leading and trailing runs
+        are always skipped; runs inside the data are only skipped if they are
+        at least MIN_BLANK_SKIP bytes long.
+        '''
+        g = self.GRANULE
+        assert addr % g == 0
+
+        writes = []
+        pos    = 0
+        for m in re.finditer(b'\xff{%u,}' % g, data):
+            start = (m.start() + g - 1) & ~(g - 1)
+            end   = m.end() & ~(g - 1)
+            if m.end() == len(data):
+                end = m.end()
+            if end - start < g:
+                continue
+            if (0 < start and end < len(data) and
+                    end - start < MIN_BLANK_SKIP):
+                continue
+            if pos < start:
+                writes.append((addr + pos, data[pos:start]))
+            pos = end
+        if pos < len(data):
+            writes.append((addr + pos, data[pos:]))
+        return writes
+
+    def _write_blocks(self, writer, blocks, verbose):
+        '''
+        Writes the blocks using the writer's write() method, skipping erased
+        lines as planned by plan_writes().  Each block's data is trimmed of
+        trailing erased lines so that they aren't verified either.  Returns
+        the number of bytes written.
+        '''
+        total_len = 0
+        for block in psdb.piter(blocks, verbose=verbose):
+            writes = self.plan_writes(block.addr, block.data)
+            if writes:
+                end        = writes[-1][0] + len(writes[-1][1])
+                block.data = block.data[:end - block.addr]
+            else:
+                block.data = b''
+            for addr, data in writes:
+                writer.write(addr, data, verbose=False)
+                total_len += len(data)
+        return total_len
+
+    def prepare_blocks(self, dv, bank_swap=False):
+        '''
+        Lays the specified data vector out in sector-sized blocks, returning
+        the list of blocks to be burned in address order.  This only depends on
+        the flash geometry and not on the target, so it can be done before or
+        concurrently with target communication.  See burn_dv() for the
+        semantics of the data vector and of bank_swap.
+        '''
+        bd = RAMBD(self.sector_size,
+                   first_block=self.mem_base // self.sector_size,
+                   nblocks=self.nsectors)
+        for v in dv:
+            try:
+                addr = self._swap_addr(v[0], v[1]) if bank_swap else v[0]
+                bd.write(addr, v[1])
+            except BlockOutOfRangeException:
+                pass
+
+        return bd.sorted_blocks()
+
+    def burn_dv(self, dv, bank_swap=False, verbose=True, erase=True,
+                diff=False, loader=False, compress=False):
         '''
         Burns the specified data vector to flash, erasing sectors as necessary
         to perform the operation.  The data vector is a list of the form:
@@ -173,36 +284,67 @@ class Flash(object):
         would be performed to the lower 4K.  This is to allow writing a binary
         linked at an active base address into the inactive half of flash in a
         dual-banked system.
+
+        If diff is True, each sector is first compared against the current
+        flash contents using sector_matches() and sectors that already hold
+        the desired data are neither erased nor written.
+
+        If loader is True and the flash driver supports it, the data is
+        programmed by a loader stub running from the target's RAM instead of
+        directly over SWD.  This resets the target and destroys the contents
+        of the RAM used by the loader.  If compress is True, the loader is used
+        and the data is LZ4-compressed on the host and expanded on the target,
+        which reduces the amount of data sent over SWD for typical images.
         '''
-        bd = RAMBD(self.sector_size,
-                   first_block=self.mem_base // self.sector_size,
-                   nblocks=self.nsectors)
-        for v in dv:
-            try:
-                addr = self._swap_addr(v[0], v[1]) if bank_swap else v[0]
-                bd.write(addr, v[1])
-            except BlockOutOfRangeException:
-                pass
+        return self.burn_blocks(self.prepare_blocks(dv, bank_swap=bank_swap),
+                                verbose=verbose, erase=erase, diff=diff,
+                                loader=loader, compress=compress)
+
+    def burn_blocks(self, blocks, verbose=True, erase=True, diff=False,
+                    loader=False, compress=False):
+        '''
+        Burns a list of blocks previously returned by prepare_blocks().  The
+        options are the same as for burn_dv().  The blocks' data may be
+        trimmed in the process, so the list shouldn't be burned twice.
+        '''
+        if diff:
+            if verbose:
+                print('Comparing flash...')
+            nblocks = len(blocks)
+            blocks  = [b for b in psdb.piter(blocks, verbose=verbose)
+                       if not self.sector_matches(b.addr, b.data)]
+            if verbose:
+                print('%u of %u sectors differ.' % (len(blocks), nblocks))
+        if not blocks:
+            return
 
         if erase:
             if verbose:
                 print('Erasing flash...')
             mask = 0
-            for block in bd.blocks.values():
+            for block in blocks:
                 mask |= self._mask_for_alp(block.addr, len(block.data))
             self.erase_sectors(mask, verbose=verbose)
 
         self.set_swd_freq_write(verbose=verbose)
 
+        loader = loader or compress
+        writer = self.make_loader(compress=compress) if loader else None
+        if loader and writer is None and verbose:
+            print('Flash loader not supported, writing over SWD.')
+
         t0 = time.time()
-        total_len = 0
         if verbose:
             print('Burning flash...')
-        for block in psdb.piter(bd.blocks.values(), verbose=verbose):
-            while block.data.endswith(b'\xff'*64):
-                block.data = block.data[:-64]
-            self.write(block.addr, block.data, verbose=False)
-            total_len += len(block.data)
+        if writer is None:
+            total_len = self._write_blocks(self, blocks, verbose)
+        else:
+            with writer:
+                total_len = self._write_blocks(writer, blocks, verbose)
+            if verbose and compress:
+                print('Sent %u bytes for %u bytes of flash (%.1f%%).' %
+                      (writer.bytes_sent, writer.bytes_written,
+                       100. * writer.bytes_sent / max(writer.bytes_written, 1)))
 
         if verbose:
             elapsed = time.time() - t0
@@ -214,9 +356,7 @@ class Flash(object):
         if verbose:
             print('Verifying flash...')
         t0 = time.time()
-        for block in psdb.piter(bd.blocks.values(), verbose=verbose):
-            mem = self.read(block.addr, len(block.data))
-            assert mem == block.data
+        self.verify_blocks(blocks, verbose=verbose)
         if verbose:
             elapsed = time.time() - t0
             print('Verified %u bytes in %.2f seconds (%.2f K/s).' %
@@ -3,6 +3,7 @@ from builtins import range
 
 from psdb.devices import Device, Reg32
 from .. import flash
+import psdb.util
 
 
 # Conservative flash read wait states that work for all frequencies.
@@ -115,6 +116,12 @@ class FLCTL(Device, flash.Flash):
             Reg32('CLRIFG',            0xF8),
             ]
 
+    # Typical sector erase time, in seconds.
+    ERASE_TIME = 0.01
+
+    # Flash is programmed 128 bits at a time.
+    GRANULE = 16
+
     def __init__(self, target, ap, name, addr, flash_tlv_addr, **kwargs):
         Device.__init__(self, target, ap, addr, name, FLCTL.REGS, **kwargs)
         flash.Flash.__init__(self, 0x00000000, 4096, 64)
@@ -154,47 +161,58 @@ class FLCTL(Device, flash.Flash):
     def _set_rdmode(self, addr, mode):
         wait_states = NRM_FLWAIT if mode == 0 else ORM_FLWAIT
         self._write_rdctl((wait_states << 12) | mode, addr)
-        while ((self._read_rdctl(addr) >> 16) & 0xF) != mode:
-            pass
+        psdb.util.wait(
+                lambda: ((self._read_rdctl(addr) >> 16) & 0xF) == mode,
+                msg='Timed out waiting for read mode %u' % mode)
+
+    def _set_idle(self, reg, status_field, clear_bit):
+        '''
+        Writes the clear bit of a CTLSTAT register until its status field
+        reports idle.
+        '''
+        def cond():
+            if not getattr(reg, status_field):
+                return True
+            reg.write(clear_bit)
+            return False
+
+        psdb.util.wait(cond, msg='Timed out waiting for %s idle' % reg.reg.name)
+
+    def _wait_complete(self, reg, mask, clear_bit, expected=0):
+        '''
+        Waits for all bits in mask to be set in a CTLSTAT register, then
+        writes the clear bit and returns the final CTLSTAT value.
+        '''
+        def cond():
+            v = reg.read()
+            return v if (v & mask) == mask else 0
+
+        ctlstat = psdb.util.wait(cond, expected=expected,
+                                 timeout=max(1, 10*expected),
+                                 msg='Timed out waiting for %s complete' %
+                                 reg.reg.name)
+        reg.write(clear_bit)
+        return ctlstat
 
     def _set_rdbrst_idle(self):
-        while self._RDBRST_CTLSTAT.BRST_STAT:
-            self._RDBRST_CTLSTAT = (1 << 23)
+        self._set_idle(self._RDBRST_CTLSTAT, 'BRST_STAT', (1 << 23))
 
     def _wait_rdbrst_complete(self):
-        while True:
-            ctlstat = self._RDBRST_CTLSTAT.read()
-            if (ctlstat & 0x00030000) != 0x00030000:
-                continue
-
-            self._RDBRST_CTLSTAT = (1 << 23)
-            return ctlstat
+        return self._wait_complete(self._RDBRST_CTLSTAT, 0x00030000, (1 << 23))
 
     def _set_erase_idle(self):
-        while self._ERASE_CTLSTAT.STATUS:
-            self._ERASE_CTLSTAT = (1 << 19)
+        self._set_idle(self._ERASE_CTLSTAT, 'STATUS', (1 << 19))
 
     def _wait_erase_complete(self):
-        while True:
-            ctlstat = self._ERASE_CTLSTAT.read()
-            if (ctlstat & 0x00030000) != 0x00030000:
-                continue
-
-            self._ERASE_CTLSTAT = (1 << 19)
-            return ctlstat
+        return self._wait_complete(self._ERASE_CTLSTAT, 0x00030000, (1 << 19),
+                                   expected=self.ERASE_TIME)
 
     def _set_prgbrst_idle(self):
-        while self._PRGBRST_CTLSTAT.BURST_STATUS:
-            self._PRGBRST_CTLSTAT = (1 << 23)
+        self._set_idle(self._PRGBRST_CTLSTAT, 'BURST_STATUS', (1 << 23))
 
     def _wait_prgbrst_complete(self):
-        while True:
-            ctlstat = self._PRGBRST_CTLSTAT.read()
-            if (ctlstat & 0x00070000) != 0x00070000:
-                continue
-
-            self._PRGBRST_CTLSTAT = (1 << 23)
-            return ctlstat
+        return self._wait_complete(self._PRGBRST_CTLSTAT, 0x00070000,
+                                   (1 << 23))
 
     def _write_burst_unlocked(self, addr, data_bytes):
         '''
@@ -318,8 +336,8 @@ class FLCTL(Device, flash.Flash):
             self._CLRIFG      = 0x0000033F
             self._PRG_CTLSTAT = 0x0000000B
             self.ap.write_bulk(data, addr)
-            while self._PRG_CTLSTAT.STATUS:
-                pass
+            psdb.util.wait(lambda: not self._PRG_CTLSTAT.STATUS,
+                           msg='Timed out waiting for PRG_CTLSTAT idle')
 
             v = self._IFG.read()
             if v & 0x00000206:
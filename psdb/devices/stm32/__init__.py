@@ -15,6 +15,7 @@ from .usb import USB
 from .usb_hs import USB_HS
 from .crs import CRS
 from . import flash_type1
+from . import flash_loader
 
 
 __all__ = ['ACT',
@@ -27,6 +28,7 @@ __all__ = ['ACT',
            'DMA',
            'DMA_DBM',
            'DMAMUX',
+           'flash_loader',
            'flash_type1',
            'GPIO',
            'GPT16x1',
@@ -0,0 +1,395 @@
+# Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+from ..flash import FlashWriteException
+import psdb.util
+import psdb.util.lz4
+
+import struct
+
+
+# Position-independent ARMv6-M Thumb stub that programs flash from a pair of
+# RAM slots.  It is entered with r0 pointing at the parameter block and sp
+# pointing at a small stack:
+#
+#   +0x00   FLASH_CR address
+#   +0x04   FLASH_SR address
+#   +0x08   CR bits to set while programming (PG)
+#   +0x0C   SR bits that indicate the controller is busy
+#   +0x10   SR bits that indicate an error
+#   +0x14   Programming granule in bytes (8 for type1, 32 for H7)
+#   +0x18   Address of the decompression buffer
+#   +0x1C   Slot size in bytes
+#   +0x20   Slot 0, followed by slot 1
+#
+# Each slot starts with a mailbox word followed by the destination address,
+# the length in bytes, the compressed length in bytes and then the data to
+# program.  The stub alternates between the slots, waiting for the mailbox to
+# become SLOT_READY.  If the compressed length is non-zero the slot holds an
+# LZ4 block which is first expanded into the decompression buffer.  The data
+# is then programmed one granule at a time and the mailbox is set back to
+# SLOT_EMPTY.  If the mailbox holds SLOT_EXIT the stub executes a bkpt; if the
+# controller reports an error the stub stores FLASH_SR in the mailbox and
+# executes a bkpt.
+#
+#   start:      cpsid   i
+#               movs    r1, r0
+#               adds    r1, #32
+#   wait_ready: ldr     r3, [r1]
+#               cmp     r3, #1
+#               beq     program
+#               cmp     r3, #2
+#               bne     wait_ready
+#               bkpt    #0
+#   program:    ldr     r4, [r1, #4]
+#               ldr     r5, [r1, #8]
+#               movs    r6, r1
+#               adds    r6, #16
+#               ldr     r3, [r1, #12]
+#               cmp     r3, #0
+#               beq     raw
+#               movs    r2, r6
+#               bl      lz4
+#               ldr     r6, [r0, #24]
+#   raw:        ldr     r2, [r0, #0]
+#               ldr     r3, [r2]
+#               ldr     r7, [r0, #8]
+#               orrs    r3, r7
+#               str     r3, [r2]
+#   unit:       ldr     r2, [r0, #20]
+#   copy:       ldr     r3, [r6]
+#               str     r3, [r4]
+#               adds    r6, #4
+#               adds    r4, #4
+#               subs    r5, #4
+#               subs    r2, #4
+#               bne     copy
+#               dsb     sy
+#               ldr     r2, [r0, #4]
+#   busy:       ldr     r3, [r2]
+#               ldr     r7, [r0, #12]
+#               tst     r3, r7
+#               bne     busy
+#               ldr     r7, [r0, #16]
+#               tst     r3, r7
+#               bne     error
+#               cmp     r5, #0
+#               bne     unit
+#               bl      clear_pg
+#               movs    r3, #0
+#               str     r3, [r1]
+#               movs    r2, r0
+#               adds    r2, #32
+#               cmp     r1, r2
+#               bne     first_slot
+#               ldr     r3, [r0, #28]
+#               adds    r1, r1, r3
+#               b       wait_ready
+#   first_slot: mov     r1, r2
+#               b       wait_ready
+#   error:      bl      clear_pg
+#               str     r3, [r1]
+#               bkpt    #1
+#   clear_pg:   ldr     r2, [r0, #0]
+#               ldr     r4, [r2]
+#               ldr     r7, [r0, #8]
+#               bics    r4, r7
+#               str     r4, [r2]
+#               bx      lr
+#   lz4:        push    {r0, r1, r4, r5, lr}
+#               adds    r3, r2, r3
+#               ldr     r6, [r0, #24]
+#   seq:        ldrb    r0, [r2]
+#               adds    r2, #1
+#               lsrs    r1, r0, #4
+#               bl      getlen
+#               cmp     r1, #0
+#               beq     lit_done
+#   lit_copy:   ldrb    r4, [r2]
+#               strb    r4, [r6]
+#               adds    r2, #1
+#               adds    r6, #1
+#               subs    r1, #1
+#               bne     lit_copy
+#   lit_done:   cmp     r2, r3
+#               bhs     lz4_done
+#               ldrb    r4, [r2]
+#               ldrb    r5, [r2, #1]
+#               lsls    r5, r5, #8
+#               orrs    r4, r5
+#               adds    r2, #2
+#               movs    r1, #15
+#               ands    r1, r0
+#               bl      getlen
+#               adds    r1, #4
+#               subs    r4, r6, r4
+#   match_copy: ldrb    r5, [r4]
+#               strb    r5, [r6]
+#               adds    r4, #1
+#               adds    r6, #1
+#               subs    r1, #1
+#               bne     match_copy
+#               b       seq
+#   lz4_done:   pop     {r0, r1, r4, r5, pc}
+#   getlen:     cmp     r1, #15
+#               bne     len_done
+#   len_loop:   ldrb    r5, [r2]
+#               adds    r2, #1
+#               adds    r1, r1, r5
+#               cmp     r5, #255
+#               beq     len_loop
+#   len_done:   bx      lr
+STUB = bytes([0x72, 0xB6, 0x01, 0x00, 0x20, 0x31, 0x0B, 0x68,
+              0x01, 0x2B, 0x02, 0xD0, 0x02, 0x2B, 0xFA, 0xD1,
+              0x00, 0xBE, 0x4C, 0x68, 0x8D, 0x68, 0x0E, 0x00,
+              0x10, 0x36, 0xCB, 0x68, 0x00, 0x2B, 0x03, 0xD0,
+              0x32, 0x00, 0x00, 0xF0, 0x31, 0xF8, 0x86, 0x69,
+              0x02, 0x68, 0x13, 0x68, 0x87, 0x68, 0x3B, 0x43,
+              0x13, 0x60, 0x42, 0x69, 0x33, 0x68, 0x23, 0x60,
+              0x04, 0x36, 0x04, 0x34, 0x04, 0x3D, 0x04, 0x3A,
+              0xF8, 0xD1, 0xBF, 0xF3, 0x4F, 0x8F, 0x42, 0x68,
+              0x13, 0x68, 0xC7, 0x68, 0x3B, 0x42, 0xFB, 0xD1,
+              0x07, 0x69, 0x3B, 0x42, 0x0E, 0xD1, 0x00, 0x2D,
+              0xEB, 0xD1, 0x00, 0xF0, 0x0F, 0xF8, 0x00, 0x23,
+              0x0B, 0x60, 0x02, 0x00, 0x20, 0x32, 0x91, 0x42,
+              0x02, 0xD1, 0xC3, 0x69, 0xC9, 0x18, 0xCA, 0xE7,
+              0x11, 0x46, 0xC8, 0xE7, 0x00, 0xF0, 0x02, 0xF8,
+              0x0B, 0x60, 0x01, 0xBE, 0x02, 0x68, 0x14, 0x68,
+              0x87, 0x68, 0xBC, 0x43, 0x14, 0x60, 0x70, 0x47,
+              0x33, 0xB5, 0xD3, 0x18, 0x86, 0x69, 0x10, 0x78,
+              0x01, 0x32, 0x01, 0x09, 0x00, 0xF0, 0x1D, 0xF8,
+              0x00, 0x29, 0x05, 0xD0, 0x14, 0x78, 0x34, 0x70,
+              0x01, 0x32, 0x01, 0x36, 0x01, 0x39, 0xF9, 0xD1,
+              0x9A, 0x42, 0x11, 0xD2, 0x14, 0x78, 0x55, 0x78,
+              0x2D, 0x02, 0x2C, 0x43, 0x02, 0x32, 0x0F, 0x21,
+              0x01, 0x40, 0x00, 0xF0, 0x0A, 0xF8, 0x04, 0x31,
+              0x34, 0x1B, 0x25, 0x78, 0x35, 0x70, 0x01, 0x34,
+              0x01, 0x36, 0x01, 0x39, 0xF9, 0xD1, 0xDE, 0xE7,
+              0x33, 0xBD, 0x0F, 0x29, 0x04, 0xD1, 0x15, 0x78,
+              0x01, 0x32, 0x49, 0x19, 0xFF, 0x2D, 0xFA, 0xD0,
+              0x70, 0x47,
+              ])
+
+# Mailbox values.
+SLOT_EMPTY = 0
+SLOT_READY = 1
+SLOT_EXIT  = 2
+
+# Size of the parameter block, the slot header and the stub's stack.
+PARAMS_SIZE = 0x20
+SLOT_HEADER = 16
+STACK_SIZE  = 0x40
+
+# Default size of each slot's data buffer.
+BUF_SIZE = 4096
+
+
+class FlashLoader(object):
+    '''
+    RAM-resident flash loader.  Instead of setting PG and streaming the data
+    directly into flash over SWD and then polling for completion from the
+    host, the loader stub is placed in SRAM and run on the target's CPU.  The
+    host streams data into one of two RAM slots while the stub programs the
+    other one, so there are no host round trips in the per-granule loop.
+
+    The flash driver supplies the controller details:
+
+        GRANULE             - bytes programmed in a single operation
+        LOADER_PG           - CR bits to set while programming
+        LOADER_BUSY         - SR bits set while the controller is busy
+        LOADER_ERRORS       - SR bits that indicate an error
+        _loader_bank(addr)  - returns (bank, unlocked_context_manager) for the
+                              controller owning addr; the bank must have _CR
+                              and _SR registers and a _clear_errors() method
+
+    If compress is True, each chunk is LZ4-compressed on the host and
+    expanded by the stub before programming; chunks that don't compress are
+    sent as-is.  The bytes_written and bytes_sent attributes record the
+    amount of flash data programmed and the amount of slot data actually
+    transferred over SWD, for measuring the effective throughput.
+
+    Starting the loader resets and halts the target so that the CPU runs the
+    stub with interrupts, caches and clocks in their reset state; the
+    contents of the selected SRAM are destroyed.  The loader is used as a
+    context manager:
+
+        with FlashLoader(flash) as ldr:
+            ldr.write(addr, data)
+    '''
+    def __init__(self, flash, buf_size=BUF_SIZE, compress=False):
+        self.flash    = flash
+        self.target   = flash.target
+        self.cpu      = self.target.cpus[0]
+        self.ap       = self.cpu.ap
+        self.granule  = flash.GRANULE
+        self.compress = compress
+
+        # The RAM holds the stub, the parameter block, the two slots, the
+        # decompression buffer and the stack.
+        code_size   = (len(STUB) + 7) & ~7
+        overhead    = code_size + PARAMS_SIZE + 2*SLOT_HEADER + STACK_SIZE
+        self.ram    = self._find_ram(overhead + 3*self.granule)
+        buf_size    = min(buf_size, (self.ram.size - overhead) // 3)
+        buf_size   &= ~(self.granule - 1)
+
+        self.buf_size      = buf_size
+        self.slot_size     = SLOT_HEADER + buf_size
+        self.base          = self.ram.dev_base
+        self.params        = self.base + code_size
+        self.slots         = [self.params + PARAMS_SIZE,
+                              self.params + PARAMS_SIZE + self.slot_size]
+        self.expand_buf    = self.slots[1] + self.slot_size
+        self.stack_top     = self.expand_buf + buf_size + STACK_SIZE
+        self.next_slot     = 0
+        self.bank          = None
+        self.unlocked      = None
+        self.bytes_written = 0
+        self.bytes_sent    = 0
+
+    def _find_ram(self, size):
+        '''
+        Returns the first SRAM device on the CPU's AP that the CPU can execute
+        from and that is large enough to hold the loader.
+        '''
+        for ram in self.target.ram_devs.values():
+            if ram.ap != self.ap or ram.size < size:
+                continue
+            if 0x20000000 <= ram.dev_base < 0x40000000:
+                return ram
+
+        raise psdb.ProbeException('No SRAM available for the flash loader.')
+
+    def _read_mailbox(self, slot):
+        return self.ap.read_32(self.slots[slot])
+
+    def _wait_slot(self, slot):
+        '''
+        Waits for the stub to finish programming the slot and raises a
+        FlashWriteException if the stub reported a flash error.
+        '''
+        def cond():
+            state = self._read_mailbox(slot)
+            return None if state == SLOT_READY else (state,)
+
+        expected = self.flash.PROGRAM_TIME * (self.buf_size // self.granule)
+        state,   = psdb.util.wait(cond, expected=expected,
+                                  timeout=max(1, 10*expected),
+                                  msg='Timed out waiting for flash loader')
+        if state not in (SLOT_EMPTY, SLOT_EXIT):
+            raise FlashWriteException('Flash operation failed, FLASH_SR=0x%08X'
+                                      % state)
+
+    def _drain(self):
+        '''
+        Waits for the stub to finish programming both slots.
+        '''
+        for slot in (self.next_slot, self.next_slot ^ 1):
+            self._wait_slot(slot)
+
+    def _select_bank(self, addr):
+        '''
+        Points the stub at the flash controller that owns addr, unlocking it
+        and relocking the previous one.  The stub must be idle.
+        '''
+        bank, unlocked = self.flash._loader_bank(addr)
+        if bank is self.bank:
+            return
+
+        self._drain()
+        self._release_bank()
+        unlocked.__enter__()
+        self.bank     = bank
+        self.unlocked = unlocked
+        bank._clear_errors()
+        self.ap.write_bulk(struct.pack('<5I', bank._CR.addr, bank._SR.addr,
+                                       self.flash.LOADER_PG,
+                                       self.flash.LOADER_BUSY,
+                                       self.flash.LOADER_ERRORS),
+                           self.params)
+
+    def _release_bank(self):
+        if self.unlocked is not None:
+            self.unlocked.__exit__(None, None, None)
+        self.bank     = None
+        self.unlocked = None
+
+    def start(self):
+        '''
+        Resets and halts the target, loads the stub and starts it running.
+        '''
+        self.target.reset_halt()
+        params = struct.pack('<8I', 0, 0, 0, 0, 0, self.granule,
+                             self.expand_buf, self.slot_size)
+        header = struct.pack('<4I', SLOT_EMPTY, 0, 0, 0)
+        stub   = STUB + b'\x00'*(self.params - self.base - len(STUB))
+        self.ap.write_bulk(stub + params + header, self.base)
+        self.ap.write_bulk(header, self.slots[1])
+        self.cpu.write_core_register(self.params, 'r0')
+        self.cpu.write_core_register(self.stack_top, 'sp')
+        self.cpu.write_core_register(self.base, 'pc')
+        self.cpu.write_core_register(1 << 24, 'xpsr')
+        self.cpu.resume()
+
+    def write(self, addr, data, verbose=True):
+        '''
+        Streams data to the stub for programming into flash.  The address and
+        length must be multiples of the programming granule and the target
+        region must be in the erased state.  This returns as soon as the last
+        chunk has been queued; stop() waits for programming to complete.
+        '''
+        if not data:
+            return
+        assert len(data) % self.granule == 0
+        assert addr % self.granule == 0
+        assert self.flash.mem_base <= addr
+        assert addr + len(data) <= self.flash.mem_base + self.flash.flash_size
+
+        if verbose:
+            print('Flashing region [0x%08X - 0x%08X]...' % (
+                    addr, addr + len(data) - 1))
+
+        self._select_bank(addr)
+        data = memoryview(data)
+        while data:
+            chunk   = data[:self.buf_size].tobytes()
+            payload = chunk
+            clen    = 0
+            if self.compress:
+                z = psdb.util.lz4.compress(chunk)
+                if len(z) < len(chunk):
+                    payload = z
+                    clen    = len(z)
+
+            slot = self.next_slot
+            self._wait_slot(slot)
+            self.ap.write_bulk(struct.pack('<3I', addr, len(chunk), clen) +
+                               payload, self.slots[slot] + 4)
+            self.ap.write_32(SLOT_READY, self.slots[slot])
+            self.bytes_written += len(chunk)
+            self.bytes_sent    += len(payload)
+            self.next_slot ^= 1
+            addr           += len(chunk)
+            data            = data[len(chunk):]
+
+    def stop(self):
+        '''
+        Waits for programming to complete, then tells the stub to exit and
+        waits for the CPU to halt.
+        '''
+        self._drain()
+        self.ap.write_32(SLOT_EXIT, self.slots[self.next_slot])
+        psdb.util.wait(self.cpu.is_halted,
+                       msg='Timed out waiting for flash loader to exit')
+        if self.bank is not None:
+            self.bank._check_errors()
+        self._release_bank()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.stop()
+            return
+
+        self.cpu.halt()
+        self._release_bank()
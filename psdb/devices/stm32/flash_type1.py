@@ -1,6 +1,8 @@
 # Copyright (c) 2019 Phase Advanced Sensor Systems, Inc.
 from ..device import Device
 from ..flash import Flash
+from . import flash_loader
+import psdb.util
 
 
 def block_in_region(addr, size, region_base, region_len):
@@ -45,6 +47,17 @@ class FLASH(Device, Flash):
     '''
     Common base class for many STM32 flash devices.
     '''
+    # Typical page erase and double-word programming times, in seconds.
+    ERASE_TIME   = 0.022
+    PROGRAM_TIME = 0.000082
+
+    # Double-words are programmed with CR.PG set and SR.BSY indicates that
+    # the controller is busy.
+    GRANULE       = 8
+    LOADER_PG     = (1 << 0)
+    LOADER_BUSY   = (1 << 16)
+    LOADER_ERRORS = 0x0000C3F8
+
     def __init__(self, target, regs, sector_size, ap, name, dev_base, mem_base,
                  max_write_freq, otp_base, otp_len, **kwargs):
         Device.__init__(self, target, ap, dev_base, name, regs, **kwargs)
@@ -67,12 +80,17 @@ class FLASH(Device, Flash):
 
     def _check_errors(self):
         v = self._SR.read()
-        if v & 0x0000C3F8:
+        if v & self.LOADER_ERRORS:
             raise Exception('Flash operation failed, FLASH_SR=0x%08X' % v)
 
-    def _wait_bsy_clear(self):
-        while self._SR.BSY:
-            pass
+    def _wait_bsy_clear(self, expected=0):
+        '''
+        Waits for FLASH_SR.BSY to clear, polling at a rate based on the
+        expected duration of the operation in seconds.
+        '''
+        psdb.util.wait(lambda: not self._SR.BSY, expected=expected,
+                       timeout=max(1, 10*expected),
+                       msg='Timed out waiting for FLASH_SR.BSY to clear')
 
     def set_swd_freq_write(self, verbose=True):
         f = self.target.db.set_tck_freq(self.max_write_freq)
@@ -99,7 +117,7 @@ class FLASH(Device, Flash):
             self._clear_errors()
             self._CR = ((n << 3) | (1 << 1))
             self._CR = ((1 << 16) | (n << 3) | (1 << 1))
-            self._wait_bsy_clear()
+            self._wait_bsy_clear(expected=self.ERASE_TIME)
             self._check_errors()
             self._CR = 0
 
@@ -131,12 +149,19 @@ class FLASH(Device, Flash):
 
         with self._flash_unlocked():
             self._clear_errors()
-            self._CR = (1 << 0)
-            self.ap.write_bulk(data, addr)
-            self._wait_bsy_clear()
+            with self.ap.db.pipelined():
+                self._CR = (1 << 0)
+                self.ap.write_bulk(data, addr)
+            self._wait_bsy_clear(expected=self.PROGRAM_TIME*(len(data) // 8))
             self._check_errors()
             self._CR = 0
 
+    def _loader_bank(self, addr):
+        return self, self._flash_unlocked()
+
+    def make_loader(self, compress=False):
+        return flash_loader.FlashLoader(self, compress=compress)
+
     def read_otp(self, offset, size):
         '''
         Reads a block of one-time-programmable memory.
@@ -181,7 +206,7 @@ class FLASH(Device, Flash):
                 self._OPTR = new_optr
                 self._clear_errors()
                 self._CR = (1 << 17)
-                self._wait_bsy_clear()
+                self._wait_bsy_clear(expected=self.ERASE_TIME)
                 self._check_errors()
 
     def _trigger_obl_launch(self, **kwargs):
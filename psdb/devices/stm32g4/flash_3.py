@@ -128,7 +128,7 @@ class FLASH_3(flash_type1.FLASH):
             self._clear_errors()
             self._CR = ((n << 3) | (1 << 1) | bker)
             self._CR = ((1 << 16) | (n << 3) | (1 << 1) | bker)
-            self._wait_bsy_clear()
+            self._wait_bsy_clear(expected=self.ERASE_TIME)
             self._check_errors()
             self._CR = 0
 
@@ -1,5 +1,5 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
-import time
+import psdb.util
 
 from ..device import Device, Reg32
 
@@ -490,8 +490,8 @@ class RCC(Device):
 
     def enable_hse(self):
         self._CR.HSEON = 1
-        while self._CR.HSERDY == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CR.HSERDY,
+                       msg='Timed out waiting for CR.HSERDY')
 
     def set_hpre(self, divider):
         '''
@@ -500,8 +500,8 @@ class RCC(Device):
             1, 2, 4, 8, 16, 64, 128, 256, 512
         '''
         self._CFGR.HPRE = HPRE_MAP[divider]
-        while self._CFGR.HPREF == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CFGR.HPREF,
+                       msg='Timed out waiting for CFGR.HPREF')
 
     def set_sysclock_source(self, sw):
         '''
@@ -516,5 +516,5 @@ class RCC(Device):
         '''
         assert 1 <= sw <= 3
         self._CFGR.SW = sw
-        while self._CFGR.SWS != sw:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CFGR.SWS == sw,
+                       msg='Timed out waiting for CFGR.SWS')
@@ -1,6 +1,34 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
 from ..device import Device, Reg32, Reg32R, Reg32W
 from ..flash import Flash
+from ..stm32 import flash_loader
+import psdb
+import psdb.util
+
+import zlib
+
+
+# Bit-reversal table for bytes.
+BIT_REVERSE = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+
+
+def crc32(data):
+    '''
+    Computes the CRC that the flash CRC unit generates for the specified data:
+    the Ethernet polynomial 0x04C11DB7 with an initial value of 0xFFFFFFFF and
+    no input or output reflection, fed one little-endian 32-bit word at a time
+    MSB first.  This is the non-reflected counterpart of the zlib CRC, so we
+    byte-swap each word, bit-reverse each byte and let zlib do the heavy
+    lifting.
+    '''
+    assert len(data) % 4 == 0
+    swapped       = bytearray(len(data))
+    swapped[0::4] = data[3::4]
+    swapped[1::4] = data[2::4]
+    swapped[2::4] = data[1::4]
+    swapped[3::4] = data[0::4]
+    crc = zlib.crc32(bytes(swapped).translate(BIT_REVERSE)) ^ 0xFFFFFFFF
+    return int('{:032b}'.format(crc)[::-1], 2)
 
 
 class FlashBank(Device):
@@ -93,6 +121,7 @@ class FlashBank(Device):
                                         flash.dev_base + 0x100*bank_num,
                                         '%s:BANK%u' % (flash.name, bank_num),
                                         FlashBank.REGS, **kwargs)
+        self.flash = flash
 
     def _clear_errors(self):
         self._CCR = 0x0FEF0000
@@ -102,17 +131,27 @@ class FlashBank(Device):
         if v & 0x0FEE0000:
             raise Exception('Flash operation failed, FLASH_SR=0x%08X' % v)
 
-    def _wait_prg_idle(self):
-        while self._SR.read() & 7:
-            pass
+    def _wait_prg_idle(self, expected=0):
+        '''
+        Waits for the BSY, WBNE and QW flags to clear, polling at a rate based
+        on the expected duration of the operation in seconds.
+        '''
+        psdb.util.wait(lambda: not (self._SR.read() & 7), expected=expected,
+                       timeout=max(1, 10*expected),
+                       msg='Timed out waiting for flash bank to go idle')
 
-    def _pg_unlock(self):
+    def _unlock(self):
         v = self._CR.read()
         if v & 1:
             self._KEYR = 0x45670123
             self._KEYR = 0xCDEF89AB
             v = self._CR.read()
             assert not (v & 1)
+
+        return v
+
+    def _pg_unlock(self):
+        v = self._unlock()
         if not (v & 2):
             self._CR = (v | 2)
 
@@ -122,6 +161,31 @@ class FlashBank(Device):
         v = self._CR.read()
         self._CR = ((v & ~2) | 1)
 
+    def crc_sector(self, n):
+        '''
+        Uses the bank's CRC unit to compute the CRC of the nth sector in the
+        bank.  Returns None if the CRC unit reported a read error.
+        '''
+        locked = self._CR.read() & 1
+        v      = self._unlock()
+        try:
+            self._clear_errors()
+            self._CR    = v | (1 << 15)
+            self._CRCCR = (1 << 10) | (1 << 8)
+            self._CRCCR = (1 << 9) | (1 << 8) | n
+            self._CRCCR = (1 << 17) | (1 << 8)
+            self._CRCCR = (1 << 16) | (1 << 8)
+            psdb.util.wait(lambda: not self._SR.CRC_BUSY,
+                           expected=self.flash.CRC_TIME,
+                           msg='Timed out waiting for flash CRC')
+            sr  = self._SR.read()
+            crc = self._CRCDATAR.read()
+            self._clear_errors()
+        finally:
+            self._CR = v | locked
+
+        return None if sr & (1 << 28) else crc
+
 
 class UnlockedContextManager(object):
     def __init__(self, bank):
@@ -166,6 +230,21 @@ class FLASH(Device, Flash):
             Reg32 ('OPTCCR',        0x024),
             ]
 
+    # Typical sector erase and 256-bit flash word programming times, in
+    # seconds.
+    ERASE_TIME   = 1.0
+    PROGRAM_TIME = 0.00005
+
+    # Typical time for the CRC unit to process one sector, in seconds.
+    CRC_TIME = 0.001
+
+    # 256-bit flash words are programmed with FLASH_CRx.PG set and the BSY,
+    # WBNE and QW flags indicate that the bank is busy.
+    GRANULE       = 32
+    LOADER_PG     = (1 << 1)
+    LOADER_BUSY   = 0x00000007
+    LOADER_ERRORS = 0x0FEE0000
+
     def __init__(self, target, ap, name, dev_base, mem_base, max_write_freq,
                  opt_regs, **kwargs):
         sector_size = 128*1024
@@ -216,7 +295,7 @@ class FLASH(Device, Flash):
             v  = bank._CR.read()
             v |= ((n % self.sectors_per_bank) << 8) | (1 << 7) | (1 << 2)
             bank._CR = v
-            bank._wait_prg_idle()
+            bank._wait_prg_idle(expected=self.ERASE_TIME)
             bank._check_errors()
 
     def read(self, addr, length):
@@ -250,6 +329,57 @@ class FLASH(Device, Flash):
         bank = self.banks[(addr - self.mem_base) // self.bank_size]
         with self._flash_bank_unlocked(bank):
             bank._clear_errors()
-            self.ap.write_bulk(data, addr)
-            bank._wait_prg_idle()
+            with self.ap.db.pipelined():
+                self.ap.write_bulk(data, addr)
+            bank._wait_prg_idle(expected=self.PROGRAM_TIME*(len(data) // 32))
             bank._check_errors()
+
+    def _loader_bank(self, addr):
+        bank = self.banks[(addr - self.mem_base) // self.bank_size]
+        return bank, self._flash_bank_unlocked(bank)
+
+    def make_loader(self, compress=False):
+        return flash_loader.FlashLoader(self, compress=compress)
+
+    def crc_matches(self, addr, data):
+        '''
+        Uses the bank CRC unit to compare a whole sector against the specified
+        data, which is padded out to the sector size with erased bytes.
+        Returns None if the region isn't a single sector or the CRC unit
+        failed, in which case the caller needs to fall back to a readback.
+        '''
+        if addr & self.sector_mask or len(data) > self.sector_size:
+            return None
+
+        n    = (addr - self.mem_base) // self.sector_size
+        bank = self.banks[n // self.sectors_per_bank]
+        crc  = bank.crc_sector(n % self.sectors_per_bank)
+        if crc is None:
+            return None
+
+        data = data + b'\xff'*(self.sector_size - len(data))
+        return crc == crc32(data)
+
+    def sector_matches(self, addr, data):
+        '''
+        Compares a sector against the specified data using the bank CRC unit,
+        falling back to a readback if the CRC unit can't be used.
+        '''
+        match = self.crc_matches(addr, data)
+        if match is None:
+            return super(FLASH, self).sector_matches(addr, data)
+        return match
+
+    def verify_blocks(self, blocks, verbose=True):
+        '''
+        Verifies the written blocks by letting the bank CRC unit checksum each
+        sector in place instead of reading the whole image back over SWD.
+        Sectors whose CRC doesn't match are then read back to confirm the
+        failure.
+        '''
+        bad = [b for b in psdb.piter(blocks, verbose=verbose)
+               if not self.crc_matches(b.addr, b.data)]
+        if bad:
+            if verbose:
+                print('CRC mismatch in %u sectors, reading back...' % len(bad))
+            super(FLASH, self).verify_blocks(bad, verbose=verbose)
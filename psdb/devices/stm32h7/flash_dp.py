@@ -1,6 +1,7 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
 from .flash import FLASH
 from ..device import Reg32, Reg32R
+import psdb.util
 
 
 class FLASH_DP(FLASH):
@@ -104,8 +105,8 @@ class FLASH_DP(FLASH):
             if new_boot4 is not None:
                 self._BOOT4_PRGR = new_boot4
             self._OPTCR.OPTSTART = 1
-            while self._OPTSR_CUR.OPT_BUSY:
-                pass
+            psdb.util.wait(lambda: not self._OPTSR_CUR.OPT_BUSY, timeout=10,
+                           msg='Timed out waiting for OPTSR_CUR.OPT_BUSY')
         if verbose:
             print('Flash completed (OPTSR_CUR=0x%08X, OPTSR_PRG=0x%08X)' %
                   (self._OPTSR_CUR.read(), self._OPTSR_PRG.read()))
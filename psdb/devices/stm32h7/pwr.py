@@ -1,5 +1,5 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
-import time
+import psdb.util
 
 from ..device import Device, Reg32
 
@@ -123,8 +123,8 @@ class PWR(Device):
         super(PWR, self).__init__(target, ap, addr, name, PWR.REGS, **kwargs)
 
     def _wait_vosrdy(self):
-        while self._D3CR.VOSRDY == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._D3CR.VOSRDY,
+                       msg='Timed out waiting for D3CR.VOSRDY')
 
     def _set_vos(self, vos):
         # VOS numbers are in reverse... /facepalm
@@ -1,5 +1,5 @@
 # Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
-import time
+import psdb.util
 import math
 
 from ..device import Device, Reg32
@@ -1493,8 +1493,8 @@ class RCC(Device):
 
     @property
     def f_hsi(self):
-        while self._CR.HSIDIVF == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CR.HSIDIVF,
+                       msg='Timed out waiting for CR.HSIDIVF')
         return (64000000 >> self._CR.HSIDIV)
 
     def set_f_hse(self, f):
@@ -1600,44 +1600,44 @@ class RCC(Device):
 
     def enable_hse(self):
         self._CR.HSEON = 1
-        while self._CR.HSERDY == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CR.HSERDY,
+                       msg='Timed out waiting for CR.HSERDY')
 
     def set_d1cpre(self, divider):
         bits                = PRE_MAP[divider]
         self._D1CFGR.D1CPRE = bits
-        while self._D1CFGR.D1CPRE != bits:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._D1CFGR.D1CPRE == bits,
+                       msg='Timed out waiting for D1CFGR.D1CPRE')
 
     def set_hpre(self, divider):
         bits              = PRE_MAP[divider]
         self._D1CFGR.HPRE = bits
-        while self._D1CFGR.HPRE != bits:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._D1CFGR.HPRE == bits,
+                       msg='Timed out waiting for D1CFGR.HPRE')
 
     def set_d1ppre(self, divider):
         bits                = DPRE_MAP[divider]
         self._D1CFGR.D1PPRE = bits
-        while self._D1CFGR.D1PPRE != bits:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._D1CFGR.D1PPRE == bits,
+                       msg='Timed out waiting for D1CFGR.D1PPRE')
 
     def set_d2ppre1(self, divider):
         bits                 = DPRE_MAP[divider]
         self._D2CFGR.D2PPRE1 = bits
-        while self._D2CFGR.D2PPRE1 != bits:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._D2CFGR.D2PPRE1 == bits,
+                       msg='Timed out waiting for D2CFGR.D2PPRE1')
 
     def set_d2ppre2(self, divider):
         bits                 = DPRE_MAP[divider]
         self._D2CFGR.D2PPRE2 = bits
-        while self._D2CFGR.D2PPRE2 != bits:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._D2CFGR.D2PPRE2 == bits,
+                       msg='Timed out waiting for D2CFGR.D2PPRE2')
 
     def set_d3ppre(self, divider):
         bits                = DPRE_MAP[divider]
         self._D3CFGR.D3PPRE = bits
-        while self._D3CFGR.D3PPRE != bits:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._D3CFGR.D3PPRE == bits,
+                       msg='Timed out waiting for D3CFGR.D3PPRE')
 
     def set_sysclock_source(self, sw):
         '''
@@ -1652,8 +1652,8 @@ class RCC(Device):
                 ---+-------
         '''
         self._CFGR.SW = sw
-        while self._CFGR.SWS != sw:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CFGR.SWS == sw,
+                       msg='Timed out waiting for CFGR.SWS')
 
     def set_pll_source(self, pllsrc):
         '''
@@ -1698,8 +1698,8 @@ class RCC(Device):
         self._PLL1FRACR          = 0
         self._PLLCFGR.DIVP1EN    = 1
         self._CR.PLL1ON          = 1
-        while self._CR.PLL1RDY == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CR.PLL1RDY,
+                       msg='Timed out waiting for CR.PLL1RDY')
 
     @staticmethod
     def get_pll_mnpv(f_target_mhz, f_hsclk):
@@ -2,7 +2,7 @@
 from ..device import Reg32
 from ..stm32 import flash_type1
 
-import time
+import psdb.util
 
 
 class FLASH(flash_type1.FLASH):
@@ -285,5 +285,5 @@ class FLASH(flash_type1.FLASH):
             ----+-------------------+-------------------+
         '''
         self._ACR.LATENCY = ws
-        while self._ACR.LATENCY != ws:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._ACR.LATENCY == ws,
+                       msg='Timed out waiting for ACR.LATENCY')
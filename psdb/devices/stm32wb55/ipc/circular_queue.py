@@ -12,6 +12,12 @@ class LinkRef(object):
     def _read_prev(self):
         return self.ap.read_32(self.addr + 4)
 
+    def _read_links(self):
+        '''
+        Returns the (next, prev) pair of links using a single batched read.
+        '''
+        return self.ap.read_multi([(self.addr + 0, 32), (self.addr + 4, 32)])
+
     def _write_next(self, v):
         self.ap.write_32(v, self.addr + 0)
 
@@ -35,6 +41,12 @@ class QueueRef(object):
     def _read_tail(self):
         return self.ap.read_32(self.addr + 4)
 
+    def _read_head_tail(self):
+        '''
+        Returns the (head, tail) pair of pointers using a single batched read.
+        '''
+        return self.ap.read_multi([(self.addr + 0, 32), (self.addr + 4, 32)])
+
     def _write_head(self, v):
         self.ap.write_32(v, self.addr + 0)
 
@@ -57,8 +69,9 @@ class QueueRef(object):
         '''
         Clears the queue by writing directly to the head and tail pointers.
         '''
-        self._write_head(self.addr)
-        self._write_tail(self.addr)
+        with self.ap.db.pipelined():
+            self._write_head(self.addr)
+            self._write_tail(self.addr)
 
     def front(self):
         '''
@@ -76,10 +89,11 @@ class QueueRef(object):
         '''
         link_elem = LinkRef(self.ap, link_addr)
         tail_elem = self._get_tail_elem()
-        link_elem._write_next(self.addr)
-        link_elem._write_prev(tail_elem.addr)
-        tail_elem._write_next(link_elem.addr)
-        self._write_tail(link_elem.addr)
+        with self.ap.db.pipelined():
+            link_elem._write_next(self.addr)
+            link_elem._write_prev(tail_elem.addr)
+            tail_elem._write_next(link_elem.addr)
+            self._write_tail(link_elem.addr)
 
     def pop(self):
         '''
@@ -91,25 +105,23 @@ class QueueRef(object):
             return None
 
         head_next_elem = LinkRef(self.ap, head_elem._read_next())
-        head_next_elem._write_prev(self.addr)
-        self._write_head(head_elem._read_next())
+        with self.ap.db.pipelined():
+            head_next_elem._write_prev(self.addr)
+            self._write_head(head_next_elem.addr)
         return head_elem.addr
 
     def dump(self):
         '''
         Dump the queue contents.
         '''
-        print('0x%08X Sentinel N: 0x%08X P: 0x%08X'
-              % (self.addr, self._read_head(), self._read_tail()))
-        link = LinkRef(self.ap, self.addr)
-        while True:
-            next_link_addr = link._read_next()
-            if next_link_addr == self.addr:
-                break
-
+        head, tail = self._read_head_tail()
+        print('0x%08X Sentinel N: 0x%08X P: 0x%08X' % (self.addr, head, tail))
+        next_link_addr = head
+        while next_link_addr != self.addr:
             link = LinkRef(self.ap, next_link_addr)
+            next_link_addr, prev_link_addr = link._read_links()
             print('0x%08X     Link N: 0x%08X P: 0x%08X'
-                  % (link.addr, link._read_next(), link._read_prev()))
+                  % (link.addr, next_link_addr, prev_link_addr))
 
 
 class Queue(QueueRef):
@@ -161,11 +161,12 @@ class Mailbox(object):
         self.mm_ble_pool_len              = 2048
         assert self.ram_size >= 0xE00 + 2048
 
-        self.ap.write_bulk(b'\xCC'*self.ram_size, self.base_addr)
-        self.ap.write_bulk(self._serialize_base_table(), self.base_addr)
-        self.ap.write_bulk(self._serialize_system_table(), self.st_addr)
-        self.ap.write_bulk(self._serialize_ble_table(), self.blet_addr)
-        self.ap.write_bulk(self._serialize_mm_table(), self.mmt_addr)
+        with self.ap.db.pipelined():
+            self.ap.write_bulk(b'\xCC'*self.ram_size, self.base_addr)
+            self.ap.write_bulk(self._serialize_base_table(), self.base_addr)
+            self.ap.write_bulk(self._serialize_system_table(), self.st_addr)
+            self.ap.write_bulk(self._serialize_ble_table(), self.blet_addr)
+            self.ap.write_bulk(self._serialize_mm_table(), self.mmt_addr)
 
         self.sys_queue        = Queue(self.ap, self.sys_queue_addr)
         self.ble_evt_queue    = Queue(self.ap, self.ble_evt_queue_addr)
@@ -1,9 +1,9 @@
 # Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
 from ..device import Device, Reg32
-import time
+import psdb.util
 
 
-class TimeoutError(Exception):
+class TimeoutError(psdb.util.TimeoutException):
     pass
 
 
@@ -132,11 +132,10 @@ class IPCC(Device):
         indicating that new data can be written for transfer to CPU2.  The
         channel number is 1-based.
         '''
-        timeout = 1000000000 if timeout is None else timeout
-        t0      = time.time()
-        while time.time() - t0 < timeout and not self.get_tx_free_flag(channel):
-            time.sleep(0.001)
-        if not self.get_tx_free_flag(channel):
+        try:
+            psdb.util.wait(lambda: self.get_tx_free_flag(channel),
+                           timeout=timeout, max_delay=0.01)
+        except psdb.util.TimeoutException:
             raise TimeoutError('Timed out waiting for TX free flag')
 
     def wait_rx_occupied(self, channel, timeout=None):
@@ -145,9 +144,8 @@ class IPCC(Device):
         indicating that new data is available for transfer from CPU2.  The
         channel number is 1-based.
         '''
-        timeout = 1000000000 if timeout is None else timeout
-        t0      = time.time()
-        while time.time() - t0 < timeout and not self.get_rx_flag(channel):
-            time.sleep(0.001)
-        if not self.get_rx_flag(channel):
+        try:
+            psdb.util.wait(lambda: self.get_rx_flag(channel),
+                           timeout=timeout, max_delay=0.01)
+        except psdb.util.TimeoutException:
             raise TimeoutError('Timed out waiting for RX occupied flag')
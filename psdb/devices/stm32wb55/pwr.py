@@ -1,5 +1,5 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
-import time
+import psdb.util
 
 from ..device import Device, Reg32
 
@@ -133,8 +133,8 @@ class PWR(Device):
 
     def enable_backup_domain(self):
         self._CR1.DBP = 1
-        while self._CR1.DBP == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CR1.DBP,
+                       msg='Timed out waiting for CR1.DBP')
 
     def set_voltage_scaling(self, vos):
         '''
@@ -145,5 +145,5 @@ class PWR(Device):
         '''
         assert vos in (1, 2)
         self._CR1.VOS = vos
-        while self._SR2.VOSF:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: not self._SR2.VOSF,
+                       msg='Timed out waiting for SR2.VOSF')
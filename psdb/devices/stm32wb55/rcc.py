@@ -1,5 +1,5 @@
 # Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
-import time
+import psdb.util
 
 from ..device import Device, Reg32
 
@@ -597,18 +597,18 @@ class RCC(Device):
 
     def enable_hse(self):
         self._CR.HSEON = 1
-        while self._CR.HSERDY == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CR.HSERDY,
+                       msg='Timed out waiting for CR.HSERDY')
 
     def enable_hsi(self):
         self._CR.HSION = 1
-        while self._CR.HSIRDY == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CR.HSIRDY,
+                       msg='Timed out waiting for CR.HSIRDY')
 
     def enable_lse(self):
         self._BDCR.LSEON = 1
-        while self._BDCR.LSERDY == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._BDCR.LSERDY, timeout=5,
+                       msg='Timed out waiting for BDCR.LSERDY')
 
     def apply_hse_tuning(self):
         id0_data = self.target.flash.get_st_otp_data_from_key(0x00)
@@ -632,8 +632,8 @@ class RCC(Device):
             1, 2, 3, 4, 5, 6, 8, 10, 16, 32, 64, 128, 256, 512
         '''
         self._CFGR.HPRE = HPRE_MAP[divider]
-        while self._CFGR.HPREF == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CFGR.HPREF,
+                       msg='Timed out waiting for CFGR.HPREF')
 
     def set_c2hpre(self, divider):
         '''
@@ -642,8 +642,8 @@ class RCC(Device):
             1, 2, 3, 4, 5, 6, 8, 10, 16, 32, 64, 128, 256, 512
         '''
         self._EXTCFGR.C2HPRE = HPRE_MAP[divider]
-        while self._EXTCFGR.C2HPREF == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._EXTCFGR.C2HPREF,
+                       msg='Timed out waiting for EXTCFGR.C2HPREF')
 
     def set_shdhpre(self, divider):
         '''
@@ -652,8 +652,8 @@ class RCC(Device):
             1, 2, 3, 4, 5, 6, 8, 10, 16, 32, 64, 128, 256, 512
         '''
         self._EXTCFGR.SHDHPRE = HPRE_MAP[divider]
-        while self._EXTCFGR.SHDHPREF == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._EXTCFGR.SHDHPREF,
+                       msg='Timed out waiting for EXTCFGR.SHDHPREF')
 
     def set_ppre1(self, divider):
         '''
@@ -662,8 +662,8 @@ class RCC(Device):
             1, 2, 4, 8, 16
         '''
         self._CFGR.PPRE1 = PPRE_MAP[divider]
-        while self._CFGR.PPRE1F == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CFGR.PPRE1F,
+                       msg='Timed out waiting for CFGR.PPRE1F')
 
     def set_ppre2(self, divider):
         '''
@@ -672,8 +672,8 @@ class RCC(Device):
             1, 2, 4, 8, 16
         '''
         self._CFGR.PPRE2 = PPRE_MAP[divider]
-        while self._CFGR.PPRE2F == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CFGR.PPRE2F,
+                       msg='Timed out waiting for CFGR.PPRE2F')
 
     def set_sysclock_source(self, sw):
         '''
@@ -688,8 +688,8 @@ class RCC(Device):
                 ---+-------
         '''
         self._CFGR.SW = sw
-        while self._CFGR.SWS != sw:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: self._CFGR.SWS == sw,
+                       msg='Timed out waiting for CFGR.SWS')
 
     def set_rtcclock_source(self, rtcsel):
         '''
@@ -1,10 +1,13 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
 from .elf_binary import ELFBinary
+from .image import ELFImage, ELFFormatException
 from .core import Core
 from . import dv
 
 
 __all__ = ['ELFBinary',
+           'ELFImage',
+           'ELFFormatException',
            'Core',
            'dv',
            ]
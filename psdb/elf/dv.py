@@ -1,6 +1,15 @@
 # Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
 
 
+class OverlapException(Exception):
+    def __init__(self, a, b):
+        super(OverlapException, self).__init__(
+            'Region [0x%08X - 0x%08X] overlaps [0x%08X - 0x%08X]'
+            % (a[0], a[1] - 1, b[0], b[1] - 1))
+        self.a = a
+        self.b = b
+
+
 def dv_overlaps_region(dv, addr, size):
     '''
     Checks if any alp in the data vector overlaps the region defined by
@@ -30,9 +39,29 @@ def merge_dvs(lhs, rhs):
     '''
     Merges lhs and rhs, checking for address conflicts.  Alps from
     rhs will all follow vectors from lhs in the resulting merged vector.
+
+    The alps of rhs may not overlap each other or any alp of lhs; alps
+    within lhs are assumed to have been checked already.  The check sorts
+    all of the intervals by start address and sweeps through them once, so it
+    runs in O(n log n) time.  An OverlapException reporting the two
+    conflicting (start, end) ranges is raised if a conflict is found.
     '''
-    dv = lhs[:]
-    for alp in rhs:
-        assert not dv_overlaps_region(dv, alp[0], len(alp[1]))
-        dv.append(alp)
-    return dv
+    intervals = sorted((alp[0], alp[0] + len(alp[1]), i >= len(lhs))
+                       for i, alp in enumerate(lhs + rhs) if len(alp[1]))
+
+    # The intervals with the highest end address seen so far, from either
+    # vector and from rhs only.
+    last_any = None
+    last_rhs = None
+    for iv in intervals:
+        start, end, from_rhs = iv
+        prev = last_any if from_rhs else last_rhs
+        if prev is not None and prev[1] > start:
+            raise OverlapException(prev[:2], iv[:2])
+
+        if last_any is None or end > last_any[1]:
+            last_any = iv
+        if from_rhs and (last_rhs is None or end > last_rhs[1]):
+            last_rhs = iv
+
+    return lhs + rhs
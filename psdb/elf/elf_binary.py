@@ -1,24 +1,109 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
+import psdb.util
 from elftools.elf.elffile import ELFFile
 
+import bisect
+import glob
+import hashlib
+import json
+import os
+
+
+# Bump this if the format of the cached symbol index changes.
+SYMBOL_CACHE_VERSION = 1
+
+# Maximum number of symbol index files kept in the cache directory; the least
+# recently used ones are removed when a new one is saved.
+MAX_SYMBOL_CACHES = 8
+
+
+class SymbolEntry(dict):
+    '''
+    The symbol table fields of a Symbol, accessible either as dict items or as
+    attributes in the same way as pyelftools symbol entries.
+    '''
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class Symbol(object):
+    '''
+    A symbol from the ELF file's symbol table.  This is a lightweight copy of
+    the pyelftools Symbol that can be saved to and restored from the symbol
+    cache; it supports the sym.name, sym['st_value'] and sym.entry.st_value
+    forms of access.
+    '''
+    def __init__(self, name, value, size, typ, bind, shndx):
+        self.name  = name
+        self.entry = SymbolEntry(st_value=value,
+                                 st_size=size,
+                                 st_info=SymbolEntry(type=typ, bind=bind),
+                                 st_shndx=shndx)
+
+    def __getitem__(self, name):
+        return self.entry[name]
+
+    @property
+    def addr(self):
+        '''
+        The address of the first byte of the symbol; this differs from the
+        symbol value for Thumb functions, which have bit 0 set in the value.
+        '''
+        if self.entry.st_info.type == 'STT_FUNC':
+            return self.entry.st_value & ~1
+        return self.entry.st_value
+
+    def is_addressable(self):
+        '''
+        Returns True if this is a defined function or object symbol that
+        should be found by address lookups.
+        '''
+        return (self.entry.st_shndx != 'SHN_UNDEF' and
+                self.entry.st_info.type in ('STT_FUNC', 'STT_OBJECT'))
+
+    def to_json(self):
+        e = self.entry
+        return [self.name, e.st_value, e.st_size, e.st_info.type,
+                e.st_info.bind, e.st_shndx]
+
+    def __repr__(self):
+        return 'Symbol(%r, 0x%08X, %u)' % (self.name, self.entry.st_value,
+                                           self.entry.st_size)
+
 
 class ELFBinary(object):
     '''
     Class used for reading the contents of an existing ELF file; typically used
     by flashing code to analyze an ELF executable and figure out which blocks
     of memory to be written where.
+
+    Symbol lookups go through an index that is built the first time a symbol
+    is requested: a dict mapping names to symbols and a sorted list of symbol
+    start addresses for address lookups.  The index is saved in the psdb cache
+    directory, keyed by the GNU build ID of the file if it has one or by the
+    file's path, size and modification time otherwise, so that later runs
+    against the same binary don't need to parse the symbol table at all.
     '''
     def __init__(self, file_object):
         file_object.seek(0)
-        self.elf_file = ELFFile(file_object)
-        self.symtab   = self.elf_file.get_section_by_name('.symtab')
-        self.entry    = self.elf_file['e_entry']
-        self.pv_dv    = [(s['p_paddr'], s['p_vaddr'],
-                          s.data() + b'\x00'*(s['p_memsz'] - s['p_filesz']))
-                         for s in self.iter_segments()
-                         if s['p_type'] == 'PT_LOAD'
-                         ]
-        self.flash_dv = [(s[0], s[2]) for s in self.pv_dv]
+        self.file_object = file_object
+        self.elf_file    = ELFFile(file_object)
+        self.symtab      = self.elf_file.get_section_by_name('.symtab')
+        self.entry       = self.elf_file['e_entry']
+        self.pv_dv       = [(s['p_paddr'], s['p_vaddr'],
+                             s.data() + b'\x00'*(s['p_memsz'] - s['p_filesz']))
+                            for s in self.iter_segments()
+                            if s['p_type'] == 'PT_LOAD'
+                            ]
+        self.flash_dv    = [(s[0], s[2]) for s in self.pv_dv]
+        self._symbols    = None
+        self._by_name    = None
+        self._by_addr    = None
+        self._addrs      = None
+        self._max_ends   = None
 
     @staticmethod
     def from_path(path):
@@ -27,11 +112,144 @@ class ELFBinary(object):
     def iter_segments(self):
         return self.elf_file.iter_segments()
 
+    def _cache_key(self):
+        '''
+        Returns the key under which the symbol index is cached, or None if the
+        file can't be identified or has no symbol table worth caching.  The
+        build ID is shared by stripped and unstripped copies of a binary, so
+        the location and size of the symbol table are part of the key.
+        '''
+        if self.symtab is None:
+            return None
+
+        for s in self.elf_file.iter_sections():
+            if s['sh_type'] != 'SHT_NOTE':
+                continue
+            for n in s.iter_notes():
+                if n['n_type'] == 'NT_GNU_BUILD_ID':
+                    return 'build-id-%s-%x-%x' % (n['n_desc'],
+                                                  self.symtab['sh_offset'],
+                                                  self.symtab['sh_size'])
+
+        try:
+            path = os.path.realpath(self.file_object.name)
+            st   = os.fstat(self.file_object.fileno())
+        except (AttributeError, TypeError, OSError):
+            return None
+        ident = '%s:%u:%u' % (path, st.st_size, st.st_mtime_ns)
+        return 'file-%s' % hashlib.sha1(ident.encode()).hexdigest()
+
+    @staticmethod
+    def _cache_path(key):
+        return os.path.join(psdb.util.cache_dir(), 'symbols-%s.json' % key)
+
+    @staticmethod
+    def _prune_symbol_caches():
+        '''
+        Removes the least recently used symbol index files so that at most
+        MAX_SYMBOL_CACHES remain.
+        '''
+        paths = glob.glob(os.path.join(psdb.util.cache_dir(), 'symbols-*.json'))
+        mtimes = []
+        for path in paths:
+            try:
+                mtimes.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        mtimes.sort(reverse=True)
+        for _, path in mtimes[MAX_SYMBOL_CACHES:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _load_symbols(self, key):
+        try:
+            path = self._cache_path(key)
+            with open(path, 'r') as f:
+                cache = json.load(f)
+            if cache['version'] != SYMBOL_CACHE_VERSION:
+                return None
+            symbols = [Symbol(*s) for s in cache['symbols']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+        # Mark the file as recently used so that pruning keeps it.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return symbols
+
+    def _save_symbols(self, key, symbols):
+        '''
+        Saves the symbol index to the cache.  Errors writing the cache are
+        ignored; it is only an optimization.
+        '''
+        cache = {'version' : SYMBOL_CACHE_VERSION,
+                 'symbols' : [s.to_json() for s in symbols],
+                 }
+        try:
+            path = self._cache_path(key)
+            tmp  = '%s.%u.tmp' % (path, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp, path)
+            self._prune_symbol_caches()
+        except OSError:
+            pass
+
+    def _parse_symbols(self):
+        if self.symtab is None:
+            return []
+        return [Symbol(s.name, s['st_value'], s['st_size'],
+                       s['st_info']['type'], s['st_info']['bind'],
+                       s['st_shndx'])
+                for s in self.symtab.iter_symbols()]
+
+    def _index_symbols(self):
+        '''
+        Builds the symbol index, loading it from the cache if possible.
+        '''
+        if self._symbols is not None:
+            return
+
+        key     = self._cache_key()
+        symbols = self._load_symbols(key) if key else None
+        if symbols is None:
+            symbols = self._parse_symbols()
+            if key:
+                self._save_symbols(key, symbols)
+
+        by_name = {}
+        for s in symbols:
+            by_name.setdefault(s.name, []).append(s)
+
+        by_addr = sorted((s for s in symbols if s.is_addressable()),
+                         key=lambda s: s.addr)
+
+        # max_ends[i] is the highest end address of any of the first i + 1
+        # symbols, which bounds how far back lookup_addr() has to search for
+        # a symbol enclosing an address.
+        max_ends = []
+        max_end  = 0
+        for s in by_addr:
+            max_end = max(max_end, s.addr + max(s.entry.st_size, 1))
+            max_ends.append(max_end)
+
+        self._symbols  = symbols
+        self._by_name  = by_name
+        self._by_addr  = by_addr
+        self._addrs    = [s.addr for s in by_addr]
+        self._max_ends = max_ends
+
     def get_symbols_by_substring(self, substr):
-        return [s for s in self.symtab.iter_symbols() if substr in s.name]
+        self._index_symbols()
+        return [s for s in self._symbols if substr in s.name]
 
     def get_symbols_by_name(self, name):
-        return [s for s in self.symtab.iter_symbols() if s.name == name]
+        self._index_symbols()
+        return list(self._by_name.get(name, ()))
 
     def get_symbol_by_name(self, name):
         s = self.get_symbols_by_name(name)
@@ -41,6 +259,25 @@ class ELFBinary(object):
     def get_symbol_addr(self, sym):
         return self.get_symbol_by_name(sym)['st_value']
 
+    def lookup_addr(self, addr):
+        '''
+        Returns a (symbol, offset) tuple for the function or object symbol
+        containing the specified address, or None if no symbol contains it.
+        Zero-sized symbols only match their own address.  If symbols are
+        nested, the one with the closest start address is returned, so an
+        address past a label or local object inside a function still resolves
+        to the enclosing function.
+        '''
+        self._index_symbols()
+        i = bisect.bisect_right(self._addrs, addr) - 1
+        while i >= 0 and self._max_ends[i] > addr:
+            s      = self._by_addr[i]
+            offset = addr - s.addr
+            if offset < max(s.entry.st_size, 1):
+                return s, offset
+            i -= 1
+        return None
+
     def _read(self, addr, size, addr_index):
         for v in self.pv_dv:
             base = v[addr_index]
@@ -0,0 +1,91 @@
+# Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+import mmap
+import struct
+
+
+ELF_MAGIC   = b'\x7fELF'
+ELFCLASS32  = 1
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+PT_LOAD     = 1
+
+
+class ELFFormatException(Exception):
+    pass
+
+
+class ELFImage(object):
+    '''
+    Lightweight reader for the loadable contents of an ELF32 file.  Only the
+    ELF header and the program headers are parsed; the file is mapped with
+    mmap and the data of each PT_LOAD segment is exposed as a memoryview into
+    the mapping, so nothing is copied and section contents such as DWARF
+    debug info are never touched.  Segments whose memory size exceeds their
+    file size are zero-padded, which requires a copy of that segment only.
+
+    This provides the same pv_dv, flash_dv and entry attributes as
+    ELFBinary, but not its symbol lookup.
+    '''
+    def __init__(self, file_object):
+        self.file_object = file_object
+        try:
+            self.mm = mmap.mmap(file_object.fileno(), 0,
+                                access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ELFFormatException('Empty file.')
+        self.data = memoryview(self.mm)
+
+        ident = bytes(self.data[:16])
+        if len(self.mm) < 52 or ident[:4] != ELF_MAGIC:
+            raise ELFFormatException('Not an ELF file.')
+        if ident[4] != ELFCLASS32:
+            raise ELFFormatException('Not an ELF32 file.')
+        if ident[5] == ELFDATA2LSB:
+            endian = '<'
+        elif ident[5] == ELFDATA2MSB:
+            endian = '>'
+        else:
+            raise ELFFormatException('Invalid ELF data encoding.')
+
+        self.entry, phoff = struct.unpack_from(endian + 'II', self.mm, 24)
+        phentsize, phnum  = struct.unpack_from(endian + 'HH', self.mm, 42)
+        if phnum and phentsize < 32:
+            raise ELFFormatException('Invalid program header size.')
+        if phoff + phnum*phentsize > len(self.mm):
+            raise ELFFormatException('Program headers past end of file.')
+
+        self.pv_dv = []
+        for i in range(phnum):
+            (p_type, p_offset, p_vaddr, p_paddr,
+             p_filesz, p_memsz) = struct.unpack_from(endian + '6I', self.mm,
+                                                     phoff + i*phentsize)
+            if p_type != PT_LOAD:
+                continue
+            if p_offset + p_filesz > len(self.mm):
+                raise ELFFormatException('Segment past end of file.')
+
+            data = self.data[p_offset:p_offset + p_filesz]
+            if p_memsz > p_filesz:
+                data = bytes(data) + b'\x00'*(p_memsz - p_filesz)
+            self.pv_dv.append((p_paddr, p_vaddr, data))
+
+        self.flash_dv = [(s[0], s[2]) for s in self.pv_dv]
+
+    @staticmethod
+    def from_path(path):
+        return ELFImage(open(path, 'rb'))
+
+    def _read(self, addr, size, addr_index):
+        for v in self.pv_dv:
+            base = v[addr_index]
+            data = v[2]
+            if base <= addr and addr + size <= base + len(data):
+                offset = addr - base
+                return bytes(data[offset:offset + size])
+        return None
+
+    def read_p_addr(self, p_addr, size):
+        return self._read(p_addr, size, 0)
+
+    def read_v_addr(self, v_addr, size):
+        return self._read(v_addr, size, 1)
@@ -5,27 +5,211 @@ import psdb.elf
 import psdb.hexfile
 
 import argparse
+import concurrent.futures
 import hashlib
+import multiprocessing
 import time
 import sys
 
 
-IMAGE_PARSERS = [psdb.elf.ELFBinary.from_path,
-                 psdb.hexfile.HEXFile,
+def parse_elf(path):
+    '''
+    Parses the loadable segments of an ELF file, using the lightweight mmap
+    reader for ELF32 images and falling back to the full ELF parser for
+    anything it doesn't handle.
+    '''
+    try:
+        return psdb.elf.ELFImage.from_path(path)
+    except psdb.elf.ELFFormatException:
+        return psdb.elf.ELFBinary.from_path(path)
+
+
+# Image parsers, keyed by the leading magic bytes of the file.
+IMAGE_PARSERS = [(b'\x7fELF', parse_elf),
+                 (b':',       psdb.hexfile.HEXFile),
                  ]
 
 
 def parse_image(path):
-    for ip in IMAGE_PARSERS:
-        try:
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    for prefix, ip in IMAGE_PARSERS:
+        if magic.lstrip().startswith(prefix):
             return ip(path)
-        except Exception:
-            pass
 
     raise Exception('Unrecognized file type.')
 
 
+def prepare_images(paths, flash_future, bank_swap):
+    '''
+    Parses and hashes the image files and then lays them out for burning.  The
+    parsing only needs the files so it proceeds immediately; pruning and block
+    layout need the flash geometry, so we wait for the Flash object to be
+    delivered through flash_future once the target has been probed and its
+    option bytes, which can change the geometry, have been set.  Returns
+    the list of lines to print and the list of blocks to pass to burn_blocks().
+    This is run on a worker thread while the main thread talks to the target.
+    '''
+    lines = []
+    imgs  = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            md5 = hashlib.md5(f.read())
+        lines.append('Burning "%s"...' % path)
+        lines.append('MD5: %s' % md5.hexdigest())
+        imgs.append(parse_image(path))
+
+    flash = flash_future.result()
+    dv    = []
+    for img in imgs:
+        pdv = flash.prune_dv(img.flash_dv)
+        dv  = psdb.elf.dv.merge_dvs(dv, pdv)
+    return lines, flash.prepare_blocks(dv, bank_swap=bank_swap)
+
+
+# The image data vectors shared with the gang programming worker processes.
+GANG_DVS = None
+
+# Options that aren't supported in gang programming mode, as (rv attribute,
+# option name) pairs.
+GANG_UNSUPPORTED = [('dump_debuggers',   '--dump-debuggers'),
+                    ('usb_path',         '--usb-path'),
+                    ('read_flash',       '--read-flash'),
+                    ('write_raw_binary', '--write-raw-binary'),
+                    ('erase',            '--erase'),
+                    ('mem_dump',         '--mem-dump'),
+                    ('verbose',          '--verbose'),
+                    ('swap_banks',       '--swap-banks'),
+                    ('get_options',      '--get-options'),
+                    ('option',           '--option'),
+                    ]
+
+
+def _gang_init(dvs):
+    global GANG_DVS
+    GANG_DVS = dvs
+
+
+def gang_worker(args):
+    '''
+    Programs the board attached to a single probe, in its own process.  Returns
+    a (usb_path, error, elapsed) tuple where error is None on success.
+    '''
+    usb_path, rv = args
+    t0    = time.time()
+    probe = None
+    error = None
+    try:
+        probe = psdb.probes.open_by_path(usb_path)
+        probe.set_tck_freq(rv.probe_freq)
+        if rv.srst:
+            probe.srst_target()
+        target = probe.probe(connect_under_reset=rv.connect_under_reset)
+        target.set_max_tck_freq()
+
+        dv = []
+        for img_dv in GANG_DVS:
+            pdv = target.flash.prune_dv(img_dv)
+            dv  = psdb.elf.dv.merge_dvs(dv, pdv)
+        target.flash.burn_dv(dv, verbose=False, bank_swap=rv.flash_inactive,
+                             diff=rv.diff, loader=rv.loader,
+                             compress=rv.compress)
+        target.reset_halt()
+        if not rv.halt:
+            target.resume()
+    except Exception as e:
+        error = str(e) or type(e).__name__
+    finally:
+        if probe is not None:
+            try:
+                probe.close()
+            except Exception as e:
+                error = error or 'Error closing probe: %s' % e
+    return usb_path, error, time.time() - t0
+
+
+def select_gang_probes(gang):
+    '''
+    Returns the list of probes selected by the --gang argument, which is either
+    "all" or a comma-separated list of USB paths and serial numbers.
+    '''
+    probes = psdb.probes.get_probes()
+    if gang == 'all':
+        return list(probes)
+
+    selected = []
+    for key in gang.split(','):
+        matches = [p for p in probes if key in (p.usb_path, p.serial_num)]
+        if not matches:
+            raise psdb.ProbeException('Probe "%s" not found.' % key)
+        selected += [p for p in matches if p not in selected]
+    return selected
+
+
+def gang_main(rv):
+    '''
+    Programs the same images to the boards attached to several probes in
+    parallel, with one worker process per probe, and prints a per-board
+    report.  The images are parsed once here and passed to the workers.
+    Returns the number of boards that failed.
+
+    The workers are started with the spawn method rather than fork, since
+    this process has already initialized libusb while enumerating the probes
+    and libusb can't be used in a forked child.
+    '''
+    probes = select_gang_probes(rv.gang)
+    if not probes:
+        raise psdb.ProbeException('No compatible debug probe found.')
+    boards = [(p.usb_path, p.serial_num) for p in probes]
+    psdb.probes.close_probes()
+
+    dvs = []
+    for f in rv.flash:
+        with open(f, 'rb') as fp:
+            md5 = hashlib.md5(fp.read())
+        print('Parsing "%s"...' % f)
+        print('MD5: %s' % md5.hexdigest())
+        img = parse_image(f)
+        dvs.append([(addr, bytes(data)) for addr, data in img.flash_dv])
+
+    print('Programming %u boards...' % len(boards))
+    t0 = time.time()
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(len(boards), initializer=_gang_init,
+                  initargs=(dvs,)) as pool:
+        results = pool.map(gang_worker, [(path, rv) for path, _ in boards])
+    elapsed = time.time() - t0
+
+    failures = 0
+    print('%-16s %-26s %-6s %8s' % ('USB Path', 'Serial Number', 'Result',
+                                    'Time'))
+    for (usb_path, serial_num), (_, error, dt) in zip(boards, results):
+        print('%-16s %-26s %-6s %7.2fs%s' %
+              (usb_path, serial_num, 'FAIL' if error else 'PASS', dt,
+               '  ' + error if error else ''))
+        if error:
+            failures += 1
+    print('%u of %u boards passed in %.2f seconds.'
+          % (len(boards) - failures, len(boards), elapsed))
+    return failures
+
+
 def main(rv):
+    # Start parsing the images in the background while we find the target.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        flash_future = concurrent.futures.Future()
+        prep_future  = None
+        if rv.flash:
+            prep_future = executor.submit(prepare_images, rv.flash,
+                                          flash_future, rv.flash_inactive)
+        try:
+            _main_with_images(rv, flash_future, prep_future)
+        finally:
+            flash_future.cancel()
+
+
+def _main_with_images(rv, flash_future, prep_future):
+
     # Dump all debuggers if requested.
     if rv.dump_debuggers:
         psdb.probes.dump_probes()
@@ -79,6 +263,12 @@ def main(rv):
                 print('Warning: option "%s" is %u not %u.'
                       % (k, final_opts[k], v))
 
+    # Let the image preparation thread lay out the blocks.  This has to wait
+    # until the option bytes are set, since they can change the flash geometry
+    # (for instance, the sector size depends on DBANK on the STM32G4).
+    if prep_future:
+        flash_future.set_result(target.flash)
+
     # Erase the flash if requested.
     if rv.erase:
         target.flash.erase_all()
@@ -86,15 +276,11 @@ def main(rv):
 
     # Write a new ELF image to flash if requested.
     if rv.flash:
-        dv = []
-        for f in rv.flash:
-            print('Burning "%s"...' % f)
-            md5 = hashlib.md5(open(f, 'rb').read())
-            print('MD5: %s' % md5.hexdigest())
-            img = parse_image(f)
-            pdv = target.flash.prune_dv(img.flash_dv)
-            dv  = psdb.elf.dv.merge_dvs(dv, pdv)
-        target.flash.burn_dv(dv, verbose=True, bank_swap=rv.flash_inactive)
+        lines, blocks = prep_future.result()
+        for l in lines:
+            print(l)
+        target.flash.burn_blocks(blocks, verbose=True, diff=rv.diff,
+                                 loader=rv.loader, compress=rv.compress)
         print('Flash completed successfully.')
         target.reset_halt()
 
@@ -104,7 +290,9 @@ def main(rv):
         with open(rv.write_raw_binary, 'rb') as f:
             data = f.read()
         target.flash.burn_dv([(target.flash.mem_base, data)],
-                             verbose=True, bank_swap=rv.flash_inactive)
+                             verbose=True, bank_swap=rv.flash_inactive,
+                             diff=rv.diff, loader=rv.loader,
+                             compress=rv.compress)
         print('Flash completed successfully.')
         target.reset_halt()
 
@@ -130,6 +318,7 @@ def _main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--dump-debuggers', '-d', action='store_true')
     parser.add_argument('--usb-path')
+    parser.add_argument('--gang', metavar='PROBES|all')
     parser.add_argument('--halt', action='store_true')
     parser.add_argument('--srst', action='store_true')
     parser.add_argument('--connect-under-reset', action='store_true')
@@ -137,6 +326,9 @@ def _main():
     parser.add_argument('--flash', action='append')
     parser.add_argument('--write-raw-binary')
     parser.add_argument('--flash-inactive', action='store_true')
+    parser.add_argument('--diff', action='store_true')
+    parser.add_argument('--loader', action='store_true')
+    parser.add_argument('--compress', action='store_true')
     parser.add_argument('--erase', action='store_true')
     parser.add_argument('--mem-dump', '-m')
     parser.add_argument('--probe-freq', type=int, default=1000000)
@@ -146,8 +338,21 @@ def _main():
     parser.add_argument('--option', '-o', nargs=2, action='append')
     rv = parser.parse_args()
 
+    if rv.gang:
+        if not rv.flash:
+            parser.error('--gang requires --flash')
+        unsupported = [opt for attr, opt in GANG_UNSUPPORTED
+                       if getattr(rv, attr)]
+        if unsupported:
+            parser.error('%s not supported with --gang'
+                         % ', '.join(unsupported))
+
     try:
-        main(rv)
+        if rv.gang:
+            if gang_main(rv):
+                sys.exit(1)
+        else:
+            main(rv)
     except psdb.ProbeException as e:
         print(e)
         sys.exit(1)
@@ -384,6 +384,7 @@ def main(rv):
     target = probe.probe(verbose=rv.verbose,
                          connect_under_reset=rv.connect_under_reset)
     target.set_max_tck_freq()
+    target.enable_mem_cache()
 
     c = target.cpus[rv.cpu]
     if c.bpu is not None:
@@ -1,4 +1,5 @@
 # Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+import binascii
 
 
 class HEXFileException(Exception):
@@ -10,41 +11,75 @@ class InvalidFormatException(HEXFileException):
 
 
 class HEXFile(object):
+    '''
+    Parses an Intel HEX file.  The path may also be an already-open file
+    object, which is read a line at a time.  Data records are decoded with
+    binascii and contiguous records are coalesced as they are parsed, so
+    flash_dv holds one (addr, data) entry per maximal run of contiguous data
+    rather than one per record.
+    '''
     def __init__(self, path):
         self.path     = path
-        self.hex_file = open(self.path, 'r')
         self.flash_dv = []
 
-        self._parse()
+        if hasattr(path, 'read'):
+            self.path     = getattr(path, 'name', '<stream>')
+            self.hex_file = path
+            self._parse()
+        else:
+            with open(path, 'r') as self.hex_file:
+                self._parse()
 
     def _raise_inval_format(self, i, err):
         raise InvalidFormatException('%s:%u: %s' % (self.path, i, err))
 
     def _parse(self):
-        base_address = 0
         try:
-            lines = self.hex_file.readlines()
+            self._parse_lines()
         except UnicodeDecodeError:
             self._raise_inval_format(0, 'Non-UTF8 characters.')
-        for i, l in enumerate(lines):
-            l = l.strip()
-            if l[0] != ':':
-                self._raise_inval_format(i, 'Expected ":".')
-            if len(l) < 11:
-                self._raise_inval_format(i, 'Line too short.')
-            l = l[1:]
-            if len(l) % 2:
-                self._raise_inval_format(i, 'Odd record length.')
-            record_hex  = [int(l[i:i+2], 16) for i in range(0, len(l), 2)]
-            byte_count  = record_hex[0]
-            offset      = (record_hex[1] << 8) | record_hex[2]
-            record_type = record_hex[3]
-            data        = bytes(record_hex[4:-1])
-            if (sum(record_hex) & 0xFF):
-                self._raise_inval_format(i, 'Invalid checksum.')
 
+    def _decode_record(self, i, l):
+        '''
+        Decodes and validates a single record, returning the tuple:
+
+            (byte_count, offset, record_type, data)
+        '''
+        l = l.strip()
+        if l[:1] not in (':', b':'):
+            self._raise_inval_format(i, 'Expected ":".')
+        if len(l) < 11:
+            self._raise_inval_format(i, 'Line too short.')
+        if len(l) % 2 == 0:
+            self._raise_inval_format(i, 'Odd record length.')
+        try:
+            record = binascii.unhexlify(l[1:])
+        except (binascii.Error, ValueError):
+            self._raise_inval_format(i, 'Invalid hex digits.')
+        if sum(record) & 0xFF:
+            self._raise_inval_format(i, 'Invalid checksum.')
+
+        data = record[4:-1]
+        if record[0] != len(data):
+            self._raise_inval_format(i, 'Byte count mismatch.')
+
+        return record[0], (record[1] << 8) | record[2], record[3], data
+
+    def _parse_lines(self):
+        base_address = 0
+        run_addr     = None
+        run_data     = bytearray()
+        for i, l in enumerate(self.hex_file):
+            byte_count, offset, record_type, data = self._decode_record(i, l)
             if record_type == 0x00:
-                self.flash_dv.append((base_address + offset, data))
+                addr = base_address + offset
+                if run_addr is not None and run_addr + len(run_data) == addr:
+                    run_data += data
+                    continue
+                if run_addr is not None:
+                    self.flash_dv.append((run_addr, bytes(run_data)))
+                run_addr = addr
+                run_data = bytearray(data)
             elif record_type == 0x01:
                 break
             elif record_type == 0x02:
@@ -70,3 +105,6 @@ class HEXFile(object):
             else:
                 self._raise_inval_format(i, 'Unrecognied type %u record.'
                                          % record_type)
+
+        if run_addr is not None:
+            self.flash_dv.append((run_addr, bytes(run_data)))
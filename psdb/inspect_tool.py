@@ -388,6 +388,7 @@ def _main():
 
     # Set the max clock frequency.
     args.target.set_max_tck_freq()
+    args.target.enable_mem_cache()
 
     # Interact with the UI.
     tgcurses.wrapper(main, args)
@@ -0,0 +1,218 @@
+# Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+import psdb
+
+import bisect
+
+
+class MemCache(object):
+    '''
+    A page cache for the memory behind a MemAP.  Only the regions passed to
+    the constructor (typically RAM and flash) are ever cached; everything else,
+    in particular peripheral space, is always read from the target.
+
+    The cache is only consulted while every CPU known to the debug probe is
+    halted, since otherwise memory may change underneath us.  The owner is
+    responsible for calling invalidate() whenever the target may have modified
+    memory: when a CPU is resumed, stepped or reset and whenever anything is
+    written through the AP (which includes all flash operations).  Other bus
+    masters such as DMA can still modify memory while the CPUs are halted,
+    which is why the cache must be explicitly enabled.
+    '''
+    PAGE_SIZE = 0x400
+
+    def __init__(self, ap, regions):
+        self.ap      = ap
+        self.regions = sorted(regions)
+        self.bases   = [r[0] for r in self.regions]
+        self.pages   = {}
+        self.hits    = 0
+        self.misses  = 0
+
+    def is_active(self):
+        cpus = self.ap.db.cpus
+        return bool(cpus) and all(c.flags & psdb.cpus.cortex.FLAG_HALTED
+                                  for c in cpus)
+
+    def invalidate(self):
+        self.pages = {}
+
+    def _find_region(self, addr, size):
+        index = bisect.bisect(self.bases, addr) - 1
+        if index < 0:
+            return None
+        base, end = self.regions[index]
+        if addr + size > end:
+            return None
+        return base, end
+
+    def covers(self, addr, size):
+        '''
+        Returns True if the whole range lies in a single cacheable region and
+        the cache is currently allowed to serve reads.
+        '''
+        return (size > 0 and self._find_region(addr, size) is not None and
+                self.is_active())
+
+    def _get_page(self, page_addr, region):
+        page = self.pages.get(page_addr)
+        if page is None:
+            start = max(page_addr, region[0])
+            end   = min(page_addr + self.PAGE_SIZE, region[1])
+            page  = (start, self.ap.db.read_bulk(start, end - start,
+                                                 self.ap.ap_num))
+            self.pages[page_addr] = page
+            self.misses += 1
+        else:
+            self.hits += 1
+        return page
+
+    def read(self, addr, size):
+        '''
+        Reads a range that covers() returned True for, fetching whole pages
+        from the target as needed.
+        '''
+        region = self._find_region(addr, size)
+        data   = bytearray(size)
+        pos    = 0
+        while pos < size:
+            a           = addr + pos
+            page_addr   = a & ~(self.PAGE_SIZE - 1)
+            start, page = self._get_page(page_addr, region)
+            offset      = a - start
+            count       = min(size - pos, len(page) - offset)
+            data[pos:pos + count] = page[offset:offset + count]
+            pos        += count
+        return bytes(data)
+
+
+class ImmutableRegion(object):
+    def __init__(self, ap_num, base, size, persistent):
+        self.ap_num     = ap_num
+        self.base       = base
+        self.end        = base + size
+        self.persistent = persistent
+
+
+class ImmutableCache(object):
+    '''
+    A cache for address ranges whose contents can't change while we are
+    connected to the target: CoreSight ID blocks and ROM tables, UIDs, flash
+    size and package words, OTP areas and so on.  Ranges are declared with
+    declare() and cached in aligned lines the first time any part of a line is
+    read through any path; unlike the MemCache this doesn't depend on the
+    CPUs being halted.
+
+    Persistent ranges (and their cached contents) survive a reconnect to a
+    target with the same DPIDR, so that flows which reset the MCU and reprobe
+    it, for instance after an option byte load, don't have to re-read them.
+    Writes that overlap a cached line discard the line.
+    '''
+    LINE_SIZE = 0x40
+
+    def __init__(self, db):
+        self.db      = db
+        self.dpidr   = None
+        self.regions = []
+        self.lines   = {}
+        self.hits    = 0
+        self.misses  = 0
+
+    def declare(self, ap_num, base, size, persistent=True):
+        for r in self.regions:
+            if (r.ap_num, r.base, r.end) == (ap_num, base, base + size):
+                r.persistent = r.persistent and persistent
+                return r
+        r = ImmutableRegion(ap_num, base, size, persistent)
+        self.regions.append(r)
+        return r
+
+    def export(self, ap_num, base, size):
+        '''
+        Returns the list of (addr, data) lines cached from the declared range.
+        '''
+        return [(k[1], v[2]) for k, v in sorted(self.lines.items())
+                if k[0] == ap_num and v[0].base == base and
+                v[0].end == base + size]
+
+    def preload(self, ap_num, base, size, lines):
+        '''
+        Declares a persistent range and fills it with (addr, data) lines
+        previously returned by export(), for instance from an on-disk cache.
+        '''
+        r = self.declare(ap_num, base, size)
+        for addr, data in lines:
+            self.lines[(ap_num, addr)] = (r, addr, bytes(data))
+
+    def reconnect(self, dpidr, keep_persistent):
+        '''
+        Invoked after connecting to the target.  Persistent ranges are kept if
+        requested and we are still connected to a target with the same DPIDR;
+        everything else is forgotten.
+        '''
+        if keep_persistent and dpidr == self.dpidr:
+            self.regions = [r for r in self.regions if r.persistent]
+        else:
+            self.regions = []
+        self.dpidr = dpidr
+
+        lines = {}
+        for k, v in self.lines.items():
+            if v[0] in self.regions:
+                lines[k] = v
+        self.lines = lines
+
+    def invalidate(self, addr=None, size=None):
+        '''
+        Discards cached lines overlapping the specified range on any AP, or all
+        cached lines if no range is specified.  The declared ranges remain.
+        '''
+        if addr is None:
+            self.lines = {}
+            return
+
+        end   = addr + size
+        lines = {}
+        for k, v in self.lines.items():
+            start = k[1]
+            if start + len(v[2]) <= addr or end <= start:
+                lines[k] = v
+        self.lines = lines
+
+    def _find_region(self, ap_num, addr, size):
+        for r in self.regions:
+            if r.ap_num == ap_num and r.base <= addr and addr + size <= r.end:
+                return r
+        return None
+
+    def read(self, ap_num, addr, size):
+        '''
+        Returns the contents of the range if it lies within a single declared
+        region, fetching any lines not yet cached, or None if the range isn't
+        cacheable.  Lines are clipped to the region so that nothing outside a
+        declared range is ever read.
+        '''
+        if not self.regions or size <= 0:
+            return None
+        r = self._find_region(ap_num, addr, size)
+        if r is None:
+            return None
+
+        data = bytearray(size)
+        pos  = 0
+        while pos < size:
+            a     = addr + pos
+            start = max(a & ~(self.LINE_SIZE - 1), r.base)
+            line  = self.lines.get((ap_num, start))
+            if line is None:
+                end  = min((a & ~(self.LINE_SIZE - 1)) + self.LINE_SIZE, r.end)
+                line = (r, start, self.db.read_bulk(start, end - start,
+                                                    ap_num))
+                self.lines[(ap_num, start)] = line
+                self.misses += 1
+            else:
+                self.hits += 1
+            offset = a - start
+            count  = min(size - pos, len(line[2]) - offset)
+            data[pos:pos + count] = line[2][offset:offset + count]
+            pos   += count
+        return bytes(data)
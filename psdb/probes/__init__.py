@@ -1,59 +1,120 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
 from .xds110 import xds110
 from .stlink import stlink_v2_1, stlink_v3
+from .sim import sim
 import psdb
 
 
 PROBES = None
 
 
+def _enumerate(usb_path=None):
+    return (xds110.enumerate(usb_path) +
+            stlink_v2_1.enumerate(usb_path) +
+            stlink_v3.enumerate(usb_path) +
+            sim.enumerate(usb_path)
+            )
+
+
 def get_probes():
+    '''
+    Returns a list of ProbeDescriptor objects for all attached probes.  The
+    probes are found using their USB descriptors only; a probe is opened and
+    queried when its descriptor's open() method is called.
+    '''
     global PROBES
 
     if not PROBES:
-        PROBES = (xds110.enumerate() +
-                  stlink_v2_1.enumerate() +
-                  stlink_v3.enumerate()
-                  )
+        PROBES = _enumerate()
     return PROBES
 
 
+def close_probes():
+    '''
+    Closes all enumerated probes and forgets them, so that they can be opened
+    by other processes or re-enumerated from scratch.
+    '''
+    global PROBES
+
+    for p in PROBES or []:
+        p.close()
+    PROBES = None
+
+
+def _open_one(probes, what):
+    if not probes:
+        raise psdb.ProbeException('%s not found.' % what)
+    if len(probes) > 1:
+        raise psdb.ProbeException('%s is ambiguous.' % what)
+    return probes[0].open()
+
+
+def open_by_path(usb_path):
+    '''
+    Opens only the probe at the specified USB path, without enumerating or
+    opening any other probes and without using the PROBES list.  This is used
+    when several processes each drive a different probe.
+    '''
+    return _open_one(_enumerate(usb_path), 'Path "%s"' % usb_path)
+
+
 def dump_probes():
     for p in get_probes():
-        p.show_info()
+        try:
+            p.show_info()
+        except psdb.ProbeException as e:
+            print('%s: %s' % (p.usb_path, e))
 
 
 def find_by_serial_number(serial_number):
     p = [p for p in get_probes() if p.serial_num == serial_number]
-    if not p:
-        raise psdb.ProbeException('Serial number "%s" not found.'
-                                  % serial_number)
-    if len(p) > 1:
-        raise psdb.ProbeException('Serial number "%s" is ambiguous.'
-                                  % serial_number)
-    return p[0]
+    return _open_one(p, 'Serial number "%s"' % serial_number)
 
 
 def find_by_path(usb_path):
     p = [p for p in get_probes() if p.usb_path == usb_path]
-    if not p:
-        raise psdb.ProbeException('Path "%s" not found.' % usb_path)
-    if len(p) > 1:
-        raise psdb.ProbeException('Path "%s" is ambiguous.' % usb_path)
-    return p[0]
+    return _open_one(p, 'Path "%s"' % usb_path)
+
+
+def _usable_probes(probes):
+    '''
+    Opens each of the probes and returns the ones that opened successfully,
+    printing the reason for any that didn't, such as an XDS110 with firmware
+    that is too old.
+    '''
+    usable = []
+    for p in probes:
+        try:
+            p.open()
+            usable.append(p)
+        except psdb.ProbeException as e:
+            print('%s: %s' % (p.usb_path, e))
+    return usable
 
 
 def find_default(serial_number=None, usb_path=None):
+    '''
+    Returns the probe with the specified serial number or USB path, or the
+    only attached probe if neither is specified.  A single attached probe is
+    opened without checking anything else.  If there are several, all of them
+    are opened and the ones that can't be used are ignored, so that for
+    instance an XDS110 with old firmware doesn't prevent selecting the only
+    other probe.
+    '''
     if serial_number:
         return find_by_serial_number(serial_number)
     elif usb_path:
         return find_by_path(usb_path)
-    elif get_probes():
-        if len(get_probes()) == 1:
-            return get_probes()[0]
 
+    probes = get_probes()
+    if len(probes) > 1:
+        probes = _usable_probes(probes)
+    if len(probes) == 1:
+        return probes[0].open()
+    elif probes:
         print('Found probes:')
-        dump_probes()
+        for p in probes:
+            p.show_info()
         raise psdb.ProbeException('Multiple probes found.')
 
     raise psdb.ProbeException('No compatible debug probe found.')
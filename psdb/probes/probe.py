@@ -1,18 +1,112 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
 import psdb
 import psdb.targets
+from .topology import Topology
 
 import time
 from builtins import range
 from struct import pack, unpack
 
 
+SIZE_FORMATS = {8  : 'B',
+                16 : 'H',
+                32 : 'I',
+                }
+
+
+def _coalesce_ops(ops):
+    '''
+    Generator that groups a list of exec_multi() operations into runs of
+    contiguous accesses of the same type, width and AP that don't cross a 1K
+    TAR auto-increment page.  Yields (ap_num, addr, width, n, values) tuples
+    where values is None for reads or the list of values to write.
+    '''
+    i = 0
+    while i < len(ops):
+        op     = ops[i]
+        ap_num = op[0]
+        addr   = op[1]
+        width  = op[2]
+        size   = width // 8
+        j      = i + 1
+        while j < len(ops):
+            nop = ops[j]
+            end = addr + (j - i)*size
+            if (len(nop) != len(op) or nop[0] != ap_num or nop[2] != width or
+                    nop[1] != end or (end & 0x3FF) == 0):
+                break
+            j += 1
+
+        if len(op) == 3:
+            yield ap_num, addr, width, j - i, None
+        else:
+            yield ap_num, addr, width, j - i, [o[3] for o in ops[i:j]]
+        i = j
+
+
+class PipelinedContextManager(object):
+    def __init__(self, probe):
+        self.probe = probe
+
+    def __enter__(self):
+        self.probe._pipeline_begin()
+
+    def __exit__(self, type, value, traceback):
+        self.probe._pipeline_end(type is None)
+
+
+class ProbeDescriptor(object):
+    '''
+    A probe found during enumeration that hasn't been opened yet.  Creating a
+    descriptor doesn't communicate with the probe; the probe object itself is
+    only constructed, and the probe only claimed and queried, when open() is
+    called.  The factory is called with no arguments to create the probe.
+    '''
+    def __init__(self, name, usb_path, serial_num, factory):
+        self.name        = name
+        self.usb_path    = usb_path
+        self._serial_num = serial_num
+        self.factory     = factory
+        self.probe       = None
+
+    @property
+    def serial_num(self):
+        return self._serial_num
+
+    def open(self):
+        '''
+        Returns the probe object, creating it on first use.
+        '''
+        if self.probe is None:
+            self.probe = self.factory()
+        return self.probe
+
+    def close(self):
+        if self.probe is not None:
+            self.probe.close()
+            self.probe = None
+
+    def show_info(self):
+        self.open().show_info()
+
+    def __str__(self):
+        return '%s Debug Probe at %s' % (self.name, self.usb_path)
+
+
 class Probe(object):
     def __init__(self, name):
-        self.name   = name
-        self.aps    = {}
-        self.cpus   = []
-        self.target = None
+        self.name      = name
+        self.aps       = {}
+        self.cpus      = []
+        self.target    = None
+        self.immutable = psdb.mem_cache.ImmutableCache(self)
+
+    def close(self):
+        '''
+        Releases the host resources held by the probe, such as the claimed USB
+        interface, so that the probe can be opened again by another process.
+        '''
+        pass
 
     def assert_srst(self):
         raise NotImplementedError
@@ -29,6 +123,36 @@ class Probe(object):
     def _bulk_read_8(self, addr, n, ap_num=0):
         raise NotImplementedError
 
+    def _pipeline_begin(self):
+        '''
+        Invoked when entering a pipelined() context.  Probes that can defer
+        status checking should override this.
+        '''
+        pass
+
+    def _pipeline_end(self, check_status):
+        '''
+        Invoked when leaving a pipelined() context.  If check_status is True,
+        any deferred transfer status should be checked and an exception raised
+        if an error occurred; if False, an exception is already propagating out
+        of the context and the deferred status should be discarded.
+        '''
+        pass
+
+    def pipelined(self):
+        '''
+        Returns a context manager inside of which the probe is allowed to queue
+        up writes and send them back to back, deferring the check of their
+        transfer status until either a read is performed or the context is
+        exited.  Errors are still raised, but possibly from a later operation
+        than the one that failed; the probe will identify the failing operation
+        in the exception if it can.
+
+        Probes that can't defer status checks simply execute everything
+        synchronously.
+        '''
+        return PipelinedContextManager(self)
+
     def read_32(self, addr, ap_num=0):
         return unpack('<I', self._bulk_read_32(addr, 1, ap_num=ap_num))[0]
 
@@ -55,71 +179,155 @@ class Probe(object):
         transactions will take place to handle the TAR auto-increment issue.
 
         Note: this helper relies on the probe implementing _bulk_read_8() and
-        _bulk_read_32() methods.  The probe should override this method if it
-        needs to do a different type of offload.
+        _bulk_read_32() methods.  The probe should override read_bulk_into() if
+        it needs to do a different type of offload.
+        '''
+        buf = bytearray(size)
+        self.read_bulk_into(buf, addr, ap_num)
+        return bytes(buf)
+
+    def read_bulk_into(self, buf, addr, ap_num=0):
+        '''
+        Do a bulk read operation from the specified address, filling the
+        preallocated writable buffer buf (a bytearray, memoryview or other
+        object supporting the buffer protocol).  The number of bytes read is
+        the size of buf in bytes.  Each transaction's data is copied directly
+        into place so the cost of assembling a large read stays linear.
         '''
+        mv   = memoryview(buf).cast('B')
+        size = len(mv)
+
         # Handle empty transfers.
         if not size:
-            return bytes(b'')
+            return
 
         # For short misaligned transfers, just do a single 8-bit access
         # transaction.
         if ((addr % 4) or (size % 4)) and size <= 64:
-            return self._bulk_read_8(addr, size, ap_num)
+            mv[:] = self._bulk_read_8(addr, size, ap_num)
+            return
 
         # For long transfers, align with 8-bit, then do 32-bit, then do 8-bit
         # for the tail.
-        mem         = bytes(b'')
-        align_count = (4 - addr) & 3
-        count       = min(align_count, size)
+        pos   = 0
+        count = min((4 - addr) & 3, size)
         if count:
-            mem  += self._bulk_read_8(addr, count, ap_num)
-            addr += count
-            size -= count
-        while size >= 4:
-            count = min(size, 0x400 - (addr & 0x3FF))//4
-            mem  += self._bulk_read_32(addr, count, ap_num)
-            addr += count*4
-            size -= count*4
-        if size:
-            mem += self._bulk_read_8(addr, size, ap_num)
-        return mem
+            mv[:count] = self._bulk_read_8(addr, count, ap_num)
+            pos = count
+        while size - pos >= 4:
+            a     = addr + pos
+            count = min(size - pos, 0x400 - (a & 0x3FF))//4
+            end   = pos + count*4
+            mv[pos:end] = self._bulk_read_32(a, count, ap_num)
+            pos   = end
+        if pos < size:
+            mv[pos:] = self._bulk_read_8(addr + pos, size - pos, ap_num)
 
     def write_bulk(self, data, addr, ap_num=0):
         '''
         Note: this helper relies on the probe implementing _bulk_write_8() and
         _bulk_write_32() methods.  The probe should override this method if it
         needs to do a different type of offload.
+
+        The data is never copied; each transaction is handed a memoryview slice
+        of the caller's buffer.
         '''
+        mv   = memoryview(data).cast('B')
+        size = len(mv)
+
         # Handle empty transfers.
-        if not data:
+        if not size:
             return
 
         # For short misaligned transfers, just do a single 8-bit bulk
         # transaction.
-        if ((addr % 4) or (len(data) % 4)) and len(data) <= 64:
-            return self._bulk_write_8(data, addr, ap_num)
+        if ((addr % 4) or (size % 4)) and size <= 64:
+            return self._bulk_write_8(mv, addr, ap_num)
 
         # For long transfers, align with 8-bit, then do 32-bit, then do 8-bit
         # for the tail.
-        align_count = (4 - addr) & 3
-        count       = min(align_count, len(data))
+        pos   = 0
+        count = min((4 - addr) & 3, size)
         if count:
-            self._bulk_write_8(data[:count], addr, ap_num)
-            addr += count
-            data  = data[count:]
-        while len(data) >= 4:
-            count = min(len(data), 0x400 - (addr & 0x3FF))//4
-            self._bulk_write_32(data[:count*4], addr, ap_num)
-            addr += count*4
-            data  = data[count*4:]
-        if data:
-            self._bulk_write_8(data, addr, ap_num)
+            self._bulk_write_8(mv[:count], addr, ap_num)
+            pos = count
+        while size - pos >= 4:
+            a     = addr + pos
+            count = min(size - pos, 0x400 - (a & 0x3FF))//4
+            end   = pos + count*4
+            self._bulk_write_32(mv[pos:end], a, ap_num)
+            pos   = end
+        if pos < size:
+            self._bulk_write_8(mv[pos:], addr + pos, ap_num)
+
+    def exec_multi(self, ops):
+        '''
+        Executes a list of discontiguous memory operations, in order, using as
+        few probe transactions as possible.  Each operation is either a read
+        tuple:
+
+            (ap_num, addr, width)
+
+        or a write tuple:
+
+            (ap_num, addr, width, value)
+
+        where width is the access width in bits (8, 16 or 32).  Returns a list
+        of the values read, in the same order as the read operations appeared.
+
+        This generic implementation coalesces runs of contiguous accesses of the
+        same type into bulk transfers and executes all writes in a pipelined()
+        context.  Probes that can batch arbitrary DAP transactions should
+        override this method.
+        '''
+        results = []
+        with self.pipelined():
+            for ap_num, addr, width, n, values in _coalesce_ops(ops):
+                fmt = '<%u%s' % (n, SIZE_FORMATS[width])
+                if values is None:
+                    if n == 1:
+                        f = getattr(self, 'read_%u' % width)
+                        results.append(f(addr, ap_num))
+                    else:
+                        f = getattr(self, '_bulk_read_%u' % width)
+                        results.extend(unpack(fmt, f(addr, n, ap_num)))
+                elif n == 1:
+                    f = getattr(self, 'write_%u' % width)
+                    f(values[0], addr, ap_num)
+                else:
+                    f = getattr(self, '_bulk_write_%u' % width)
+                    f(pack(fmt, *values), addr, ap_num)
+        return results
+
+    def read_multi(self, ops):
+        '''
+        Performs a list of (ap_num, addr, width) reads using as few probe
+        transactions as possible and returns the list of values read.
+        '''
+        assert all(len(op) == 3 for op in ops)
+        return self.exec_multi(ops)
+
+    def write_multi(self, ops):
+        '''
+        Performs a list of (ap_num, addr, width, value) writes using as few
+        probe transactions as possible.
+        '''
+        assert all(len(op) == 4 for op in ops)
+        self.exec_multi(ops)
 
     def halt(self):
         for c in self.cpus:
             c.halt()
 
+    def inval_mem_caches(self):
+        '''
+        Discards the contents of all AP memory caches.  Since several APs may
+        view the same memory, this is done whenever anything is written
+        through any AP or any CPU changes state.
+        '''
+        for ap in self.aps.values():
+            ap.inval_cache()
+
     def _probe_dp_v1(self, verbose=False):
         '''Probe all 256 APs for a non-zero IDR.'''
         self.aps = {}
@@ -137,7 +345,8 @@ class Probe(object):
         '''Just probe as though it were a v1 DP for now.'''
         self._probe_dp_v1(verbose=verbose)
 
-    def probe(self, verbose=False, connect_under_reset=False):
+    def probe(self, verbose=False, connect_under_reset=False,
+              keep_immutable=False, use_topology_cache=True):
         '''
         First discovers which APs are attached to the debug probe and then
         performs component topology detection on each AP.  Finally, we attempt
@@ -158,6 +367,16 @@ class Probe(object):
         support probing under SRST) and then component probing will take place
         *while the MCU is running*.  Finally, the MCU will be halted wherever
         it happens to be running and we return.
+
+        If keep_immutable is True and the DPIDR hasn't changed, the contents
+        of persistent immutable regions (CoreSight ID blocks and ROM tables,
+        UIDs and so on) cached during the previous probe are reused instead of
+        being read again.
+
+        If use_topology_cache is True, the AP map, component topology and
+        target class found for a target with the same DPIDR and signature on a
+        previous run are loaded from the on-disk cache, skipping the AP scan
+        and ROM table walk, and the cache is updated after a full probe.
         '''
         if connect_under_reset:
             self.assert_srst()
@@ -165,16 +384,24 @@ class Probe(object):
             self.deassert_srst()
 
         self.connect()
+        self.immutable.reconnect(self.dpidr, keep_immutable)
 
         dpver = ((self.dpidr & 0x0000F000) >> 12)
-        if dpver == 1:
-            self._probe_dp_v1(verbose=verbose)
-        elif dpver == 2:
-            self._probe_dp_v2(verbose=verbose)
-        else:
+        if dpver not in (1, 2):
             raise psdb.ProbeException('Unsupported DP version %u (0x%08X)' % (
                                       dpver, self.dpidr))
 
+        topology = Topology.load(self) if use_topology_cache else None
+        if topology:
+            if verbose:
+                print('  Using cached topology for %s' %
+                      topology.target_class.__name__)
+            topology.restore(self)
+        elif dpver == 1:
+            self._probe_dp_v1(verbose=verbose)
+        else:
+            self._probe_dp_v2(verbose=verbose)
+
         psdb.targets.pre_probe(self, verbose)
 
         self.cpus = []
@@ -189,23 +416,29 @@ class Probe(object):
 
             for c in self.cpus:
                 c.inval_halted_state()
-                while not c.is_halted():
-                    pass
+                psdb.util.wait(c.is_halted,
+                               msg='Timed out waiting for CPU to halt after '
+                                   'reset')
 
             for c in self.cpus:
                 c.disable_reset_vector_catch()
         else:
             self.halt()
 
-        self.target = psdb.targets.probe(self)
+        self.target = psdb.targets.probe(
+                self, first=topology.target_class if topology else None)
         assert self.target
 
+        if use_topology_cache and not topology:
+            Topology.save(self)
+
         if verbose:
             print('  Identified target %s' % self.target)
 
         return self.target
 
     def srst_target(self):
+        self.inval_mem_caches()
         self.assert_srst()
         time.sleep(0.00001)
         self.deassert_srst()
@@ -0,0 +1,6 @@
+# Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+from . import sim
+
+
+__all__ = ['sim',
+           ]
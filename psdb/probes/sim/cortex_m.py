@@ -0,0 +1,174 @@
+# Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+from .memory import CoreSightRegion, ROMTableRegion
+
+
+# DHCSR bits.
+C_DEBUGEN   = (1 << 0)
+C_HALT      = (1 << 1)
+C_STEP      = (1 << 2)
+C_MASKINTS  = (1 << 3)
+S_REGRDY    = (1 << 16)
+S_HALT      = (1 << 17)
+S_RETIRE_ST = (1 << 24)
+S_RESET_ST  = (1 << 25)
+
+# DEMCR bits.
+VC_CORERESET = (1 << 0)
+
+# AIRCR bits.
+VECTRESET    = (1 << 0)
+SYSRESETREQ  = (1 << 2)
+
+# DCRSR selectors for the core registers that need special treatment.
+REG_SP   = 13
+REG_PC   = 15
+REG_XPSR = 16
+REG_MSP  = 17
+REG_LR   = 14
+
+# All of the DCRSR selectors that hold state: r0-r12, sp, lr, pc, xpsr, msp,
+# psp, CONTROL/FAULTMASK/BASEPRI/PRIMASK, fpscr and s0-s31.
+CORE_REG_SELECTORS = list(range(19)) + [20, 33] + list(range(64, 96))
+
+
+class CPU(object):
+    '''
+    The debug-visible state of a simulated Cortex-M CPU.  The simulator doesn't
+    execute instructions; a running CPU simply stays where it is until it is
+    halted again by the debugger.
+    '''
+    def __init__(self, system, vector_base):
+        self.system      = system
+        self.vector_base = vector_base
+        self.regs        = {sel: 0 for sel in CORE_REG_SELECTORS}
+        self.dhcsr       = 0
+        self.dcrdr       = 0
+        self.demcr       = 0
+        self.halted      = False
+        self.in_reset    = False
+        self.reset_st    = False
+
+    def reset(self):
+        '''
+        Performs a core reset: the core registers are reloaded from the vector
+        table and the CPU either runs or, if reset vector catch is enabled,
+        halts on the first instruction.  Debug registers are preserved.
+        '''
+        memory = self.system.memory
+        self.regs = {sel: 0 for sel in CORE_REG_SELECTORS}
+        self.regs[REG_MSP]  = memory.read_32(self.vector_base + 0) & ~3
+        self.regs[REG_PC]   = memory.read_32(self.vector_base + 4) & ~1
+        self.regs[REG_XPSR] = 0x01000000
+        self.regs[REG_LR]   = 0xFFFFFFFF
+        self.reset_st       = True
+        self.halted         = bool((self.dhcsr & C_DEBUGEN) and
+                                   (self.demcr & VC_CORERESET))
+
+    def read_dhcsr(self):
+        v = (self.dhcsr & (C_DEBUGEN | C_STEP | C_MASKINTS)) | S_REGRDY
+        if self.halted:
+            v |= C_HALT | S_HALT
+        if self.reset_st or self.in_reset:
+            v |= S_RESET_ST
+        if not self.halted and not self.in_reset:
+            v |= S_RETIRE_ST
+
+        # S_RESET_ST is sticky and cleared by reading DHCSR.
+        self.reset_st = False
+        return v
+
+    def write_dhcsr(self, v):
+        if (v >> 16) != 0xA05F:
+            return
+
+        self.dhcsr = (v & 0x0000000F)
+        if not (v & C_DEBUGEN):
+            self.halted = False
+        elif v & C_HALT:
+            self.halted = True
+        elif self.halted and not self.in_reset:
+            if v & C_STEP:
+                self.regs[REG_PC] = (self.regs[REG_PC] + 2) & 0xFFFFFFFF
+            else:
+                self.halted = False
+
+    def write_dcrsr(self, v):
+        if not self.halted:
+            return
+
+        sel = (v & 0x7F)
+        if sel == REG_SP:
+            sel = REG_MSP
+        if sel not in self.regs:
+            return
+
+        if v & (1 << 16):
+            self.regs[sel] = self.dcrdr
+        else:
+            self.dcrdr = self.regs[sel]
+
+
+class SCSRegion(CoreSightRegion):
+    '''
+    The Cortex-M System Control Space.  The debug registers are backed by the
+    CPU object so that they survive a system reset; everything else in the
+    SCS behaves like RAM.
+    '''
+    def __init__(self, name, base, pidr, cpu, cpuid, resets=None):
+        resets = dict(resets or {})
+        resets[0xD00] = cpuid
+        super().__init__(name, base, 0xB105E00D, pidr, resets)
+        self.cpu = cpu
+
+    def read_reg(self, offset):
+        if offset == 0xD0C:
+            return 0xFA050000 | (self.regs.get(offset, 0) & 0x00000700)
+        if offset == 0xDF0:
+            return self.cpu.read_dhcsr()
+        if offset == 0xDF4:
+            return 0
+        if offset == 0xDF8:
+            return self.cpu.dcrdr
+        if offset == 0xDFC:
+            return self.cpu.demcr
+        return super().read_reg(offset)
+
+    def write_reg(self, offset, v, mask):
+        if offset == 0xD00:
+            return
+        if offset == 0xD0C:
+            if (v >> 16) != 0x05FA:
+                return
+            self.regs[offset] = (v & 0x00000700)
+            if v & SYSRESETREQ:
+                self.cpu.system.reset()
+            elif v & VECTRESET:
+                self.cpu.reset()
+        elif offset == 0xDF0:
+            self.cpu.write_dhcsr(v)
+        elif offset == 0xDF4:
+            self.cpu.write_dcrsr(v)
+        elif offset == 0xDF8:
+            self.cpu.dcrdr = (self.cpu.dcrdr & ~mask) | (v & mask)
+        elif offset == 0xDFC:
+            self.cpu.demcr = (self.cpu.demcr & ~mask) | (v & mask)
+        else:
+            super().write_reg(offset, v, mask)
+
+
+def add_cortex_m4(system, cpu, rom_pidr):
+    '''
+    Adds the Private Peripheral Bus components of a Cortex-M4 with FPU to the
+    simulated system's memory: the top-level ROM table (which vendors tag with
+    their own PIDR), SCS, DWT, FPB and ITM.
+    '''
+    m = system.memory
+    m.add_region(CoreSightRegion('ITM', 0xE0000000, 0xB105E00D, 0x4003BB001))
+    m.add_region(CoreSightRegion('DWT', 0xE0001000, 0xB105E00D, 0x4003BB002))
+    m.add_region(CoreSightRegion('FPB', 0xE0002000, 0xB105E00D, 0x4002BB003,
+                                 resets={0x000: 0x00000260}))
+    m.add_region(SCSRegion('SCS', 0xE000E000, 0x4000BB00C, cpu, 0x410FC241,
+                           resets={0xF34: 0xC0000000}))
+    m.add_region(ROMTableRegion('ROM Table', 0xE00FF000, 0xB105100D, rom_pidr,
+                                [0xE000E000, 0xE0001000, 0xE0002000,
+                                 0xE0000000]))
@@ -0,0 +1,236 @@
+# Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+import psdb
+
+import bisect
+from struct import pack, unpack_from
+
+
+class SimFaultException(psdb.ProbeException):
+    def __init__(self, addr, msg):
+        super().__init__('Simulated bus fault at 0x%08X: %s' % (addr, msg))
+        self.addr = addr
+
+
+class Region(object):
+    '''
+    Base class for a region of the simulated address space.  Subclasses must
+    implement read() and write(); addresses passed to them are absolute and
+    are guaranteed to lie within the region.
+    '''
+    def __init__(self, name, base, size):
+        self.name = name
+        self.base = base
+        self.size = size
+        self.end  = base + size
+
+    def __repr__(self):
+        return '%s [0x%08X - 0x%08X]' % (self.name, self.base, self.end - 1)
+
+    def read(self, addr, size):
+        raise NotImplementedError
+
+    def write(self, addr, data):
+        raise NotImplementedError
+
+    def reset(self):
+        '''Invoked when the simulated system is reset.'''
+        pass
+
+
+class RAMRegion(Region):
+    '''
+    Plain read/write memory backed by a bytearray.
+    '''
+    def __init__(self, name, base, size, fill=0x00):
+        super().__init__(name, base, size)
+        self.data = bytearray(bytes([fill])*size)
+
+    def read(self, addr, size):
+        offset = addr - self.base
+        return bytes(self.data[offset:offset + size])
+
+    def write(self, addr, data):
+        offset = addr - self.base
+        self.data[offset:offset + len(data)] = data
+
+
+class SparseRegion(Region):
+    '''
+    Read/write memory that only allocates backing store for pages that have
+    been written.  Unwritten memory reads as the fill value.  This is useful
+    for modelling large, mostly-unused address ranges such as peripheral
+    space.
+    '''
+    PAGE_SIZE = 0x400
+
+    def __init__(self, name, base, size, fill=0x00):
+        super().__init__(name, base, size)
+        self.fill  = fill
+        self.pages = {}
+
+    def _page(self, page_addr, alloc):
+        page = self.pages.get(page_addr)
+        if page is None:
+            page = bytearray(bytes([self.fill])*self.PAGE_SIZE)
+            if alloc:
+                self.pages[page_addr] = page
+        return page
+
+    def read(self, addr, size):
+        data = bytearray()
+        while size:
+            page_addr = addr & ~(self.PAGE_SIZE - 1)
+            offset    = addr - page_addr
+            count     = min(size, self.PAGE_SIZE - offset)
+            data     += self._page(page_addr, False)[offset:offset + count]
+            addr     += count
+            size     -= count
+        return bytes(data)
+
+    def write(self, addr, data):
+        pos = 0
+        while pos < len(data):
+            page_addr = addr & ~(self.PAGE_SIZE - 1)
+            offset    = addr - page_addr
+            count     = min(len(data) - pos, self.PAGE_SIZE - offset)
+            page      = self._page(page_addr, True)
+            page[offset:offset + count] = data[pos:pos + count]
+            addr     += count
+            pos      += count
+
+
+class ROMRegion(Region):
+    '''
+    Read-only memory with fixed contents.  Writes are faulted.
+    '''
+    def __init__(self, name, base, data):
+        super().__init__(name, base, len(data))
+        self.data = bytes(data)
+
+    def read(self, addr, size):
+        offset = addr - self.base
+        return self.data[offset:offset + size]
+
+    def write(self, addr, data):
+        raise SimFaultException(addr, 'write to ROM region %s' % self.name)
+
+
+class RegisterRegion(Region):
+    '''
+    A block of 32-bit registers.  Accesses are decomposed into aligned 32-bit
+    register accesses; a narrow write performs a read-modify-write of the
+    containing register with a byte-lane mask so that subclasses can tell
+    which bytes were actually written.
+
+    Subclasses implement read_reg(offset) and write_reg(offset, value, mask).
+    The default implementation behaves like RAM, with reset values taken from
+    the resets dict.
+    '''
+    def __init__(self, name, base, size, resets=None):
+        super().__init__(name, base, size)
+        self.resets = resets or {}
+        self.regs   = dict(self.resets)
+
+    def reset(self):
+        self.regs = dict(self.resets)
+
+    def read_reg(self, offset):
+        return self.regs.get(offset, 0)
+
+    def write_reg(self, offset, v, mask):
+        self.regs[offset] = (self.regs.get(offset, 0) & ~mask) | (v & mask)
+
+    def read(self, addr, size):
+        start = addr & ~3
+        end   = (addr + size + 3) & ~3
+        data  = b''.join(pack('<I', self.read_reg(a - self.base))
+                         for a in range(start, end, 4))
+        return data[addr - start:addr - start + size]
+
+    def write(self, addr, data):
+        pos = 0
+        while pos < len(data):
+            word  = (addr + pos) & ~3
+            lane  = (addr + pos) - word
+            count = min(len(data) - pos, 4 - lane)
+            raw   = bytearray(4)
+            raw[lane:lane + count] = data[pos:pos + count]
+            v     = unpack_from('<I', raw)[0]
+            mask  = ((1 << 8*count) - 1) << 8*lane
+            self.write_reg(word - self.base, v, mask)
+            pos  += count
+
+
+class CoreSightRegion(RegisterRegion):
+    '''
+    A 4K CoreSight component with an identification block at 0xFD0 - 0xFFF.
+    All other registers behave like RAM unless overridden by a subclass.
+    '''
+    def __init__(self, name, base, cidr, pidr, resets=None):
+        resets = dict(resets or {})
+        for i in range(4):
+            resets[0xFF0 + 4*i] = (cidr >> 8*i) & 0xFF
+            resets[0xFE0 + 4*i] = (pidr >> 8*i) & 0xFF
+            resets[0xFD0 + 4*i] = (pidr >> (32 + 8*i)) & 0xFF
+        super().__init__(name, base, 0x1000, resets)
+
+
+class ROMTableRegion(CoreSightRegion):
+    '''
+    A CoreSight ROM table.  The entries list holds the absolute base addresses
+    of the child components; they are encoded as present 32-bit entries
+    relative to the table base.
+    '''
+    def __init__(self, name, base, cidr, pidr, entries):
+        resets = {}
+        for i, addr in enumerate(entries):
+            resets[4*i] = ((addr - base) & 0xFFFFF000) | 0x00000003
+        super().__init__(name, base, cidr, pidr, resets)
+
+    def write_reg(self, offset, v, mask):
+        pass
+
+
+class Memory(object):
+    '''
+    The address space visible through a simulated MEM-AP.  Regions may not
+    overlap; accesses to unmapped addresses or that straddle two regions
+    raise a SimFaultException.
+    '''
+    def __init__(self):
+        self.regions = []
+        self.bases   = []
+
+    def add_region(self, region):
+        index = bisect.bisect(self.bases, region.base)
+        if index > 0:
+            assert self.regions[index - 1].end <= region.base
+        if index < len(self.regions):
+            assert region.end <= self.regions[index].base
+        self.regions.insert(index, region)
+        self.bases.insert(index, region.base)
+        return region
+
+    def find_region(self, addr, size=1):
+        index = bisect.bisect(self.bases, addr) - 1
+        if index >= 0:
+            r = self.regions[index]
+            if addr + size <= r.end:
+                return r
+        raise SimFaultException(addr, 'unmapped access of %u bytes' % size)
+
+    def read(self, addr, size):
+        return self.find_region(addr, size).read(addr, size)
+
+    def write(self, addr, data):
+        self.find_region(addr, len(data)).write(addr, data)
+
+    def read_32(self, addr):
+        return unpack_from('<I', self.read(addr, 4))[0]
+
+    def write_32(self, v, addr):
+        self.write(addr, pack('<I', v))
+
+    def reset(self):
+        for r in self.regions:
+            r.reset()
@@ -0,0 +1,201 @@
+# Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+from .. import probe
+from . import stm32
+import psdb
+
+import builtins
+import functools
+import os
+import time
+
+
+MODELS = {'stm32g4' : stm32.STM32G4,
+          }
+
+
+class SimProbe(probe.Probe):
+    '''
+    A debug probe connected to a simulated target running in-process.  Each
+    probe operation counts as one transaction; a transaction that requires a
+    round trip to the probe sleeps for latency seconds so that the effect of
+    round-trip counts on wall time can be measured without hardware.  Writes
+    issued in a pipelined() context are deferred and share the round trip of
+    the next read or of the end of the context, mirroring what a probe that
+    queues writes on the wire would do.
+    '''
+    def __init__(self, system, latency=0, serial_num='SIM0', usb_path='sim:0'):
+        super().__init__('Simulator')
+        self.system         = system
+        self.latency        = latency
+        self.serial_num     = serial_num
+        self.usb_path       = usb_path
+        self.dpidr          = None
+        self.tck_freq       = None
+        self.deferred       = None
+        self.pipeline_depth = 0
+        self.transactions   = 0
+        self.round_trips    = 0
+
+    def __str__(self):
+        return '%s Debug Probe at %s' % (self.name, self.usb_path)
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _transact(self, deferrable=False):
+        self.transactions += 1
+        if deferrable and self.deferred is not None:
+            self.deferred += 1
+            return
+
+        if self.deferred:
+            self.deferred = 0
+        self._round_trip()
+
+    def _pipeline_begin(self):
+        if not self.pipeline_depth:
+            self.deferred = 0
+        self.pipeline_depth += 1
+
+    def _pipeline_end(self, check_status):
+        self.pipeline_depth -= 1
+        if self.pipeline_depth:
+            return
+
+        if self.deferred:
+            self._round_trip()
+        self.deferred = None
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.round_trips  = 0
+
+    def _memory(self, ap_num):
+        ap = self.system.aps.get(ap_num)
+        if ap is None:
+            raise psdb.ProbeException('No simulated MEM-AP at APSEL %u.'
+                                      % ap_num)
+        return ap.memory
+
+    def _bulk_read(self, addr, size, ap_num):
+        assert size > 0
+        assert (addr & 0xFFFFFC00) == ((addr + size - 1) & 0xFFFFFC00)
+        self._transact()
+        return self._memory(ap_num).read(addr, size)
+
+    def _bulk_write(self, data, addr, ap_num):
+        assert data
+        assert (addr & 0xFFFFFC00) == ((addr + len(data) - 1) & 0xFFFFFC00)
+        self._transact(deferrable=True)
+        self._memory(ap_num).write(addr, bytes(data))
+
+    def _bulk_read_8(self, addr, n, ap_num=0):
+        return self._bulk_read(addr, n, ap_num)
+
+    def _bulk_read_16(self, addr, n, ap_num=0):
+        assert addr % 2 == 0
+        return self._bulk_read(addr, n*2, ap_num)
+
+    def _bulk_read_32(self, addr, n, ap_num=0):
+        assert addr % 4 == 0
+        return self._bulk_read(addr, n*4, ap_num)
+
+    def _bulk_write_8(self, data, addr, ap_num=0):
+        self._bulk_write(data, addr, ap_num)
+
+    def _bulk_write_16(self, data, addr, ap_num=0):
+        assert addr % 2 == 0
+        assert len(data) % 2 == 0
+        self._bulk_write(data, addr, ap_num)
+
+    def _bulk_write_32(self, data, addr, ap_num=0):
+        assert addr % 4 == 0
+        assert len(data) % 4 == 0
+        self._bulk_write(data, addr, ap_num)
+
+    def assert_srst(self):
+        '''Holds the target in reset.'''
+        self._transact()
+        self.system.set_srst(True)
+
+    def deassert_srst(self):
+        '''Releases the target from reset.'''
+        self._transact()
+        self.system.set_srst(False)
+
+    def set_tck_freq(self, freq):
+        '''
+        The simulator has no clock; the requested frequency is recorded and
+        returned as the actual frequency.
+        '''
+        self.tck_freq = freq
+        return freq
+
+    def open_ap(self, apsel):
+        pass
+
+    def read_dp_reg(self, addr):
+        '''Read a 32-bit register from the DP address space. '''
+        self._transact()
+        return self.system.read_dp_reg(addr)
+
+    def write_dp_reg(self, addr, value):
+        '''Write a 32-bit register in the DP address space. '''
+        self._transact(deferrable=True)
+        self.system.write_dp_reg(addr, value)
+
+    def read_ap_reg(self, apsel, addr):
+        '''Read a 32-bit register from the AP address space.'''
+        self._transact()
+        return self.system.read_ap_reg(apsel, addr)
+
+    def write_ap_reg(self, apsel, addr, value):
+        '''Write a 32-bit register in the AP address space.'''
+        self._transact(deferrable=True)
+        self.system.write_ap_reg(apsel, addr, value)
+
+    def connect(self):
+        self.dpidr = self.read_dp_reg(0x00)
+
+    def show_info(self):
+        print('============= %s %s =============' % (
+              self.name, type(self.system).__name__))
+        print('Serial Number: %s' % self.serial_num)
+        print('     USB Path: %s' % self.usb_path)
+        print('      Latency: %.3f ms' % (self.latency*1000.))
+
+
+def _open(cls, latency, serial_num, usb_path):
+    return SimProbe(cls(), latency=latency, serial_num=serial_num,
+                    usb_path=usb_path)
+
+
+def enumerate(usb_path=None):
+    '''
+    Simulated probes are only returned if the PSDB_SIM environment variable is
+    set to a comma-separated list of target models, for instance:
+
+        PSDB_SIM=stm32g4 PSDB_SIM_LATENCY=0.001 flash_tool ...
+
+    One probe descriptor is returned per listed model, or only the one with the
+    specified usb_path if one is given.
+    '''
+    models = os.environ.get('PSDB_SIM')
+    if not models:
+        return []
+
+    latency = float(os.environ.get('PSDB_SIM_LATENCY', 0))
+    probes  = []
+    for n, model in builtins.enumerate(models.split(',')):
+        cls = MODELS.get(model.strip().lower())
+        if cls is None:
+            raise psdb.ProbeException('Unknown simulated target "%s".' % model)
+
+        path = 'sim:%u' % n
+        if usb_path is None or usb_path == path:
+            probes.append(probe.ProbeDescriptor(
+                'Simulator', path, 'SIM%u' % n,
+                functools.partial(_open, cls, latency, 'SIM%u' % n, path)))
+    return probes
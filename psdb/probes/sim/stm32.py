@@ -0,0 +1,287 @@
+# Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+from .memory import (Region, RAMRegion, SparseRegion, ROMRegion,
+                     RegisterRegion)
+from .system import System, AP
+from . import cortex_m
+
+import time
+from struct import pack
+
+
+# FLASH_SR bits.
+SR_EOP     = (1 << 0)
+SR_PROGERR = (1 << 3)
+SR_PGAERR  = (1 << 5)
+SR_SIZERR  = (1 << 6)
+SR_PGSERR  = (1 << 7)
+SR_BSY     = (1 << 16)
+SR_ERRORS  = 0x0000C3FA
+
+# FLASH_CR bits.
+CR_PG         = (1 << 0)
+CR_PER        = (1 << 1)
+CR_MER1       = (1 << 2)
+CR_STRT       = (1 << 16)
+CR_OPTSTRT    = (1 << 17)
+CR_OBL_LAUNCH = (1 << 27)
+CR_OPTLOCK    = (1 << 30)
+CR_LOCK       = (1 << 31)
+
+KEYS    = (0x45670123, 0xCDEF89AB)
+OPTKEYS = (0x08192A3B, 0x4C5D6E7F)
+
+
+class FlashRegion(Region):
+    '''
+    A region of flash memory that is programmed through a FlashController.
+    Reads behave like ROM; writes are handed off to the controller.
+    '''
+    def __init__(self, name, base, size, controller):
+        super().__init__(name, base, size)
+        self.data       = bytearray(b'\xFF'*size)
+        self.controller = controller
+
+    def read(self, addr, size):
+        offset = addr - self.base
+        return bytes(self.data[offset:offset + size])
+
+    def write(self, addr, data):
+        self.controller.program(self, addr, data)
+
+    def erase(self, addr, size):
+        offset = addr - self.base
+        self.data[offset:offset + size] = b'\xFF'*size
+
+
+class FlashController(RegisterRegion):
+    '''
+    Model of the "type 1" STM32 flash controller found on the STM32G4 and its
+    relatives.  Flash is programmed a 64-bit double-word at a time and erased
+    in pages via PER/MER1 + STRT.  BSY is held for erase_time or program_time
+    seconds after an operation is started so that polling loops get exercised.
+    '''
+    def __init__(self, name, base, system, page_size, erase_time=0,
+                 program_time=0):
+        super().__init__(name, base, 0x400, {0x10: 0x00000000,
+                                             0x14: CR_LOCK | CR_OPTLOCK,
+                                             0x20: 0xFFEFF8AA})
+        self.system       = system
+        self.page_size    = page_size
+        self.erase_time   = erase_time
+        self.program_time = program_time
+        self.main         = None
+        self.busy_until   = 0
+        self.key_index    = 0
+        self.optkey_index = 0
+        self.pending      = None
+
+    def reset(self):
+        super().reset()
+        self.busy_until   = 0
+        self.key_index    = 0
+        self.optkey_index = 0
+        self.pending      = None
+
+    def _set_busy(self, duration):
+        self.busy_until = max(self.busy_until, time.time() + duration)
+
+    def _error(self, bits):
+        self.regs[0x10] |= bits
+        self.pending    = None
+
+    def read_reg(self, offset):
+        v = super().read_reg(offset)
+        if offset == 0x10 and time.time() < self.busy_until:
+            v |= SR_BSY
+        return v
+
+    def write_reg(self, offset, v, mask):
+        v &= mask
+        if offset == 0x08:
+            if self.key_index < 2 and v == KEYS[self.key_index]:
+                self.key_index += 1
+                if self.key_index == 2:
+                    self.regs[0x14] &= ~CR_LOCK
+            else:
+                self.key_index = 2
+        elif offset == 0x0C:
+            if self.regs[0x14] & CR_LOCK:
+                return
+            if self.optkey_index < 2 and v == OPTKEYS[self.optkey_index]:
+                self.optkey_index += 1
+                if self.optkey_index == 2:
+                    self.regs[0x14] &= ~CR_OPTLOCK
+            else:
+                self.optkey_index = 2
+        elif offset == 0x10:
+            self.regs[0x10] &= ~(v & (SR_ERRORS | SR_EOP))
+        elif offset == 0x14:
+            self._write_cr(v, mask)
+        elif offset == 0x20:
+            if not (self.regs[0x14] & CR_OPTLOCK):
+                super().write_reg(offset, v, mask)
+        else:
+            super().write_reg(offset, v, mask)
+
+    def _write_cr(self, v, mask):
+        cr = self.regs[0x14]
+        if cr & CR_LOCK:
+            return
+
+        # LOCK and OPTLOCK can only be cleared via the key registers and the
+        # start bits are self-clearing.
+        new  = (cr & ~mask) | (v & mask)
+        new &= ~(CR_STRT | CR_OPTSTRT | CR_OBL_LAUNCH)
+        new |= (cr & CR_OPTLOCK)
+        if new & CR_LOCK:
+            new |= CR_OPTLOCK
+            self.key_index = 0
+        if new & CR_OPTLOCK:
+            self.optkey_index = 0
+        self.regs[0x14] = new
+        if new & CR_LOCK:
+            return
+
+        if not (new & CR_PG):
+            self.pending = None
+        cr = new
+
+        if v & CR_STRT:
+            if cr & CR_MER1:
+                self.main.erase(self.main.base, self.main.size)
+            elif cr & CR_PER:
+                page = (cr >> 3) & 0x7F
+                addr = self.main.base + page*self.page_size
+                if addr + self.page_size > self.main.end:
+                    self._error(SR_PGSERR)
+                    return
+                self.main.erase(addr, self.page_size)
+            else:
+                self._error(SR_PGSERR)
+                return
+            self.regs[0x10] |= SR_EOP
+            self._set_busy(self.erase_time)
+        if (v & CR_OPTSTRT) and not (cr & CR_OPTLOCK):
+            self._set_busy(self.erase_time)
+        if (v & CR_OBL_LAUNCH) and not (cr & CR_OPTLOCK):
+            self.system.reset()
+
+    def program(self, region, addr, data):
+        '''
+        Handles a write to flash memory.  Words are latched in pairs and each
+        completed double-word is programmed into the flash; the double-word
+        being programmed must be fully erased unless the new value is all
+        zeroes.
+        '''
+        if len(data) % 4 or addr % 4:
+            self._error(SR_SIZERR)
+            return
+        if not (self.regs[0x14] & CR_PG) or (self.regs[0x14] & CR_LOCK):
+            self._error(SR_PGSERR)
+            return
+
+        for pos in range(0, len(data), 4):
+            a = addr + pos
+            w = data[pos:pos + 4]
+            if a % 8 == 0:
+                self.pending = (a, w)
+                continue
+            if not self.pending or self.pending[0] != a - 4:
+                self._error(SR_PGAERR)
+                return
+
+            dw           = self.pending[1] + w
+            base         = self.pending[0]
+            self.pending = None
+            old          = region.read(base, 8)
+            if old != b'\xFF'*8 and dw != b'\x00'*8:
+                self._error(SR_PROGERR)
+                return
+
+            offset = base - region.base
+            region.data[offset:offset + 8] = dw
+            self.regs[0x10] |= SR_EOP
+            self._set_busy(self.program_time)
+
+
+class DBGMCURegion(RegisterRegion):
+    '''
+    The DBGMCU block; IDCODE is read-only and the registers are only reset by
+    a power cycle so they survive a system reset.
+    '''
+    def __init__(self, name, base, idcode):
+        super().__init__(name, base, 0x400, {0x00: idcode})
+
+    def reset(self):
+        pass
+
+    def write_reg(self, offset, v, mask):
+        if offset != 0x00:
+            super().write_reg(offset, v, mask)
+
+
+class AliasRegion(Region):
+    '''
+    A second view of another region at a different address.
+    '''
+    def __init__(self, name, base, target):
+        super().__init__(name, base, target.size)
+        self.target = target
+
+    def read(self, addr, size):
+        return self.target.read(addr - self.base + self.target.base, size)
+
+    def write(self, addr, data):
+        self.target.write(addr - self.base + self.target.base, data)
+
+
+class PeripheralRegion(SparseRegion):
+    '''
+    Peripheral space; everything reads as zero and peripherals return to their
+    reset state on a system reset.
+    '''
+    def reset(self):
+        self.pages = {}
+
+
+class STM32G4(System):
+    '''
+    A category 2 STM32G4 (STM32G431/441) with a single AHB-AP.
+    '''
+    def __init__(self, flash_size=128*1024, erase_time=0, program_time=0,
+                 uid=bytes(range(12))):
+        super().__init__(dpidr=0x2BA01477)
+        m = self.memory
+
+        self.flash = FlashController('FLASH', 0x40022000, self, 2048,
+                                     erase_time=erase_time,
+                                     program_time=program_time)
+        self.flash.main = m.add_region(FlashRegion('FBANKS', 0x08000000,
+                                                   flash_size, self.flash))
+        m.add_region(FlashRegion('OTP', 0x1FFF7000, 1024, self.flash))
+
+        info = bytearray(b'\xFF'*0x100)
+        info[0x00:0x04] = pack('<I', 0x00000000)
+        info[0x90:0x9C] = uid
+        info[0xE0:0xE2] = pack('<H', flash_size // 1024)
+        m.add_region(ROMRegion('Device Info', 0x1FFF7500, info))
+
+        ccm = m.add_region(RAMRegion('CCM SRAM ID', 0x10000000, 0x00002800))
+        m.add_region(RAMRegion('SRAM1', 0x20000000, 0x00004000))
+        m.add_region(RAMRegion('SRAM2', 0x20004000, 0x00001800))
+        m.add_region(AliasRegion('CCM SRAM S', 0x20005800, ccm))
+
+        m.add_region(PeripheralRegion('APB/AHB', 0x40000000, 0x00022000))
+        m.add_region(self.flash)
+        m.add_region(PeripheralRegion('AHB/AHB2', 0x40022400, 0x1FFDDC00))
+        m.add_region(DBGMCURegion('DBGMCU', 0xE0042000, 0x10006468))
+
+        cpu = cortex_m.CPU(self, 0x08000000)
+        cortex_m.add_cortex_m4(self, cpu, 0xA0468)
+        self.cpus.append(cpu)
+        self.aps[0] = AP(m, 0x24770011, 0xE00FF003, 0x03000040)
+        self.reset()
+
+    def flash_contents(self):
+        '''Returns the current contents of main flash.'''
+        return bytes(self.flash.main.data)
@@ -0,0 +1,116 @@
+# Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+from .memory import Memory
+
+
+class AP(object):
+    '''
+    Register model of a simulated MEM-AP.  Only the 32-bit CSW size field and
+    single auto-increment are modelled; auto-increment wraps within a 1K page
+    as permitted by the ADIv5 specification.
+    '''
+    def __init__(self, memory, idr, base, csw):
+        self.memory    = memory
+        self.idr       = idr
+        self.base      = base
+        self.csw_reset = csw
+        self.csw       = csw
+        self.tar       = 0
+
+    def _drw_size(self):
+        return 1 << (self.csw & 0x7)
+
+    def _advance_tar(self, size):
+        if (self.csw & 0x30) == 0x10:
+            self.tar = (self.tar & ~0x3FF) | ((self.tar + size) & 0x3FF)
+
+    def read_reg(self, addr):
+        if addr == 0x00:
+            return self.csw
+        if addr == 0x04:
+            return self.tar
+        if addr == 0x0C:
+            size = self._drw_size()
+            data = self.memory.read(self.tar, size)
+            v    = int.from_bytes(data, 'little') << 8*(self.tar & 3)
+            self._advance_tar(size)
+            return v & 0xFFFFFFFF
+        if 0x10 <= addr <= 0x1C:
+            return self.memory.read_32((self.tar & ~0xF) + addr - 0x10)
+        if addr == 0xF8:
+            return self.base
+        if addr == 0xFC:
+            return self.idr
+        return 0
+
+    def write_reg(self, addr, v):
+        if addr == 0x00:
+            if (v & 0x7) > 2:
+                v = (v & ~0x7) | (self.csw & 0x7)
+            self.csw = (v & ~0x40) | 0x40
+        elif addr == 0x04:
+            self.tar = v
+        elif addr == 0x0C:
+            size = self._drw_size()
+            data = ((v >> 8*(self.tar & 3)) & ((1 << 8*size) - 1))
+            self.memory.write(self.tar, data.to_bytes(size, 'little'))
+            self._advance_tar(size)
+        elif 0x10 <= addr <= 0x1C:
+            self.memory.write_32(v, (self.tar & ~0xF) + addr - 0x10)
+
+
+class System(object):
+    '''
+    Base class for a simulated target: the DP, the set of APs keyed by APSEL,
+    the address space behind them and the CPUs.  Subclasses populate these and
+    then invoke reset() to bring the system out of power-on reset.
+    '''
+    def __init__(self, dpidr):
+        self.dpidr  = dpidr
+        self.memory = Memory()
+        self.aps    = {}
+        self.cpus   = []
+        self.srst   = False
+        self.select = 0
+        self.rdbuff = 0
+
+    def reset(self):
+        '''Performs a system reset, as from SYSRESETREQ or the SRST line.'''
+        self.memory.reset()
+        for c in self.cpus:
+            c.reset()
+
+    def set_srst(self, asserted):
+        if asserted == self.srst:
+            return
+
+        self.srst = asserted
+        for c in self.cpus:
+            c.in_reset = asserted
+            c.halted   = False
+        if not asserted:
+            self.reset()
+
+    def read_dp_reg(self, addr):
+        if addr == 0x00:
+            return self.dpidr
+        if addr == 0x04:
+            return 0xF0000000
+        if addr == 0x08:
+            return self.select
+        if addr == 0x0C:
+            return self.rdbuff
+        return 0
+
+    def write_dp_reg(self, addr, value):
+        if addr == 0x08:
+            self.select = value
+
+    def read_ap_reg(self, apsel, addr):
+        ap = self.aps.get(apsel)
+        self.rdbuff = ap.read_reg(addr) if ap else 0
+        return self.rdbuff
+
+    def write_ap_reg(self, apsel, addr, value):
+        ap = self.aps.get(apsel)
+        if ap:
+            ap.write_reg(addr, value)
@@ -19,13 +19,15 @@ HAS_EMBEDDED_STATUS = (1 << 2)  # Data IN phase has status in first byte.
 HAS_STATUS_PHASE    = (1 << 3)  # Full XFER_STATUS phase after CDB/DATA phases.
 
 
-def check_xfer_status(status, fault_addr=None):
+def check_xfer_status(status, fault_addr=None, cmd=None):
     if status == errors.DEBUG_OK:
         return
     msg = 'Unexpected error 0x%02X' % status
     if fault_addr is not None:
         msg += ' at 0x%08X' % fault_addr
-    raise errors.STLinkXFERException(status, fault_addr, msg)
+    if cmd is not None:
+        msg += ' during %s' % cmd
+    raise errors.STLinkXFERException(status, fault_addr, msg, cmd=cmd)
 
 
 class STLinkCommandDecodeNotImplementedError(Exception):
@@ -52,6 +54,12 @@ class STLinkCommand:
     def decode(self, rsp):
         assert self.CMD_FLAGS & HAS_DATA_IN_PHASE
 
+    def __repr__(self):
+        if hasattr(self, 'addr'):
+            return '%s(0x%08X, %u bytes)' % (self.__class__.__name__,
+                                             self.addr, self.size)
+        return '%s()' % self.__class__.__name__
+
 
 class Version1(STLinkCommand):
     '''
@@ -512,6 +520,8 @@ class BulkRead8(STLinkCommand):
         assert (addr & 0xFFFFFC00) == ((addr + n - 1) & 0xFFFFFC00)
         self.RSP_LEN = max(n, 2)
         self.N       = n
+        self.addr    = addr
+        self.size    = n
         super().__init__(pack('<BBIHB', 0xF2, 0x0C, addr, n, ap_num))
 
     def decode(self, rsp):
@@ -555,6 +565,8 @@ class BulkRead16(STLinkCommand):
         assert addr % 2 == 0
         assert (addr & 0xFFFFFC00) == ((addr + n*2 - 1) & 0xFFFFFC00)
         self.RSP_LEN = n*2
+        self.addr    = addr
+        self.size    = n*2
         super().__init__(pack('<BBIHB', 0xF2, 0x47, addr, n*2, ap_num))
 
     def decode(self, rsp):
@@ -598,6 +610,8 @@ class BulkRead32(STLinkCommand):
         assert addr % 4 == 0
         assert (addr & 0xFFFFFC00) == ((addr + n*4 - 1) & 0xFFFFFC00)
         self.RSP_LEN = n*4
+        self.addr    = addr
+        self.size    = n*4
         super().__init__(pack('<BBIHB', 0xF2, 0x07, addr, n*4, ap_num))
 
     def decode(self, rsp):
@@ -635,6 +649,8 @@ class BulkWrite8(STLinkCommand):
     def __init__(self, data, addr, ap_num):
         assert (addr & 0xFFFFFC00) == ((addr + len(data) - 1) & 0xFFFFFC00)
         self.data_out = data
+        self.addr     = addr
+        self.size     = len(data)
         super().__init__(pack('<BBIHB', 0xF2, 0x0D, addr, len(data), ap_num))
 
 
@@ -673,6 +689,8 @@ class BulkWrite16(STLinkCommand):
         assert len(data) % 2 == 0
         assert (addr & 0xFFFFFC00) == ((addr + len(data) - 1) & 0xFFFFFC00)
         self.data_out = data
+        self.addr     = addr
+        self.size     = len(data)
         super().__init__(pack('<BBIHB', 0xF2, 0x48, addr, len(data), ap_num))
 
 
@@ -711,6 +729,8 @@ class BulkWrite32(STLinkCommand):
         assert len(data) % 4 == 0
         assert (addr & 0xFFFFFC00) == ((addr + len(data) - 1) & 0xFFFFFC00)
         self.data_out = data
+        self.addr     = addr
+        self.size     = len(data)
         super().__init__(pack('<BBIHB', 0xF2, 0x08, addr, len(data), ap_num))
 
 
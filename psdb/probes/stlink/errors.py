@@ -63,7 +63,8 @@ class STLinkCmdException(psdb.ProbeException):
 
 
 class STLinkXFERException(psdb.ProbeException):
-    def __init__(self, status, fault_addr, msg):
+    def __init__(self, status, fault_addr, msg, cmd=None):
         super().__init__(msg)
         self.status     = status
         self.fault_addr = fault_addr
+        self.cmd        = cmd
@@ -4,7 +4,8 @@ from . import cdb
 from . import errors
 import psdb
 
-from builtins import bytes, range
+from builtins import range
+from struct import pack
 import time
 
 # The STLINK works kind of like a SCSI device.  There are three types of
@@ -53,18 +54,65 @@ class STLink(usb_probe.Probe):
     '''
     def __init__(self, usb_dev, name):
         super().__init__(usb_dev, name)
-        self.dpidr    = None
-        self.features = 0
+        self.dpidr          = None
+        self.features       = 0
+        self.pipeline_depth = 0
+        self.deferred_cmds  = None
 
-    def _check_xfer_status(self):
+    def _read_xfer_status(self):
         '''
-        To be implemented by the subclass to check the XFER status of the last
-        data phase for CDBs that don't contain an embedded status code.  This
-        should retrieve a status code and invoke cdb.check_status() with the
-        result.
+        To be implemented by the subclass to retrieve the XFER status of the
+        last data phase for CDBs that don't contain an embedded status code.
+        This should return a (status, fault_addr) tuple; fault_addr may be None
+        if the probe firmware doesn't report it.
         '''
         raise NotImplementedError
 
+    def _check_xfer_status(self, cmds):
+        '''
+        Retrieves the XFER status and raises an exception if an error occurred.
+        The cmds list holds all of the CDBs that have executed since the status
+        was last checked; since errors are sticky any one of them may have been
+        the one that failed, so we use the fault address to identify the
+        culprit.
+        '''
+        status, fault_addr = self._read_xfer_status()
+        if status == errors.DEBUG_OK:
+            return
+
+        culprit = cmds[-1] if len(cmds) == 1 else None
+        if fault_addr is not None:
+            for cmd in cmds:
+                if cmd.addr <= fault_addr < cmd.addr + cmd.size:
+                    culprit = cmd
+                    break
+        cdb.check_xfer_status(status, fault_addr, culprit)
+
+    def _flush_deferred_cmds(self):
+        '''
+        Checks the status of any CDBs whose status check was deferred while
+        pipelining.
+        '''
+        cmds, self.deferred_cmds = self.deferred_cmds, []
+        if cmds:
+            self._check_xfer_status(cmds)
+
+    def _pipeline_begin(self):
+        if not self.pipeline_depth:
+            self.deferred_cmds = []
+        self.pipeline_depth += 1
+
+    def _pipeline_end(self, check_status):
+        self.pipeline_depth -= 1
+        if self.pipeline_depth:
+            return
+
+        try:
+            if check_status:
+                self._flush_deferred_cmds()
+        finally:
+            self.deferred_cmds = None
+
     def _read_dpidr(self):
         '''
         To be implemented by the subclass.
@@ -75,8 +123,21 @@ class STLink(usb_probe.Probe):
         '''
         Executes a CDB by writing it to the TX_EP and then driving the various
         phases according to the CDB flags.
+
+        While pipelining, CDBs that write data and require a separate status
+        phase are queued up without checking their status.  Data-in CDBs with
+        a status phase check the status of the queued CDBs along with their
+        own, while all other CDBs first flush the queued status check.
         '''
         assert len(cmd.cdb) == 16
+        deferred = False
+        if self.deferred_cmds:
+            if not (cmd.CMD_FLAGS & cdb.HAS_STATUS_PHASE):
+                self._flush_deferred_cmds()
+        if self.deferred_cmds is not None:
+            deferred = ((cmd.CMD_FLAGS & cdb.HAS_STATUS_PHASE) and
+                        not (cmd.CMD_FLAGS & cdb.HAS_DATA_IN_PHASE))
+
         assert self.usb_dev.write(TX_EP, cmd.cdb) == len(cmd.cdb)
 
         if cmd.CMD_FLAGS & cdb.HAS_DATA_OUT_PHASE:
@@ -92,8 +153,14 @@ class STLink(usb_probe.Probe):
         else:
             retval = None
 
-        if cmd.CMD_FLAGS & cdb.HAS_STATUS_PHASE:
-            self._check_xfer_status()
+        if deferred:
+            self.deferred_cmds.append(cmd)
+        elif cmd.CMD_FLAGS & cdb.HAS_STATUS_PHASE:
+            if self.deferred_cmds:
+                cmds, self.deferred_cmds = self.deferred_cmds + [cmd], []
+            else:
+                cmds = [cmd]
+            self._check_xfer_status(cmds)
 
         return retval
 
@@ -153,13 +220,13 @@ class STLink(usb_probe.Probe):
         '''
         Reads a consecutive number of bytes from the specified address.
         '''
-        data = bytes(b'')
+        chunks = []
         while n:
             size  = min(n, self.max_rw8)
-            data += self._exec_cdb(cdb.BulkRead8(addr, size, ap_num))
+            chunks.append(self._exec_cdb(cdb.BulkRead8(addr, size, ap_num)))
             addr += size
             n    -= size
-        return data
+        return b''.join(chunks)
 
     def _bulk_read_16(self, addr, n, ap_num=0):
         '''
@@ -181,11 +248,13 @@ class STLink(usb_probe.Probe):
         '''
         Writes a consecutive number of bytes to the specified address.
         '''
-        while data:
-            size = min(len(data), self.max_rw8)
-            self._exec_cdb(cdb.BulkWrite8(data[:size], addr, ap_num))
+        mv  = memoryview(data)
+        pos = 0
+        while pos < len(mv):
+            size  = min(len(mv) - pos, self.max_rw8)
+            self._exec_cdb(cdb.BulkWrite8(mv[pos:pos + size], addr, ap_num))
             addr += size
-            data  = data[size:]
+            pos  += size
 
     def _bulk_write_16(self, data, addr, ap_num=0):
         '''
@@ -247,8 +316,14 @@ class STLink(usb_probe.Probe):
         Writes a single 32-bit word to the 32-bit aligned addr.  This is more
         efficient than using _bulk_write_32() since it requires fewer USB
         transactions.
+
+        While pipelining, we instead issue a BulkWrite32 so that the write can
+        be queued without waiting for a response.
         '''
-        self._cmd_allow_retry(cdb.Write32(addr, v, ap_num))
+        if self.deferred_cmds is not None:
+            self._bulk_write_32(pack('<I', v), addr, ap_num)
+        else:
+            self._cmd_allow_retry(cdb.Write32(addr, v, ap_num))
 
     def connect(self):
         self._swd_connect()
@@ -1,5 +1,5 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
-import usb
+from .. import usb_probe
 from . import stlink
 from . import cdb
 import psdb
@@ -31,14 +31,10 @@ class STLinkV2_1(stlink.STLink):
         if self.ver_jtag >= 28:
             self.features |= stlink.FEATURE_OPEN_AP
 
-    def _check_xfer_status(self):
+    def _read_xfer_status(self):
         if self.features & stlink.FEATURE_RW_STATUS_12:
-            status, fault_addr = self._exec_cdb(cdb.LastXFERStatus12())
-        else:
-            status     = self._exec_cdb(cdb.LastXFERStatus2())
-            fault_addr = None
-
-        cdb.check_xfer_status(status, fault_addr)
+            return self._exec_cdb(cdb.LastXFERStatus12())
+        return self._exec_cdb(cdb.LastXFERStatus2()), None
 
     def _usb_version(self):
         (self.ver_stlink,
@@ -86,6 +82,7 @@ class STLinkV2_1(stlink.STLink):
                                             self.ver_swim))
 
 
-def enumerate():
-    devices = usb.core.find(find_all=True, idVendor=0x0483, idProduct=0x374B)
-    return [STLinkV2_1(d) for d in devices]
+def enumerate(usb_path=None):
+    devices = usb_probe.find(usb_path, idVendor=0x0483, idProduct=0x374B)
+    return [usb_probe.ProbeDescriptor(d, 'STLinkV2.1', STLinkV2_1)
+            for d in devices]
@@ -1,6 +1,5 @@
 # Copyright (c) 2020 by Phase Advanced Sensor Systems, Inc.
-import usb
-
+from .. import usb_probe
 from . import stlink
 from . import cdb
 from . import errors
@@ -44,9 +43,8 @@ class STLinkV3(stlink.STLink):
         self.features      |= stlink.FEATURE_OPEN_AP
         self._swd_freqs_khz = sorted(self._get_com_freq(), reverse=True)
 
-    def _check_xfer_status(self):
-        status, fault_addr = self._exec_cdb(cdb.LastXFERStatus12())
-        cdb.check_xfer_status(status, fault_addr)
+    def _read_xfer_status(self):
+        return self._exec_cdb(cdb.LastXFERStatus12())
 
     def _usb_version(self):
         (self.ver_stlink,
@@ -104,6 +102,7 @@ def is_stlink_v3(usb_dev):
     return usb_dev.idVendor == 0x0483 and usb_dev.idProduct in V3_PIDS
 
 
-def enumerate():
-    devices = usb.core.find(find_all=True, custom_match=is_stlink_v3)
-    return [STLinkV3(d) for d in devices]
+def enumerate(usb_path=None):
+    devices = usb_probe.find(usb_path, custom_match=is_stlink_v3)
+    return [usb_probe.ProbeDescriptor(d, 'STLinkV3', STLinkV3)
+            for d in devices]
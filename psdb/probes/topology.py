@@ -0,0 +1,169 @@
+# Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+import psdb
+import psdb.util
+import psdb.targets
+
+import json
+import os
+
+
+MAX_ENTRIES = 8
+
+
+def _cache_path(dpidr):
+    return os.path.join(psdb.util.cache_dir(), 'topology-%08X.json' % dpidr)
+
+
+def _load_entries(dpidr):
+    try:
+        with open(_cache_path(dpidr), 'r') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return entries if isinstance(entries, list) else []
+
+
+def _is_rom_table(c):
+    return (c.cidr & 0xFFFF0FFF) == 0xB105000D and ((c.cidr >> 12) & 0xF) == 1
+
+
+def _components(c, results):
+    results.append(c)
+    for child in c.children:
+        _components(child, results)
+
+
+def _regions(db):
+    '''
+    Yields the (ap_num, base, size) immutable regions holding the ID blocks of
+    all probed components and the entries of all ROM tables.
+    '''
+    for ap in db.aps.values():
+        base_component = getattr(ap, 'base_component', None)
+        if base_component is None:
+            continue
+
+        components = []
+        _components(base_component, components)
+        for c in components:
+            yield ap.ap_num, c.addr + 0xFD0, 0x30
+            if _is_rom_table(c):
+                yield ap.ap_num, c.addr, 0xF00
+
+
+class Topology(object):
+    '''
+    The AP map, component ID blocks, ROM table contents and matched target
+    class from a previous probe of a target, saved to disk so that a later
+    connection to the same kind of target can skip the 256-AP scan and the
+    ROM table walk.
+
+    The entry is keyed by the DPIDR and a signature consisting of the ID block
+    of the base ROM table and the value of the MCU's device ID register; these
+    are read back from the target and compared before the entry is used, as
+    are the IDRs of all the cached APs.  Only topology information is cached;
+    per-device data such as UIDs is never written to disk.
+    '''
+    def __init__(self, entry):
+        self.entry        = entry
+        self.target_class = psdb.targets.find_target_class(entry['target'])
+
+    @staticmethod
+    def load(db):
+        '''
+        Returns the cached Topology matching the target we are connected to,
+        or None if there isn't one.
+        '''
+        for entry in _load_entries(db.dpidr):
+            try:
+                t = Topology(entry)
+                if t.target_class is not None and t._validate(db):
+                    return t
+            except (KeyError, TypeError, ValueError, psdb.ProbeException):
+                continue
+        return None
+
+    def _validate(self, db):
+        for ap_num, idr, _ in self.entry['aps']:
+            db.open_ap(ap_num)
+            if db.read_ap_reg(ap_num, 0xFC) != idr:
+                return False
+
+        ap_num, addr, data = self.entry['rom']
+        data = bytes.fromhex(data)
+        if db.read_bulk(addr + 0xFD0, len(data), ap_num) != data:
+            return False
+
+        if self.entry['mcu_idcode'] is not None:
+            ap_num, addr, v = self.entry['mcu_idcode']
+            if db.read_32(addr, ap_num) != v:
+                return False
+
+        return True
+
+    def restore(self, db):
+        '''
+        Instantiates the cached APs without rescanning and preloads the
+        immutable-region cache with the cached ID blocks and ROM tables so
+        that component probing doesn't need to read them from the target.
+        '''
+        db.aps = {}
+        for ap_num, idr, flags in self.entry['aps']:
+            db.aps[ap_num] = psdb.access_port.make_ap(db, ap_num, idr,
+                                                      flags=flags)
+
+        for ap_num, base, size, lines in self.entry['regions']:
+            db.immutable.preload(ap_num, base, size,
+                                 [(addr, bytes.fromhex(data))
+                                  for addr, data in lines])
+
+    @staticmethod
+    def save(db):
+        '''
+        Records the topology of the target we just probed.  Errors writing
+        the cache are ignored; it is only an optimization.
+        '''
+        target = db.target
+        rom    = None
+        for ap in db.aps.values():
+            if getattr(ap, 'base_component', None) is not None:
+                c   = ap.base_component
+                rom = [ap.ap_num, c.addr,
+                       ap.read_bulk(c.addr + 0xFD0, 0x30).hex()]
+                break
+        if rom is None:
+            return
+
+        mcu_idcode = None
+        if target.MCU_IDCODE_LOC is not None:
+            ap_num, addr = target.MCU_IDCODE_LOC
+            mcu_idcode   = [ap_num, addr, db.aps[ap_num].read_32(addr)]
+
+        regions = []
+        for ap_num, base, size in _regions(db):
+            lines = db.immutable.export(ap_num, base, size)
+            regions.append([ap_num, base, size,
+                            [[addr, data.hex()] for addr, data in lines]])
+
+        aps   = [[ap.ap_num, ap.idr, getattr(ap, 'flags', None)]
+                 for ap in db.aps.values()]
+        entry = {'target'     : type(target).__name__,
+                 'rom'        : rom,
+                 'mcu_idcode' : mcu_idcode,
+                 'aps'        : aps,
+                 'regions'    : regions,
+                 }
+
+        entries = [e for e in _load_entries(db.dpidr)
+                   if (e.get('rom'), e.get('mcu_idcode')) !=
+                   (rom, mcu_idcode)]
+        entries = [entry] + entries[:MAX_ENTRIES - 1]
+
+        try:
+            path = _cache_path(db.dpidr)
+            tmp  = path + '.%u.tmp' % os.getpid()
+            with open(tmp, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
@@ -2,21 +2,71 @@
 from . import probe
 import psdb
 
+import usb.core
+import usb.util
+
+
+def usb_path(usb_dev):
+    '''
+    Returns the bus:port.port... path string identifying the physical USB
+    port the device is plugged into.
+    '''
+    return '%s:%s' % (usb_dev.bus,
+                      '.'.join('%u' % n for n in usb_dev.port_numbers))
+
+
+def find(usb_path_filter=None, **kwargs):
+    '''
+    Returns a list of all USB devices matching the usb.core.find() keyword
+    arguments and, if usb_path_filter is specified, plugged into that port.
+    Only the cached USB descriptors are examined; the devices aren't opened.
+    '''
+    devices = usb.core.find(find_all=True, **kwargs)
+    return [d for d in devices
+            if usb_path_filter is None or usb_path(d) == usb_path_filter]
+
+
+def serial_number(usb_dev):
+    '''
+    Reads the serial number string descriptor of the device.  This requires a
+    control transfer but doesn't claim any interface.
+    '''
+    try:
+        return usb_dev.serial_number
+    except ValueError as e:
+        if str(e) == 'The device has no langid':
+            raise psdb.ProbeException('Device has no langid; ensure '
+                                      'running as root!')
+        raise
+
+
+class ProbeDescriptor(probe.ProbeDescriptor):
+    '''
+    Descriptor for an unopened USB probe, built from the USB device descriptor
+    alone.  The serial number is only read from the device if it is asked for.
+    '''
+    def __init__(self, usb_dev, name, cls):
+        super().__init__(name, usb_path(usb_dev), None,
+                         lambda: cls(usb_dev))
+        self.usb_dev = usb_dev
+
+    @property
+    def serial_num(self):
+        if self._serial_num is None:
+            self._serial_num = serial_number(self.usb_dev)
+        return self._serial_num
+
+    def close(self):
+        super().close()
+        usb.util.dispose_resources(self.usb_dev)
+
 
 class Probe(probe.Probe):
     def __init__(self, usb_dev, name, usb_reset=False):
         super().__init__(name)
-        self.usb_dev = usb_dev
-        try:
-            self.serial_num = usb_dev.serial_number
-        except ValueError as e:
-            if str(e) == 'The device has no langid':
-                raise psdb.ProbeException('Device has no langid; ensure '
-                                          'running as root!')
-
-        self.usb_path = '%s:%s' % (
-                self.usb_dev.bus,
-                '.'.join('%u' % n for n in self.usb_dev.port_numbers))
+        self.usb_dev    = usb_dev
+        self.serial_num = serial_number(usb_dev)
+        self.usb_path   = usb_path(usb_dev)
         configurations = usb_dev.configurations()
         assert len(configurations) == 1
 
@@ -27,6 +77,9 @@ class Probe(probe.Probe):
                 configurations[0].bConfigurationValue):
             usb_dev.set_configuration(configurations[0].bConfigurationValue)
 
+    def close(self):
+        usb.util.dispose_resources(self.usb_dev)
+
     def __str__(self):
         return '%s Debug Probe at %s' % (self.name, self.usb_path)
 
@@ -19,6 +19,61 @@ MAX_PACKET       = 1024
 MAX_DATA_BLOCK   = 4096
 USB_PAYLOAD_SIZE = MAX_DATA_BLOCK + 60
 
+# Limits for a single batch of exec_multi() DAP requests.  A single operation
+# can generate at most 4 requests of 5 bytes each, and every read generates a
+# 4-byte result.
+MULTI_MAX_REQ_LEN = MAX_DATA_BLOCK - 32
+MULTI_MAX_READS   = MAX_DATA_BLOCK // 4 - 2
+
+# Map exec_multi() widths to CSW.Size values and lane masks.
+CSW_SIZES = {8  : 0,
+             16 : 1,
+             32 : 2,
+             }
+LANE_MASKS = {8  : 0x000000FF,
+              16 : 0x0000FFFF,
+              32 : 0xFFFFFFFF,
+              }
+
+
+def make_dap_cmd(cmd):
+    '''Adds the parity bit to an SWD request header.'''
+    par = (cmd >> 4) ^ (cmd & 0x0F)
+    par = (par >> 2) ^ (par & 0x03)
+    par = (par >> 1) ^ (par & 0x01)
+    return cmd | (par << 5)
+
+
+# Precomputed ocd_dap_request() request bytes for each DP/AP register.  Read
+# requests are complete; write requests are followed by the 32-bit value.
+DAP_REGS     = (0x00, 0x04, 0x08, 0x0C)
+DP_READ_REQ  = {r: pack('<B', make_dap_cmd(((r << 1) & 0x18) | 0x05))
+                for r in DAP_REGS}
+DP_WRITE_CMD = {r: make_dap_cmd(((r << 1) & 0x18) | 0x01) for r in DAP_REGS}
+AP_READ_REQ  = {r: pack('<B', make_dap_cmd(((r << 1) & 0x18) | 0x07))
+                for r in DAP_REGS}
+AP_WRITE_CMD = {r: make_dap_cmd(((r << 1) & 0x18) | 0x03) for r in DAP_REGS}
+
+
+def pack_drw_writes(data, addr, size):
+    '''
+    Packs a run of DRW write requests for the elements of size bytes in data,
+    to be written starting at addr with TAR auto-increment.  Each request is a
+    command byte followed by a 32-bit value with the element in its byte lanes;
+    rather than packing each request individually we fill a zeroed buffer using
+    strided slice assignment, one pass per (lane, byte) combination.
+    '''
+    data   = memoryview(data).cast('B')
+    n      = len(data) // size
+    period = 4 // size
+    reqs   = bytearray(5*n)
+    reqs[0::5] = bytes((AP_WRITE_CMD[0x0C],))*n
+    for p in range(min(period, n)):
+        lane = (addr + size*p) % 4
+        for j in range(size):
+            reqs[5*p + 1 + lane + j::5*period] = data[size*p + j::4]
+    return bytes(reqs)
+
 
 def version_string(v):
     return '%u.%u.%u.%u' % (((v & 0xFF000000) >> 24),
@@ -50,6 +105,7 @@ class XDS110(usb_probe.Probe):
         super().__init__(usb_dev, 'XDS110')
         self.fw_version, self.hw_version = self.xds_version()
         self.csw_bases = {}
+        self._invalidate_dap_state()
         if self.fw_version < MIN_FW_VERSION:
             raise XDS110VersionException(self.fw_version, MIN_FW_VERSION)
 
@@ -203,29 +259,36 @@ class XDS110(usb_probe.Probe):
         '''Switch from SWD to JTAG connection'''
         self.execute(pack('<B', 0x18), 0)
 
-    def _make_dap_cmd(self, cmd):
-        par = (cmd >> 4) ^ (cmd & 0x0F)
-        par = (par >> 2) ^ (par & 0x03)
-        par = (par >> 1) ^ (par & 0x01)
-        return cmd | (par << 5)
-
     def _make_dp_read_request(self, reg):
-        return pack('<B', self._make_dap_cmd(((reg << 1) & 0x18) | 0x05))
+        return DP_READ_REQ[reg]
 
     def _make_dp_write_request(self, v, reg):
-        return pack('<BI', self._make_dap_cmd(((reg << 1) & 0x18) | 0x01), v)
+        return pack('<BI', DP_WRITE_CMD[reg], v)
 
     def _make_ap_read_request(self, reg):
-        return pack('<B', self._make_dap_cmd(((reg << 1) & 0x18) | 0x07))
+        return AP_READ_REQ[reg]
 
     def _make_ap_write_request(self, v, reg):
-        return pack('<BI', self._make_dap_cmd(((reg << 1) & 0x18) | 0x03), v)
+        return pack('<BI', AP_WRITE_CMD[reg], v)
+
+    def ocd_dap_request_raw(self, reqs, result_count):
+        '''
+        Handle block of DAP requests, returning the raw little-endian bytes of
+        the 32-bit read results.  If the request fails we no longer know how
+        far it got, so the shadowed DAP state is discarded.
+        '''
+        cmd = pack('<B', 0x3A) + reqs + b'\x00'
+        try:
+            rsp, _ = self.execute(cmd, result_count*4)
+        except Exception:
+            self._invalidate_dap_state()
+            raise
+        return rsp
 
     def ocd_dap_request(self, reqs, result_count):
         '''Handle block of DAP requests'''
-        cmd = pack('<B', 0x3A) + reqs + b'\x00'
-        rsp, _ = self.execute(cmd, result_count*4)
-        return unpack('I'*result_count, rsp)
+        rsp = self.ocd_dap_request_raw(reqs, result_count)
+        return unpack('<%uI' % result_count, rsp)
 
     def ocd_scan_request(self, reqs, result_size):
         '''Handle block of JTAG scan requests'''
@@ -239,128 +302,213 @@ class XDS110(usb_probe.Probe):
         self.execute(cmd, 0)
 
     def _get_csw_base(self, ap_num):
-        csw_base = self.csw_bases.get(ap_num, self.read_ap_reg(ap_num, 0x00))
-        self.csw_bases[ap_num] = csw_base
-        return csw_base
+        if ap_num not in self.csw_bases:
+            self.csw_bases[ap_num] = self.read_ap_reg(ap_num, 0x00)
+        return self.csw_bases[ap_num]
 
-    def _bulk_read_8(self, addr, n, ap_num=0):
+    def _invalidate_dap_state(self):
         '''
-        Bulk read n 8-bit values.  Must not cross a page boundary.
+        Forgets the shadowed values of DP SELECT and of each AP's CSW and TAR
+        registers, forcing them to be rewritten on the next DAP request.
+        '''
+        self.dap_select = None
+        self.ap_csw     = {}
+        self.ap_tar     = {}
+
+    def _make_select_request(self, ap_num):
+        '''
+        Returns the request to select the AP, or nothing if the shadowed DP
+        SELECT register already selects it.  The shadows are updated as the
+        requests are generated; if the DAP request fails they are invalidated
+        by ocd_dap_request_raw().
+        '''
+        if self.dap_select == (ap_num << 24):
+            return b''
+        self.dap_select = (ap_num << 24)
+        return self._make_dp_write_request((ap_num << 24), 0x08)
+
+    def _make_csw_request(self, ap_num, csw):
+        if self.ap_csw.get(ap_num) == csw:
+            return b''
+        self.ap_csw[ap_num] = csw
+        return self._make_ap_write_request(csw, 0x00)
+
+    def _make_tar_request(self, ap_num, addr):
+        if self.ap_tar.get(ap_num) == addr:
+            return b''
+        self.ap_tar[ap_num] = addr
+        return self._make_ap_write_request(addr, 0x04)
+
+    def _advance_tar(self, ap_num, n):
         '''
+        Records the effect of n DRW accesses on the shadowed TAR register.  If
+        auto-increment reaches the end of the 1K page the new TAR value is
+        implementation-defined so we stop tracking it.
+        '''
+        csw = self.ap_csw[ap_num]
+        if (csw & 0x30) != 0x10:
+            return
+        tar = self.ap_tar[ap_num] + n*(1 << (csw & 0x7))
+        self.ap_tar[ap_num] = tar if (tar & 0x3FF) else None
+
+    def _make_access_requests(self, ap_num, addr, size, ainc):
+        '''
+        Returns the requests needed to set up DRW accesses of size bytes at
+        addr, emitting only the SELECT, CSW and TAR writes that change state.
+        '''
+        csw = ((self._get_csw_base(ap_num) & ~0x37) | CSW_SIZES[size*8] |
+               (0x10 if ainc else 0x00))
+        return (self._make_select_request(ap_num) +
+                self._make_csw_request(ap_num, csw) +
+                self._make_tar_request(ap_num, addr))
+
+    def _bulk_read(self, addr, n, size, ap_num):
+        '''
+        Bulk read n aligned elements of size bytes.  Must not cross a page
+        boundary.  A single element is read with a non-incrementing access of
+        its own size so that register semantics are preserved and so that a
+        polling loop doesn't need to rewrite TAR.  Multiple elements are
+        treated as memory and widened to 32-bit reads covering the same words,
+        which are returned raw from the probe and sliced down to the requested
+        bytes.
+        '''
+        assert addr % size == 0
         assert n > 0
+        assert (addr & 0xFFFFFC00) == ((addr + n*size - 1) & 0xFFFFFC00)
+
+        self._get_csw_base(ap_num)
+        if n == 1:
+            start = addr
+            words = 1
+            reqs  = self._make_access_requests(ap_num, addr, size, False)
+        else:
+            start = addr & ~3
+            words = (addr + n*size - start + 3) // 4
+            reqs  = self._make_access_requests(ap_num, start, 4, True)
+        reqs += AP_READ_REQ[0x0C]*words
+        reqs += DP_READ_REQ[0x0C]
+        self._advance_tar(ap_num, words)
+
+        rsp = self.ocd_dap_request_raw(reqs, 1 + words)
+        pos = 4 + (addr - (start & ~3))
+        return rsp[pos:pos + n*size]
+
+    def _bulk_write(self, data, addr, size, ap_num):
+        '''
+        Bulk write elements of size bytes.  Must not cross a page boundary.
+        A single element is written with a non-incrementing access of its own
+        size.  Multi-element writes are split into a head and tail written with
+        accesses of the element size and a word-aligned body written with
+        32-bit accesses, all in a single DAP request.  A trailing RDBUFF read
+        ensures the final posted write has completed before we return.
+        '''
+        data = memoryview(data).cast('B')
+        n    = len(data)
+        assert n and n % size == 0
+        assert addr % size == 0
         assert (addr & 0xFFFFFC00) == ((addr + n - 1) & 0xFFFFFC00)
 
-        csw_base = self._get_csw_base(ap_num)
-        reqs  = self._make_dp_write_request((ap_num << 24), 0x08)
-        reqs += self._make_ap_write_request((csw_base & ~0x37) | 0x10, 0x00)
-        reqs += self._make_ap_write_request(addr, 0x04)
-        reqs += self._make_ap_read_request(0x0C)*n
-        reqs += self._make_dp_read_request(0x0C)
-        results = self.ocd_dap_request(reqs, 1 + n)
-        mem = bytes(b'')
-        for v in results[1:]:
-            mem += b'%c' % ((v >> 8*(addr % 4)) & 0xFF)
-            addr += 1
-        return mem
+        if n == size:
+            segments = [(addr, data, size)]
+        else:
+            head     = min((-addr) & 3, n)
+            body     = (n - head) & ~3
+            segments = [(addr, data[:head], size),
+                        (addr + head, data[head:head + body], 4),
+                        (addr + head + body, data[head + body:], size)]
+
+        self._get_csw_base(ap_num)
+        reqs = bytes(b'')
+        for a, d, sz in segments:
+            if not len(d):
+                continue
+            reqs += self._make_access_requests(ap_num, a, sz, n != size)
+            reqs += pack_drw_writes(d, a, sz)
+            self._advance_tar(ap_num, len(d) // sz)
+        reqs += DP_READ_REQ[0x0C]
+        self.ocd_dap_request_raw(reqs, 1)
+
+    def _bulk_read_8(self, addr, n, ap_num=0):
+        '''
+        Bulk read n 8-bit values.  Must not cross a page boundary.
+        '''
+        return self._bulk_read(addr, n, 1, ap_num)
 
     def _bulk_read_16(self, addr, n, ap_num=0):
         '''
         Bulk read n aligned 16-bit values.  Must not cross a page boundary.
         '''
-        assert addr % 2 == 0
-        assert n > 0
-        assert (addr & 0xFFFFFC00) == ((addr + n*2 - 1) & 0xFFFFFC00)
-
-        csw_base = self._get_csw_base(ap_num)
-        reqs  = self._make_dp_write_request((ap_num << 24), 0x08)
-        reqs += self._make_ap_write_request((csw_base & ~0x37) | 0x11, 0x00)
-        reqs += self._make_ap_write_request(addr, 0x04)
-        reqs += self._make_ap_read_request(0x0C)*n
-        reqs += self._make_dp_read_request(0x0C)
-        results = self.ocd_dap_request(reqs, 1 + n)
-        mem = bytes(b'')
-        for v in results[1:]:
-            mem += b'%c%c' % (((v >> (8*(addr % 4) + 0)) & 0xFF),
-                              ((v >> (8*(addr % 4) + 8)) & 0xFF))
-            addr += 2
-        return mem
+        return self._bulk_read(addr, n, 2, ap_num)
 
     def _bulk_read_32(self, addr, n, ap_num=0):
         '''
         Bulk read n aligned 32-bit values.  Must not cross a page boundary.
         '''
-        assert addr % 4 == 0
-        assert n > 0
-        assert (addr & 0xFFFFFC00) == ((addr + n*4 - 1) & 0xFFFFFC00)
-
-        csw_base = self._get_csw_base(ap_num)
-        reqs  = self._make_dp_write_request((ap_num << 24), 0x08)
-        reqs += self._make_ap_write_request((csw_base & ~0x37) | 0x12, 0x00)
-        reqs += self._make_ap_write_request(addr, 0x04)
-        reqs += self._make_ap_read_request(0x0C)*n
-        reqs += self._make_dp_read_request(0x0C)
-        results = self.ocd_dap_request(reqs, 1 + n)
-        r = bytes(b'')
-        for v in results[1:]:
-            r += b'%c%c%c%c' % (((v >>  0) & 0xFF),
-                                ((v >>  8) & 0xFF),
-                                ((v >> 16) & 0xFF),
-                                ((v >> 24) & 0xFF))
-        return r
+        return self._bulk_read(addr, n, 4, ap_num)
 
     def _bulk_write_8(self, data, addr, ap_num=0):
-        assert data
-        assert (addr & 0xFFFFFC00) == ((addr + len(data) - 1) & 0xFFFFFC00)
-
-        csw_base = self._get_csw_base(ap_num)
-        reqs  = self._make_dp_write_request((ap_num << 24), 0x08)
-        reqs += self._make_ap_write_request((csw_base & ~0x37) | 0x10, 0x00)
-        reqs += self._make_ap_write_request(addr, 0x04)
-        for v in data:
-            reqs += self._make_ap_write_request((v << 8*(addr % 4)), 0x0C)
-            addr += 1
-        reqs += self._make_dp_write_request((ap_num << 24), 0x08)
-        self.ocd_dap_request(reqs, 0)
+        self._bulk_write(data, addr, 1, ap_num)
 
     def _bulk_write_16(self, data, addr, ap_num=0):
-        assert addr % 2 == 0
-        assert len(data) % 2 == 0
-        assert data
-        assert (addr & 0xFFFFFC00) == ((addr + len(data) - 1) & 0xFFFFFC00)
-
-        csw_base = self._get_csw_base(ap_num)
-        reqs  = self._make_dp_write_request((ap_num << 24), 0x08)
-        reqs += self._make_ap_write_request((csw_base & ~0x37) | 0x11, 0x00)
-        reqs += self._make_ap_write_request(addr, 0x04)
-        for i in range(len(data)//2):
-            v     = unpack_from('<H', data, offset=i*2)[0]
-            reqs += self._make_ap_write_request((v << 8*(addr % 4)), 0x0C)
-            addr += 2
-        reqs += self._make_dp_write_request((ap_num << 24), 0x08)
-        self.ocd_dap_request(reqs, 0)
+        self._bulk_write(data, addr, 2, ap_num)
 
     def _bulk_write_32(self, data, addr, ap_num=0):
-        assert addr % 4 == 0
-        assert len(data) % 4 == 0
-        assert data
-        assert (addr & 0xFFFFFC00) == ((addr + len(data) - 1) & 0xFFFFFC00)
-
-        csw_base = self._get_csw_base(ap_num)
-        reqs  = self._make_dp_write_request((ap_num << 24), 0x08)
-        reqs += self._make_ap_write_request((csw_base & ~0x37) | 0x12, 0x00)
-        reqs += self._make_ap_write_request(addr, 0x04)
-        for i in range(len(data)//4):
-            v     = unpack_from('<I', data, offset=i*4)[0]
-            reqs += self._make_ap_write_request(v, 0x0C)
-        reqs += self._make_dp_write_request((ap_num << 24), 0x08)
-        self.ocd_dap_request(reqs, 0)
+        self._bulk_write(data, addr, 4, ap_num)
+
+    def exec_multi(self, ops):
+        '''
+        Executes a list of discontiguous memory operations by packing them into
+        a single ocd_dap_request() (or as few as possible if the list is too
+        long to fit in one USB payload).  See Probe.exec_multi() for the format
+        of the ops list.
+
+        DP SELECT, CSW and TAR writes are only emitted when they change the
+        shadowed DAP state.  AP reads are posted, so the result of each read
+        arrives with the following read and a trailing RDBUFF read collects
+        the final one.
+        '''
+        # Fetch any unknown CSW base values up front since doing so issues a
+        # CMAPI request that invalidates the shadowed state.
+        for ap_num in set(op[0] for op in ops):
+            self._get_csw_base(ap_num)
+
+        results = []
+        pos     = 0
+        while pos < len(ops):
+            reqs  = bytes(b'')
+            reads = []
+            while (pos < len(ops) and len(reqs) < MULTI_MAX_REQ_LEN and
+                   len(reads) < MULTI_MAX_READS):
+                op     = ops[pos]
+                ap_num = op[0]
+                addr   = op[1]
+                width  = op[2]
+                reqs  += self._make_access_requests(ap_num, addr, width // 8,
+                                                    True)
+                if len(op) == 3:
+                    reqs += self._make_ap_read_request(0x0C)
+                    reads.append((addr, width))
+                else:
+                    v     = ((op[3] & LANE_MASKS[width]) << 8*(addr % 4))
+                    reqs += self._make_ap_write_request(v, 0x0C)
+                self._advance_tar(ap_num, 1)
+                pos += 1
+
+            reqs  += self._make_dp_read_request(0x0C)
+            values = self.ocd_dap_request(reqs, 1 + len(reads))
+            for (addr, width), v in zip(reads, values[1:]):
+                results.append((v >> 8*(addr % 4)) & LANE_MASKS[width])
+
+        return results
 
     def assert_srst(self):
         '''Holds the target in reset.'''
+        self._invalidate_dap_state()
         self.xds_set_srst(0)
 
     def deassert_srst(self):
         '''Releases the target from reset.'''
+        self._invalidate_dap_state()
         self.xds_set_srst(1)
 
     def set_tck_freq(self, freq):
@@ -376,21 +524,35 @@ class XDS110(usb_probe.Probe):
 
     def read_dp_reg(self, addr):
         '''Read a 32-bit register from the DP address space. '''
+        self.dap_select = None
         return self.cmapi_read_dap_reg(1, 0, addr)
 
     def write_dp_reg(self, addr, value):
         '''Write a 32-bit register in the DP address space. '''
+        self.dap_select = None
         self.cmapi_write_dap_reg(1, 0, addr, value)
 
     def read_ap_reg(self, apsel, addr):
-        '''Read a 32-bit register from the AP address space.'''
+        '''
+        Read a 32-bit register from the AP address space.  CMAPI accesses
+        go behind the back of our shadowed DAP state; a DRW or BD read may
+        also move TAR.
+        '''
+        self.dap_select = None
+        self.ap_csw.pop(apsel, None)
+        self.ap_tar.pop(apsel, None)
         return self.cmapi_read_dap_reg(0, apsel, addr)
 
     def write_ap_reg(self, apsel, addr, value):
         '''Write a 32-bit register in the AP address space.'''
+        self.dap_select = None
+        self.ap_csw.pop(apsel, None)
+        self.ap_tar.pop(apsel, None)
         self.cmapi_write_dap_reg(0, apsel, addr, value)
 
     def connect(self):
+        self._invalidate_dap_state()
+
         # Switch to Serial-Wire debug and connect.  The cmapi_connect() call
         # fails if somebody left DPBANKSEL != 0, so nuke it if we get an error
         # and retry.
@@ -408,14 +570,6 @@ class XDS110(usb_probe.Probe):
         print(' Firmware Ver: %s' % version_string(self.fw_version))
 
 
-def enumerate():
-    devices = usb.core.find(find_all=True, idVendor=0x0451, idProduct=0xBEF3)
-    good_devices = []
-    for d in devices:
-        try:
-            good_devices.append(XDS110(d))
-        except XDS110VersionException as e:
-            print('%s:%s: %s'
-                  % (d.bus, '.'.join('%u' % n for n in d.port_numbers), e))
-
-    return good_devices
+def enumerate(usb_path=None):
+    devices = usb_probe.find(usb_path, idVendor=0x0451, idProduct=0xBEF3)
+    return [usb_probe.ProbeDescriptor(d, 'XDS110', XDS110) for d in devices]
@@ -6,7 +6,8 @@ import sys
 
 
 def main():
-    for p in psdb.probes.get_probes():
+    for d in psdb.probes.get_probes():
+        p = d.open()
         p.show_info()
         p.probe(verbose=True).resume()
 
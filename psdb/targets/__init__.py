@@ -25,8 +25,23 @@ def pre_probe(db, verbose):
         t.pre_probe(db, verbose)
 
 
-def probe(db):
+def find_target_class(name):
     for t in TARGETS:
+        if t.__name__ == name:
+            return t
+    return None
+
+
+def probe(db, first=None):
+    '''
+    Returns an instance of the first target class that matches.  If first is
+    specified, for instance by the topology cache, it is tried before the
+    others.
+    '''
+    targets = TARGETS
+    if first is not None:
+        targets = [first] + [t for t in TARGETS if t is not first]
+    for t in targets:
         device = t.probe(db)
         if device:
             return device
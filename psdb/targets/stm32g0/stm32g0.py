@@ -11,6 +11,14 @@ DEVICES = [
 
 
 class STM32G0(Target):
+    IMMUTABLE_REGIONS = [(0, 0x1FFF7000, 0x400),    # OTP
+                         (0, 0x1FFF7500, 4),        # Package
+                         (0, 0x1FFF7590, 12),       # UID
+                         (0, 0x1FFF75E0, 4),        # Flash size
+                         (0, 0x40015800, 4),        # DBGMCU IDCODE
+                         ]
+    MCU_IDCODE_LOC    = (0, 0x40015800)
+
     def __init__(self, db):
         super(STM32G0, self).__init__(db, 24000000)
         self.ahb_ap     = self.db.aps[0]
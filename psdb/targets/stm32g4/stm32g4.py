@@ -129,6 +129,14 @@ DEVICES_4 = [(RAMDevice,       'CCM SRAM ID', 0x10000000, 0x00004000),
 
 
 class STM32G4(Target):
+    IMMUTABLE_REGIONS = [(0, 0x1FFF7000, 0x400),    # OTP
+                         (0, 0x1FFF7500, 4),        # Package
+                         (0, 0x1FFF7590, 12),       # UID
+                         (0, 0x1FFF75E0, 4),        # Flash size
+                         (0, 0xE0042000, 4),        # DBGMCU IDCODE
+                         ]
+    MCU_IDCODE_LOC    = (0, 0xE0042000)
+
     def __init__(self, db):
         super(STM32G4, self).__init__(db, 24000000)
         self.ahb_ap     = self.db.aps[0]
@@ -28,6 +28,12 @@ AP2DEVS = []
 
 
 class STM32H7(Target):
+    IMMUTABLE_REGIONS = [(0, 0x1FF1E800, 12),       # UID
+                         (0, 0x1FF1E880, 4),        # Flash size
+                         (2, 0xE00E1000, 4),        # DBGMCU IDC
+                         ]
+    MCU_IDCODE_LOC    = (2, 0xE00E1000)
+
     def __init__(self, db):
         super(STM32H7, self).__init__(db, 24000000)
         self.ahb_ap     = self.db.aps[0]
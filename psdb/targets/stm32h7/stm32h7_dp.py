@@ -1,7 +1,6 @@
 # Copyright (c) 2019 Phase Advanced Sensor Systems, Inc.
-import time
-
 import psdb
+import psdb.util
 from psdb.devices import MemDevice, RAMDevice, stm32, stm32h7
 from psdb.targets import Target
 from . import dbgmcu
@@ -73,6 +72,12 @@ AP3DEVS = [(stm32h7.ART,        'ART',          0x40024400),
 
 
 class STM32H7_DP(Target):
+    IMMUTABLE_REGIONS = [(0, 0x1FF1E800, 12),       # UID
+                         (0, 0x1FF1E880, 4),        # Flash size
+                         (2, 0xE00E1000, 4),        # DBGMCU IDC
+                         ]
+    MCU_IDCODE_LOC    = (2, 0xE00E1000)
+
     def __init__(self, db):
         super(STM32H7_DP, self).__init__(db, 24000000)
         self.m7_ap      = self.db.aps[0]
@@ -170,8 +175,8 @@ class STM32H7_DP(Target):
         # incrementing after each transfer.
         rcc.enable_device('DMA1')
         dma1._S0CR = 0x00000000
-        while dma1._S0CR.read() & 1:
-            pass
+        psdb.util.wait(lambda: not (dma1._S0CR.read() & 1),
+                       msg='Timed out waiting for DMA stream disable')
         dma1._LIFCR  = 0x0000003D
         dma1._S0CR   = 0x00002C00
         dma1._S0NDTR = nsamples
@@ -187,8 +192,8 @@ class STM32H7_DP(Target):
         tim17._CCER  = 0x00000001
 
         # Wait for the DMA transfer to complete.
-        while (dma1._LISR.read() & (1 << 5)) == 0:
-            time.sleep(0.01)
+        psdb.util.wait(lambda: dma1._LISR.read() & (1 << 5),
+                       msg='Timed out waiting for HSE capture DMA')
 
         # Load each of the counter captures and sum their deltas.
         caps  = [sram1.ap.read_16(sram1.dev_base + i*2)
@@ -31,6 +31,15 @@ DEVICES = [(RAMDevice,        'SRAM1',    0x20000000, 0x00030000),
 
 
 class STM32WB55(Target):
+    IMMUTABLE_REGIONS = [(0, 0x1FFF7000, 0x400),    # OTP
+                         (0, 0x1FFF7500, 4),        # Package
+                         (0, 0x1FFF7580, 8),        # UID64
+                         (0, 0x1FFF7590, 12),       # UID
+                         (0, 0x1FFF75E0, 4),        # Flash size
+                         (0, 0xE0042000, 4),        # DBGMCU IDCODE
+                         ]
+    MCU_IDCODE_LOC    = (0, 0xE0042000)
+
     def __init__(self, db):
         super(STM32WB55, self).__init__(db, 24000000)
         self.ahb_ap     = self.db.aps[0]
@@ -1,5 +1,6 @@
 # Copyright (c) 2018-2019 Phase Advanced Sensor Systems, Inc.
 import psdb
+import psdb.util
 
 import collections
 import time
@@ -12,6 +13,16 @@ class MemRegion(object):
 
 
 class Target(object):
+    # List of (ap_num, addr, size) address ranges whose contents never change
+    # while we are connected, such as UIDs, flash size words and OTP areas.
+    # Reads from these ranges are cached for the life of the connection and
+    # across reprobes.
+    IMMUTABLE_REGIONS = []
+
+    # (ap_num, addr) of the MCU's device ID register, if it has one.  This is
+    # used as part of the signature for the on-disk topology cache.
+    MCU_IDCODE_LOC = None
+
     def __init__(self, db, max_tck_freq):
         self.db           = db
         self.max_tck_freq = max_tck_freq
@@ -19,6 +30,9 @@ class Target(object):
         self.devs         = collections.OrderedDict()
         self.ram_devs     = collections.OrderedDict()
 
+        for ap_num, addr, size in self.IMMUTABLE_REGIONS:
+            self.db.immutable.declare(ap_num, addr, size)
+
     @staticmethod
     def pre_probe(db, verbose):
         pass
@@ -31,12 +45,41 @@ class Target(object):
         '''
         return self.db.set_tck_freq(self.max_tck_freq)
 
+    def enable_mem_cache(self):
+        '''
+        Enables caching of the target's RAM and flash while all CPUs are
+        halted.  This is worthwhile for tools that re-read the same memory
+        many times while the target is stopped; each uncached read costs at
+        least one round trip to the debug probe.  Peripheral space is never
+        cached.
+        '''
+        regions = collections.defaultdict(list)
+        for d in self.devs.values():
+            if isinstance(d, psdb.devices.MemDevice) and d.size:
+                regions[d.ap].append((d.dev_base, d.dev_base + d.size))
+        for ap, r in regions.items():
+            ap.enable_cache(r)
+
+    def disable_mem_cache(self):
+        for ap in self.db.aps.values():
+            if isinstance(ap, psdb.access_port.MemAP):
+                ap.disable_cache()
+
     def is_halted(self, cpus=None):
-        cpus = cpus or self.cpus
-        for c in cpus:
-            if not c.is_halted():
-                return False
-        return True
+        '''
+        Returns True if all of the specified CPUs are halted.  The DHCSR
+        registers of the CPUs that were last known to be running are all polled
+        in a single batched read.
+        '''
+        cpus    = cpus or self.cpus
+        running = [c for c in cpus
+                   if not (c.flags & psdb.cpus.cortex.FLAG_HALTED)]
+        if not running:
+            return True
+
+        dhcsrs = self.db.read_multi([c.dhcsr_read_op() for c in running])
+        halted = [c.update_halted_state(v) for c, v in zip(running, dhcsrs)]
+        return all(halted)
 
     def halt(self, cpus=None):
         cpus = cpus or self.cpus
@@ -76,8 +119,9 @@ class Target(object):
             c.wait_local_reset_complete()
             for c2 in self.cpus:
                 c2.inval_halted_state()
-                while not c2.is_halted():
-                    pass
+                psdb.util.wait(c2.is_halted,
+                               msg='Timed out waiting for CPU to halt after '
+                                   'reset')
 
         # Disable reset vector catch.
         for c in self.cpus:
@@ -90,24 +134,38 @@ class Target(object):
 
     def wait_reset_and_reprobe(self, **kwargs):
         # Wait for the initial disconnect.
-        try:
-            while True:
+        def disconnected():
+            try:
                 self.cpus[0].scs.read_cpuid()
-                time.sleep(0.1)
-        except psdb.ProbeException:
-            time.sleep(0.1)
+                return False
+            except psdb.ProbeException:
+                return True
+
+        psdb.util.wait(disconnected, timeout=10, max_delay=0.1,
+                       msg='Timed out waiting for target reset')
+        time.sleep(0.1)
 
         return self.reprobe(**kwargs)
 
-    def reprobe(self, **kwargs):
+    def reprobe(self, timeout=30, **kwargs):
+        '''
+        Reprobes the target after it has been reset, for instance by an option
+        byte load.  Immutable regions cached before the reset are reused unless
+        the caller passes keep_immutable=False.  Probing is retried until it
+        succeeds or the timeout in seconds expires.
+        '''
         assert self.is_halted()
+        kwargs.setdefault('keep_immutable', True)
 
-        # Reprobe until we succeed.
-        while True:
+        def try_probe():
             try:
-                t = self.db.probe(**kwargs)
-                assert type(t) == type(self)
-                assert t.is_halted()
-                return t
+                return self.db.probe(**kwargs)
             except psdb.ProbeException:
-                time.sleep(0.1)
+                return None
+
+        t = psdb.util.wait(try_probe, timeout=timeout, expected=0.1,
+                           max_delay=0.1,
+                           msg='Timed out reprobing target after reset')
+        assert type(t) == type(self)
+        assert t.is_halted()
+        return t
@@ -1,14 +1,34 @@
 # Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
 from .prange import piter, prange
 from .hexify import hexify
+from .wait import wait, TimeoutException
+from . import lz4
+
+import os
 
 
 def round_up_pow_2(v, p2):
     return ((v + p2 - 1) & ~(p2 - 1))
 
 
-__all__ = ['hexify',
+def cache_dir():
+    '''
+    Returns the directory where psdb keeps its per-user cache files, following
+    the XDG base directory specification.  The directory is created if it
+    doesn't already exist.
+    '''
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    path = os.path.join(base, 'psdb')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+__all__ = ['cache_dir',
+           'hexify',
+           'lz4',
            'piter',
            'prange',
            'round_up_pow_2',
+           'wait',
+           'TimeoutException',
            ]
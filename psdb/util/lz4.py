@@ -0,0 +1,138 @@
+# Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+'''
+Pure-Python compressor for the LZ4 block format, used to shrink flash images
+before they are sent to the on-target decompressor in the flash loader.  The
+output is a standard LZ4 block (no frame header) and can be expanded by any
+LZ4 block decoder.
+'''
+import struct
+
+
+MIN_MATCH     = 4
+MAX_OFFSET    = 0xFFFF
+LAST_LITERALS = 5
+MF_LIMIT      = 12
+
+
+def _put_length(out, n):
+    '''Appends the 255-byte continuation encoding of an extended length.'''
+    while n >= 255:
+        out.append(255)
+        n -= 255
+    out.append(n)
+
+
+def _emit(out, literals, match_len, offset):
+    '''
+    Appends a sequence consisting of the literal bytes followed by a match of
+    match_len bytes at the specified offset; a match_len of 0 emits the final
+    literal-only sequence.
+    '''
+    lit_len = len(literals)
+    ml      = match_len - MIN_MATCH if match_len else 0
+    token   = (min(lit_len, 15) << 4) | min(ml, 15)
+    out.append(token)
+    if lit_len >= 15:
+        _put_length(out, lit_len - 15)
+    out += literals
+    if match_len:
+        out += struct.pack('<H', offset)
+        if ml >= 15:
+            _put_length(out, ml - 15)
+
+
+def _match_length(data, ref, pos, limit):
+    '''
+    Returns the number of bytes for which data[ref:] and data[pos:] match,
+    without extending pos past limit.  Runs are compared in large slices
+    first so that long runs of erased flash don't take a Python-level loop
+    iteration per byte.
+    '''
+    n    = 0
+    step = 256
+    while step:
+        while (pos + n + step <= limit and
+               data[ref + n:ref + n + step] == data[pos + n:pos + n + step]):
+            n += step
+        step //= 4
+    return n
+
+
+def compress(data):
+    '''
+    Compresses data into an LZ4 block using a greedy single-probe hash table.
+    '''
+    data   = bytes(data)
+    end    = len(data)
+    out    = bytearray()
+    table  = {}
+    anchor = 0
+    pos    = 0
+    limit  = end - MF_LIMIT
+    while pos < limit:
+        key = data[pos:pos + MIN_MATCH]
+        ref = table.get(key)
+        table[key] = pos
+        if ref is None or pos - ref > MAX_OFFSET:
+            pos += 1
+            continue
+
+        n = MIN_MATCH + _match_length(data, ref + MIN_MATCH, pos + MIN_MATCH,
+                                      end - LAST_LITERALS)
+        _emit(out, data[anchor:pos], n, pos - ref)
+        pos   += n
+        anchor = pos
+        if pos < limit:
+            table[data[pos - 2:pos + 2]] = pos - 2
+
+    _emit(out, data[anchor:], 0, 0)
+    return bytes(out)
+
+
+def decompress(data, size=None):
+    '''
+    Expands an LZ4 block.  If size is specified, the output is checked to be
+    exactly that many bytes long.
+    '''
+    out = bytearray()
+    pos = 0
+    end = len(data)
+    while pos < end:
+        token = data[pos]
+        pos  += 1
+
+        n = token >> 4
+        if n == 15:
+            while True:
+                b    = data[pos]
+                pos += 1
+                n   += b
+                if b != 255:
+                    break
+        out += data[pos:pos + n]
+        pos += n
+        if pos >= end:
+            break
+
+        offset = data[pos] | (data[pos + 1] << 8)
+        pos   += 2
+        n      = token & 0x0F
+        if n == 15:
+            while True:
+                b    = data[pos]
+                pos += 1
+                n   += b
+                if b != 255:
+                    break
+        n += MIN_MATCH
+
+        start = len(out) - offset
+        if offset >= n:
+            out += out[start:start + n]
+        else:
+            for i in range(n):
+                out.append(out[start + i])
+
+    if size is not None:
+        assert len(out) == size
+    return bytes(out)
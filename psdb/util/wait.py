@@ -0,0 +1,48 @@
+# Copyright (c) 2020 Phase Advanced Sensor Systems, Inc.
+from ..exception import ProbeException
+
+import time
+
+
+class TimeoutException(ProbeException):
+    pass
+
+
+def wait(cond, timeout=1, expected=0, max_delay=0.1, msg=None):
+    '''
+    Polls cond() until it returns a true value and returns that value.
+
+    Rather than polling the target as fast as the debug probe allows, which
+    wastes transactions on an operation that can't possibly have finished
+    yet, the polling interval adapts to the expected duration of the
+    operation: cond() is first evaluated immediately, then again after the
+    expected time in seconds (for instance, a typical sector erase or word
+    program time) has elapsed, and after that the interval starts at an
+    eighth of the expected time and doubles on every poll up to max_delay.
+
+    If cond() still hasn't returned a true value once timeout seconds have
+    elapsed, a TimeoutException is raised.  A timeout of None waits forever.
+    '''
+    v = cond()
+    if v:
+        return v
+
+    t0       = time.monotonic()
+    deadline = None if timeout is None else t0 + timeout
+    sleep    = expected
+    delay    = max(expected / 8, 0.0001)
+    while True:
+        if deadline is not None:
+            sleep = max(0, min(sleep, deadline - time.monotonic()))
+        if sleep:
+            time.sleep(sleep)
+
+        v = cond()
+        if v:
+            return v
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutException(msg or 'Timed out after %.3f seconds' %
+                                   (time.monotonic() - t0))
+
+        sleep = delay
+        delay = min(delay * 2, max_delay)